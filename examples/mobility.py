@@ -32,13 +32,6 @@
 class MobilitySwitch( OVSSwitch ):
     "Switch that can reattach and rename interfaces"
 
-    def delIntf( self, intf ):
-        "Remove (and detach) an interface"
-        port = self.ports[ intf ]
-        del self.ports[ intf ]
-        del self.intfs[ port ]
-        del self.nameToIntf[ intf.name ]
-
     def addIntf( self, intf, rename=False, **kwargs ):
         "Add (and reparent) an interface"
         OVSSwitch.addIntf( self, intf, **kwargs )
@@ -72,9 +65,7 @@ def renameIntf( self, intf, newname='' ):
         if not newname:
             newname = '%s-eth%d' % ( self.name, self.ports[ intf ] )
         intf.cmd( 'ip link set', intf, 'name', newname )
-        del self.nameToIntf[ intf.name ]
         intf.name = newname
-        self.nameToIntf[ intf.name ] = intf
         intf.ifconfig( 'up' )
 
     def moveIntf( self, intf, switch, port=None, rename=True ):
@@ -0,0 +1,360 @@
+"""
+Execution backends
+
+Everything Mininet does to the system goes through a few choke points:
+node shells (Node.startShell, Node.sendCmd/monitor), subprocesses
+(Node._popen, errRun), the root shell (rootShell) and the files of
+pseudo-filesystems such as cgroupfs (mininet.cgroup). By default these
+run real processes. An execution backend can take them over instead:
+
+    net = Mininet( topo, backend=FakeBackend )
+
+FakeBackend runs nothing. It records commands and returns canned output
+for the few commands whose output Mininet looks at (ifconfig, ip link,
+ovs-vsctl, which, and so on), keeping just enough interface state for
+the answers to be consistent. Since it needs no root, mnexec, bash or
+iproute2, it can be used to measure the Python-side cost of building
+and tearing down very large networks separately from kernel costs
+(see mininet/test/benchscale.py).
+
+The active backend is Backend.active (None for real execution); nodes
+remember the backend that was active when they were created. Mininet
+makes its backend active only while its own methods run (see
+UseBackend), so networks with different backends can coexist.
+"""
+
+import os
+import re
+from collections import defaultdict
+from itertools import count
+from StringIO import StringIO
+
+
+class Backend( object ):
+    "Base class for execution backends"
+
+    active = None   # backend that choke points should use (None: real)
+
+    def startShell( self, node ):
+        "Start a shell for node: returns a Popen-like object"
+        raise Exception( 'startShell: should be overriden in subclass', self )
+
+    def nodeCmd( self, node, cmd ):
+        "Run cmd (a string) in node's shell: returns output"
+        raise Exception( 'nodeCmd: should be overriden in subclass', self )
+
+    def popen( self, node, cmd, **params ):
+        "Spawn cmd (a list or string) for node: returns Popen-like object"
+        raise Exception( 'popen: should be overriden in subclass', self )
+
+    def errRun( self, cmd ):
+        "Run cmd in the root namespace: returns out, err, exitcode"
+        raise Exception( 'errRun: should be overriden in subclass', self )
+
+    def rootCmds( self, cmds ):
+        "Run shell cmds in the root namespace: returns [ ( out, code ) ]"
+        raise Exception( 'rootCmds: should be overriden in subclass', self )
+
+    def readFile( self, path ):
+        "Return contents of a (pseudo-)file"
+        raise Exception( 'readFile: should be overriden in subclass', self )
+
+    def writeFile( self, path, data ):
+        "Write data to a (pseudo-)file"
+        raise Exception( 'writeFile: should be overriden in subclass', self )
+
+    def makeDir( self, path ):
+        "Create a directory (and its parents) if it doesn't exist"
+        raise Exception( 'makeDir: should be overriden in subclass', self )
+
+    def removeDir( self, path ):
+        "Remove an empty directory if it exists"
+        raise Exception( 'removeDir: should be overriden in subclass', self )
+
+
+class UseBackend( object ):
+    """Context manager: make backend (None: real execution) the active
+       one, and restore the previously active one on the way out"""
+
+    def __init__( self, backend ):
+        self.backend = backend
+        self.outer = None
+
+    def __enter__( self ):
+        self.outer = Backend.active
+        Backend.active = self.backend
+        return self.backend
+
+    def __exit__( self, *_args ):
+        Backend.active = self.outer
+
+
+class FakeProcess( object ):
+    "Popen stand-in for a process that has already exited"
+
+    def __init__( self, pid, output='', returncode=0 ):
+        self.pid = pid
+        self.stdout = StringIO( output )
+        self.stderr = StringIO( '' )
+        self.stdin = StringIO()
+        self.returncode = returncode
+
+    def poll( self ):
+        return self.returncode
+
+    def wait( self ):
+        return self.returncode
+
+    def communicate( self, _input=None ):
+        return self.stdout.read(), ''
+
+    def kill( self ):
+        pass
+
+    terminate = kill
+
+
+class FakeBackend( Backend ):
+    """Record commands and return canned output, keeping just enough
+       interface and bridge state for the answers to be consistent"""
+
+    builtins = ( 'alias bg bind break builtin caller cd command compgen '
+                 'complete continue declare dirs disown echo enable eval '
+                 'exec exit export false fc fg getopts hash help history '
+                 'jobs kill let local logout popd printf pushd pwd read '
+                 'readonly return set shift shopt source suspend test '
+                 'times trap true type typeset ulimit umask unalias '
+                 'unset wait' ).split()
+
+    def __init__( self, record=True, cores=8, ovsVersion='2.5.0' ):
+        """record: keep a log of every command in self.log
+           cores: number of cores to report
+           ovsVersion: Open vSwitch version to report"""
+        self.record = record
+        self.cores = cores
+        self.ovsVersion = ovsVersion
+        self.log = []                  # ( node name or None, cmd )
+        self.counts = defaultdict( int )   # first word -> count
+        self.pids = count( 1 << 22 )   # above any real pid_max default
+        self.nodes = {}                # pid -> node
+        self.names = {}                # node name -> pid
+        self.location = {}             # intf -> pid (0 for root)
+        self.peer = {}                 # intf -> veth peer
+        self.addrs = {}                # intf -> { 'ip':, 'mac':, 'up': }
+        self.bridges = set()
+        self.files = {                 # path -> contents
+            '/proc/mounts': 'cgroup2 /sys/fs/cgroup cgroup2 rw 0 0\n' }
+        self.dirs = set()
+        self.failing = []              # prefixes of commands that fail
+
+    # Backend interface
+
+    def startShell( self, node ):
+        pid = next( self.pids )
+        self.nodes[ pid ] = node
+        self.names[ node.name ] = pid
+        self.note( node, 'bash mininet:%s' % node.name )
+        return FakeProcess( pid )
+
+    def nodeCmd( self, node, cmd ):
+        self.note( node, cmd )
+        return self.output( cmd, node.pid if node.inNamespace else 0 )
+
+    def popen( self, node, cmd, **_params ):
+        if not isinstance( cmd, basestring ):
+            cmd = ' '.join( str( arg ) for arg in cmd )
+        self.note( node, cmd )
+        pid = node.pid if node and node.inNamespace else 0
+        words = cmd.split()
+        if ( len( words ) > 1 and words[ -2 ] == 'sh' and
+             os.path.isfile( words[ -1 ] ) ):
+            # Shell script (e.g. from TCBatch): record its commands
+            with open( words[ -1 ] ) as f:
+                for line in f:
+                    self.note( node, line.strip() )
+        if self.fails( cmd ):
+            return FakeProcess( next( self.pids ), 'Error: failed\n', 1 )
+        return FakeProcess( next( self.pids ), self.output( cmd, pid ) )
+
+    def errRun( self, cmd ):
+        if not isinstance( cmd, basestring ):
+            cmd = ' '.join( str( arg ) for arg in cmd )
+        self.note( None, cmd )
+        if self.fails( cmd ):
+            return '', 'Error: failed\n', 1
+        return self.output( cmd, 0 ), '', 0
+
+    def rootCmds( self, cmds ):
+        results = []
+        for cmd in cmds:
+            self.note( None, cmd )
+            if self.fails( cmd ):
+                results.append( ( 'Error: failed\n', 1 ) )
+            else:
+                results.append( ( self.output( cmd, 0 ), 0 ) )
+        return results
+
+    def readFile( self, path ):
+        self.note( None, 'cat %s' % path )
+        return self.files.get( path, '' )
+
+    def writeFile( self, path, data ):
+        self.note( None, 'echo %s > %s' % ( data, path ) )
+        self.files[ path ] = str( data )
+
+    def makeDir( self, path ):
+        self.note( None, 'mkdir -p %s' % path )
+        self.dirs.add( path )
+
+    def removeDir( self, path ):
+        self.note( None, 'rmdir %s' % path )
+        self.dirs.discard( path )
+        for name in [ name for name in self.files
+                      if name.startswith( path + '/' ) ]:
+            del self.files[ name ]
+
+    # Bookkeeping
+
+    def fails( self, cmd ):
+        "Should cmd fail? (see self.failing)"
+        return any( cmd.startswith( prefix ) for prefix in self.failing )
+
+    def note( self, node, cmd ):
+        "Count (and log if recording) cmd"
+        words = cmd.split( None, 1 )
+        self.counts[ words[ 0 ] if words else '' ] += 1
+        if self.record:
+            self.log.append( ( node.name if node is not None else None,
+                               cmd ) )
+
+    def intfs( self, pid ):
+        "Return names of interfaces in namespace pid (0 for root)"
+        return sorted( intf for intf, where in self.location.iteritems()
+                       if where == pid )
+
+    def delete( self, intf ):
+        "Delete intf and its veth peer"
+        for name in intf, self.peer.pop( intf, None ):
+            if name:
+                self.location.pop( name, None )
+                self.addrs.pop( name, None )
+                self.peer.pop( name, None )
+
+    # Canned output
+
+    def output( self, cmd, pid ):
+        "Update state for cmd, run in namespace pid, and return its output"
+        words = cmd.split()
+        # Skip 'mnexec -p' and similar prefixes
+        while words and words[ 0 ] in ( 'mnexec', 'sudo' ):
+            words = words[ 2: ] if words[ 0 ] == 'mnexec' else words[ 1: ]
+        if not words:
+            return ''
+        prog, args = words[ 0 ], words[ 1: ]
+        if prog == 'ip':
+            return self.ip( args, pid )
+        if prog == 'ifconfig':
+            return self.ifconfig( args, pid )
+        if prog == 'ovs-vsctl':
+            return self.vsctl( cmd )
+        if prog == 'which':
+            return ''.join( '/usr/bin/%s\n' % arg for arg in args )
+        if prog == 'enable':
+            return ''.join( 'enable %s\n' % b for b in self.builtins )
+        if prog == 'grep' and args[ :2 ] == [ '-c', 'processor' ]:
+            return '%d\n' % self.cores
+        return ''
+
+    def ip( self, args, pid ):
+        "ip commands"
+        while args and args[ 0 ].startswith( '-' ):
+            if args[ 0 ] == '-batch':
+                if args[ 1 ] == '-':
+                    return ''
+                with open( args[ 1 ] ) as f:
+                    return ''.join( self.ip( line.split(), pid )
+                                    for line in f )
+            if args[ 0 ] in ( '-n', '-netns' ):
+                pid = self.names.get( args[ 1 ], 0 )
+                args = args[ 1: ]
+            args = args[ 1: ]
+        if args[ :2 ] == [ 'link', 'add' ]:
+            names, macs = [], {}
+            for arg, value in zip( args, args[ 1: ] ):
+                if arg == 'name':
+                    names.append( value )
+                elif arg == 'address' and names:
+                    macs[ names[ -1 ] ] = value
+            if len( names ) == 2:
+                for name in names:
+                    self.location[ name ] = pid
+                    self.addrs[ name ] = { 'ip': None, 'up': False,
+                                           'mac': macs.get( name ) }
+                self.peer[ names[ 0 ] ], self.peer[ names[ 1 ] ] = (
+                    names[ 1 ], names[ 0 ] )
+            return ''
+        if args[ :2 ] == [ 'link', 'del' ]:
+            name = args[ -1 ]
+            if name not in self.location:
+                return 'Cannot find device "%s"\n' % name
+            self.delete( name )
+            return ''
+        if args[ :2 ] == [ 'link', 'set' ] and 'netns' in args:
+            name, target = args[ 2 ], args[ args.index( 'netns' ) + 1 ]
+            if name not in self.location:
+                return 'Cannot find device "%s"\n' % name
+            self.location[ name ] = int( target ) if target.isdigit() else 0
+            return ''
+        if args[ :2 ] == [ 'link', 'show' ]:
+            return ''.join( '%d: %s: <BROADCAST,MULTICAST,UP> mtu 1500\n' %
+                            ( i, name ) for i, name in
+                            enumerate( [ 'lo' ] + self.intfs( pid ), 1 ) )
+        return ''
+
+    def ifconfig( self, args, _pid ):
+        "ifconfig commands"
+        if not args:
+            return ''
+        state = self.addrs.get( args[ 0 ] )
+        if state is None:
+            return ( '' if args[ 0 ] == 'lo' else
+                     '%s: error fetching interface information: '
+                     'Device not found\n' % args[ 0 ] )
+        rest = args[ 1: ]
+        if not rest:
+            return ( '%s Link encap:Ethernet  HWaddr %s\n'
+                     '          inet addr:%s  Mask:255.0.0.0\n'
+                     '          %sBROADCAST MULTICAST  MTU:1500\n' % (
+                         args[ 0 ], state[ 'mac' ] or '00:00:00:00:00:00',
+                         state[ 'ip' ] or '',
+                         'UP ' if state[ 'up' ] else '' ) )
+        if rest[ :2 ] == [ 'hw', 'ether' ]:
+            state[ 'mac' ] = rest[ 2 ]
+        elif rest[ 0 ] in ( 'up', 'down' ):
+            state[ 'up' ] = rest[ 0 ] == 'up'
+        elif re.match( r'\d+\.\d+\.\d+\.\d+', rest[ 0 ] ):
+            state[ 'ip' ] = rest[ 0 ].split( '/' )[ 0 ]
+            state[ 'up' ] = state[ 'up' ] or 'up' in rest
+        return ''
+
+    def vsctl( self, cmd ):
+        "ovs-vsctl commands, possibly several separated by --"
+        output = ''
+        for sub in re.split( r'\s--\s', ' ' + cmd + ' ' ):
+            words = [ w for w in sub.split()
+                      if w != 'ovs-vsctl' and not w.startswith( '-' ) ]
+            if not words:
+                if '--version' in sub:
+                    output += 'ovs-vsctl (Open vSwitch) %s\n' % (
+                        self.ovsVersion )
+                continue
+            if words[ 0 ] == 'add-br':
+                self.bridges.add( words[ 1 ] )
+            elif words[ 0 ] == 'del-br':
+                self.bridges.discard( words[ 1 ] )
+            elif words[ 0 ] == 'list-br':
+                output += ''.join( '%s\n' % br for br in
+                                   sorted( self.bridges ) )
+            elif words[ 0 ] == 'get':
+                output += '[]\n'
+        return output
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+"""
+Link emulation calibration
+
+TCLink shapes traffic with tc (HTB and netem), which is only accurate
+while the machine keeps up: with too many links, too much aggregate
+bandwidth or too many flows, achieved rates fall short of configured
+ones (CPU saturation) or overshoot them (HTB bursts). A Calibration
+finds where this happens on this machine. It sweeps the number of
+links, per-link bandwidth, delay and number of concurrent flows over
+pairs of hosts joined by TCLinks, and compares what iperf and ping
+measure with what was configured:
+
+usage: sudo python -m mininet.calibrate [--links 1,2,4,...] [--bw 10,...]
+           [--delay 1,10,...] [--flows 1,4] [--seconds 5] [--output FILE]
+
+The result is a machine profile (JSON), saved by default in PROFILE.
+While a profile exists, Mininet checks each topology against it before
+building (checkCapacity()), and warns if the topology configures more
+aggregate bandwidth, faster links or more shaped links than this
+machine emulated accurately.
+"""
+
+import json
+import os
+import re
+from optparse import OptionParser
+from socket import gethostname
+from time import time
+
+from mininet.log import info, output, warn, setLogLevel
+from mininet.link import TCLink, TCBatch
+from mininet.topo import Topo
+from mininet.util import numCores
+
+# Default machine profile
+PROFILE = os.path.expanduser( '~/.mininet/calibration.json' )
+
+
+def loadProfile( path=None ):
+    """Return (cached) machine profile
+       path: profile file (default: PROFILE)
+       returns: profile dict, or None if there is none"""
+    path = path or PROFILE
+    cache = loadProfile.__dict__.setdefault( 'cache', {} )
+    if path not in cache:
+        cache[ path ] = None
+        if os.path.exists( path ):
+            try:
+                with open( path ) as f:
+                    cache[ path ] = json.load( f )
+            except ( IOError, ValueError ), e:
+                warn( '*** Warning: could not read calibration %s: %s\n' %
+                      ( path, e ) )
+    return cache[ path ]
+
+def saveProfile( profile, path=None ):
+    """Save machine profile
+       path: profile file (default: PROFILE)"""
+    path = path or PROFILE
+    if os.path.dirname( path ) and not os.path.isdir(
+            os.path.dirname( path ) ):
+        os.makedirs( os.path.dirname( path ) )
+    with open( path, 'w' ) as f:
+        json.dump( profile, f, indent=1, sort_keys=True )
+    loadProfile.__dict__.setdefault( 'cache', {} )[ path ] = profile
+
+def checkCapacity( topo, profile=None ):
+    """Warn if topo configures more link emulation than a machine profile
+       says this machine delivers accurately
+       topo: Topo
+       profile: machine profile (default: loadProfile())
+       returns: list of warnings"""
+    profile = profile or loadProfile()
+    if not profile:
+        return []
+    capacity = profile[ 'capacity' ]
+    bws = [ float( params[ 'bw' ] ) for _src, _dst, params in
+            topo.iterLinks( withInfo=True ) if params.get( 'bw' ) ]
+    warnings = []
+    if bws and sum( bws ) > capacity[ 'bw' ]:
+        warnings.append( 'topology configures %g Mbps of link bandwidth; '
+                         'at most %g Mbps was emulated accurately' %
+                         ( sum( bws ), capacity[ 'bw' ] ) )
+    if bws and max( bws ) > capacity[ 'linkBw' ]:
+        warnings.append( 'topology has %g Mbps links; at most %g Mbps per '
+                         'link was emulated accurately' %
+                         ( max( bws ), capacity[ 'linkBw' ] ) )
+    if len( bws ) > capacity[ 'links' ]:
+        warnings.append( 'topology has %d rate-limited links; at most %d '
+                         'were emulated accurately' %
+                         ( len( bws ), capacity[ 'links' ] ) )
+    for warning in warnings:
+        warn( '*** Warning: %s (calibration of %s)\n' % (
+            warning, profile[ 'machine' ][ 'hostname' ] ) )
+    return warnings
+
+
+def cpuTimes():
+    "Return ( busy, total ) jiffies of all CPUs, from /proc/stat"
+    with open( '/proc/stat' ) as f:
+        fields = [ int( field ) for field in f.readline().split()[ 1:8 ] ]
+    # idle and iowait
+    return sum( fields ) - sum( fields[ 3:5 ] ), sum( fields )
+
+
+class PairsTopo( Topo ):
+    "n pairs of hosts, each pair joined by a link"
+
+    def build( self, n=1, **lopts ):
+        for i in range( 1, n + 1 ):
+            self.addLink( self.addHost( 'h%d' % ( 2 * i - 1 ) ),
+                          self.addHost( 'h%d' % ( 2 * i ) ), **lopts )
+
+
+class Calibration( object ):
+    "Sweep of TCLink emulation accuracy on this machine"
+
+    def __init__( self, links=( 1, 2, 4, 8, 16, 32, 64 ),
+                  bws=( 10, 100, 1000 ), delays=( 1, 10, 100 ),
+                  flows=( 1, 4 ), seconds=5, tolerance=.1 ):
+        """links: numbers of links (host pairs) to emulate at once
+           bws: per-link bandwidths (Mbps)
+           delays: per-link delays (ms)
+           flows: numbers of concurrent TCP flows per link
+           seconds: iperf duration
+           tolerance: largest relative error still counted accurate"""
+        self.links, self.bws, self.delays = links, bws, delays
+        self.flows, self.seconds = flows, seconds
+        self.tolerance = tolerance
+        self.points = []  # bandwidth measurements
+        self.delayPoints = []  # delay measurements
+
+    def run( self ):
+        """Run the sweep, up to the first number of links that can't
+           emulate any bandwidth accurately
+           returns: machine profile"""
+        # mininet.net checks profiles, so import it here
+        from mininet.net import Mininet
+        for count in self.links:
+            info( '*** Calibrating %d links\n' % count )
+            net = Mininet( PairsTopo( count, bw=self.bws[ 0 ] ),
+                           link=TCLink, controller=None )
+            net.start()
+            try:
+                accurate = self.sweep( net, count )
+            finally:
+                net.stop()
+            if not accurate:
+                break
+        return self.profile()
+
+    def sweep( self, net, count ):
+        """Measure delays, then bandwidths, on count links of net
+           returns: True if any bandwidth was emulated accurately"""
+        pairs = [ net.get( 'h%d' % ( 2 * i - 1 ), 'h%d' % ( 2 * i ) )
+                  for i in range( 1, count + 1 ) ]
+        for delay in self.delays:
+            self.reshape( net, bw=None, delay='%sms' % delay )
+            self.measureDelay( pairs, delay )
+        accurate = False
+        for bw in self.bws:
+            self.reshape( net, bw=bw, delay=None )
+            failed = False
+            for flows in self.flows:
+                ok = self.measureBw( net, pairs, bw, flows )[ 'ok' ]
+                accurate, failed = accurate or ok, failed or not ok
+            if failed:
+                # Higher bandwidths won't do any better
+                break
+        return accurate
+
+    @staticmethod
+    def reshape( net, **params ):
+        "Change all links of net"
+        with TCBatch():
+            for link in net.links:
+                link.reshape( **params )
+
+    def measureDelay( self, pairs, delay ):
+        """Ping across all pairs at once
+           delay: configured delay (ms)
+           returns: delay point"""
+        pings = [ src.popen( 'ping -c 10 -i .2 -q %s' % dst.IP() )
+                  for src, dst in pairs ]
+        rtts = []
+        for ping in pings:
+            # rtt min/avg/max/mdev = 2.013/2.104/2.190/0.051 ms
+            m = re.search( r'= [\d.]+/([\d.]+)/', ping.communicate()[ 0 ] )
+            if m:
+                rtts.append( float( m.group( 1 ) ) )
+        # Each direction is delayed once
+        expected = 2.0 * delay
+        ok = len( rtts ) == len( pairs ) and all(
+            abs( rtt - expected ) <= self.tolerance * expected
+            for rtt in rtts )
+        point = { 'links': len( pairs ), 'delay': delay,
+                  'lost': len( pairs ) - len( rtts ), 'ok': ok,
+                  'rtt': sum( rtts ) / len( rtts ) if rtts else None,
+                  'maxRtt': max( rtts ) if rtts else None }
+        self.delayPoints.append( point )
+        output( '%4d links %6gms delay: rtt %.2fms (max %.2fms) %s\n' % (
+            len( pairs ), delay, point[ 'rtt' ] or 0, point[ 'maxRtt' ] or 0,
+            'ok' if ok else 'INACCURATE' ) )
+        return point
+
+    def measureBw( self, net, pairs, bw, flows ):
+        """Run flows TCP flows across all pairs at once
+           bw: configured bandwidth (Mbps)
+           returns: bandwidth point"""
+        busy, total = cpuTimes()
+        result = net.trafficMatrix( pairs, seconds=self.seconds,
+                                    parallel=flows )
+        busy2, total2 = cpuTimes()
+        rates = ( [ flow[ 'mbps' ] for flow in result[ 'flows' ] ]
+                  if result else [ 0.0 ] * len( pairs ) )
+        cpu = float( busy2 - busy ) / max( total2 - total, 1 )
+        low, high = min( rates ) / bw, max( rates ) / bw
+        ok = 1 - self.tolerance <= low and high <= 1 + self.tolerance
+        point = { 'links': len( pairs ), 'bw': bw, 'flows': flows,
+                  'rate': sum( rates ) / len( rates ), 'minRate': min( rates ),
+                  'maxRate': max( rates ), 'cpu': cpu, 'ok': ok,
+                  'reason': None if ok else
+                  'cpu' if cpu >= .9 else
+                  'burst' if high > 1 + self.tolerance else 'shortfall' }
+        self.points.append( point )
+        output( '%4d links %6g Mbps %3d flows: %.1f Mbps (%.1f-%.1f) '
+                'cpu %.0f%% %s\n' % (
+                    len( pairs ), bw, flows, point[ 'rate' ], min( rates ),
+                    max( rates ), cpu * 100,
+                    'ok' if ok else 'INACCURATE (%s)' % point[ 'reason' ] ) )
+        return point
+
+    def profile( self ):
+        "Return machine profile of the measurements so far"
+        good = [ p for p in self.points if p[ 'ok' ] ]
+        breakdown = {}
+        for point in self.points:
+            if not point[ 'ok' ]:
+                breakdown.setdefault( str( point[ 'links' ] ), point )
+        return {
+            'machine': { 'hostname': gethostname(), 'cores': numCores(),
+                         'kernel': os.uname()[ 2 ] },
+            'time': time(), 'tolerance': self.tolerance,
+            'seconds': self.seconds,
+            'points': self.points, 'delays': self.delayPoints,
+            # First inaccurate point for each number of links
+            'breakdown': breakdown,
+            'capacity': {
+                'bw': max( [ p[ 'links' ] * p[ 'bw' ] for p in good ] or
+                           [ 0 ] ),
+                'linkBw': max( [ p[ 'bw' ] for p in good ] or [ 0 ] ),
+                'links': max( [ p[ 'links' ] for p in good ] or [ 0 ] ) } }
+
+
+def main():
+    "Calibrate this machine and save its profile"
+    parser = OptionParser( usage=__doc__.split( 'usage: ' )[ 1 ].split(
+        '\n\n' )[ 0 ] )
+
+    def numbers( text ):
+        "Parse comma-separated list of numbers"
+        return [ float( n ) if '.' in n else int( n )
+                 for n in text.split( ',' ) ]
+    parser.add_option( '--links', default='1,2,4,8,16,32,64' )
+    parser.add_option( '--bw', default='10,100,1000' )
+    parser.add_option( '--delay', default='1,10,100' )
+    parser.add_option( '--flows', default='1,4' )
+    parser.add_option( '--seconds', type='int', default=5 )
+    parser.add_option( '--tolerance', type='float', default=.1 )
+    parser.add_option( '--output', default=PROFILE, metavar='FILE' )
+    options, _args = parser.parse_args()
+    setLogLevel( 'output' )
+    calibration = Calibration(
+        links=numbers( options.links ), bws=numbers( options.bw ),
+        delays=numbers( options.delay ), flows=numbers( options.flows ),
+        seconds=options.seconds, tolerance=options.tolerance )
+    profile = calibration.run()
+    saveProfile( profile, options.output )
+    output( '*** Accurate up to %(bw)g Mbps total, %(linkBw)g Mbps per '
+            'link, %(links)d links\n' % profile[ 'capacity' ] )
+    output( '*** Profile saved in %s\n' % options.output )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+"""
+Control groups
+
+CPULimitedHost confines each host to a control group (cgroup). Rather
+than running the libcgroup tools (cgcreate, cgset, cgget, cgclassify,
+cgdelete), which cost a process startup per call, Mininet reads and
+writes the cgroupfs files directly. Both layouts are supported:
+
+- cgroup v1: one hierarchy per controller, e.g.
+  /sys/fs/cgroup/cpu/h1/cpu.cfs_quota_us
+- cgroup v2 (unified): a single hierarchy, e.g. /sys/fs/cgroup/h1/cpu.max
+
+cgroups() returns a Cgroups object for whichever layout is mounted.
+Its methods take lists of cgroup names where that makes sense, so that
+the cgroups of many hosts can be created or deleted in one pass:
+
+    groups = cgroups()
+    groups.create( [ 'h1', 'h2' ] )
+    groups.attach( 'h1', [ pid ] )
+    groups.setBandwidth( 'h1', period=100000, quota=50000 )
+    groups.limit( [ 'h1', 'h2' ], mem='512M', pids=100 )
+    groups.delete( [ 'h1', 'h2' ] )
+
+mnexec -g name adds a process to cgroup name in either layout.
+"""
+
+import errno
+import os
+from time import sleep
+
+from mininet.backend import Backend
+from mininet.util import mountCgroups
+
+
+class Cgroups( object ):
+    "Base class for cgroupfs layouts"
+
+    root = '/sys/fs/cgroup'
+    version = None
+    controllers = ( 'cpu', 'cpuacct', 'cpuset', 'memory', 'pids' )
+
+    def __init__( self ):
+        self.backend = Backend.active
+
+    # File access (through the backend, if any)
+
+    def read( self, path ):
+        "Return contents of a cgroupfs file"
+        if self.backend:
+            return self.backend.readFile( path )
+        with open( path ) as f:
+            return f.read()
+
+    def write( self, path, data ):
+        "Write data to a cgroupfs file"
+        if self.backend:
+            return self.backend.writeFile( path, data )
+        try:
+            with open( path, 'w' ) as f:
+                f.write( str( data ) )
+        except ( IOError, OSError ) as e:
+            raise Exception( 'cgroup: could not write %s to %s: %s' %
+                             ( data, path, e.strerror ) )
+
+    def mkdir( self, path ):
+        "Create a cgroup directory if needed"
+        if self.backend:
+            return self.backend.makeDir( path )
+        if not os.path.isdir( path ):
+            os.makedirs( path )
+
+    def rmdir( self, path ):
+        """Remove a cgroup directory if it exists
+           returns: True if it is gone"""
+        if self.backend:
+            self.backend.removeDir( path )
+            return True
+        try:
+            os.rmdir( path )
+        except OSError as e:
+            return e.errno == errno.ENOENT
+        return True
+
+    # Layout
+
+    def path( self, name, controller='cpu' ):
+        "Return directory of cgroup name for controller"
+        raise Exception( 'path: should be overriden in subclass', self )
+
+    def dirs( self, name, controllers=None ):
+        """Return directories of cgroup name
+           controllers: hierarchies (v1 only; default: all)"""
+        raise Exception( 'dirs: should be overriden in subclass', self )
+
+    def parse( self, key ):
+        "Return controller and file name for a parameter such as cpu.shares"
+        return key.split( '.', 1 )[ 0 ], key
+
+    # Operations
+
+    def create( self, names ):
+        "Create cgroups"
+        for name in names:
+            for path in self.dirs( name ):
+                self.mkdir( path )
+
+    def attach( self, name, pids, controllers=None ):
+        """Move processes into a cgroup
+           pids: process ids
+           controllers: hierarchies to move them in (v1 only;
+                        default: all)"""
+        for path in self.dirs( name, controllers ):
+            for pid in pids:
+                self.write( os.path.join( path, 'cgroup.procs' ), pid )
+
+    def set( self, name, key, value ):
+        """Set a cgroup parameter and return its value as read back
+           key: parameter file, e.g. cpu.cfs_quota_us"""
+        controller, param = self.parse( key )
+        path = os.path.join( self.path( name, controller ), param )
+        self.write( path, value )
+        return self.read( path ).strip()
+
+    def get( self, name, key ):
+        "Return value of cgroup parameter key as a string"
+        controller, param = self.parse( key )
+        return self.read( os.path.join( self.path( name, controller ),
+                                        param ) ).strip()
+
+    def setBandwidth( self, name, period, quota ):
+        """Set CFS bandwidth limit
+           period: period in us
+           quota: CPU time per period in us (-1: unlimited)
+           returns: period, quota as read back"""
+        raise Exception( 'setBandwidth: '
+                         'should be overriden in subclass', self )
+
+    def setRT( self, name, period, runtime ):
+        """Set RT bandwidth limit
+           returns: period, runtime as read back"""
+        raise Exception( 'cgroup v%s does not support RT bandwidth' %
+                         self.version )
+
+    def setCPUs( self, name, cpus, mems='0' ):
+        """Set the cores (and memory nodes) cgroup name may use
+           cpus: core list, e.g. '0-3,6'
+           mems: memory node list"""
+        cpus = self.set( name, 'cpuset.cpus', cpus )
+        self.set( name, 'cpuset.mems', mems )
+        return cpus
+
+    def usagePath( self, name ):
+        "Return path of the CPU usage counter of cgroup name"
+        raise Exception( 'usagePath: should be overriden in subclass', self )
+
+    @staticmethod
+    def parseUsage( text ):
+        "Return CPU usage in seconds from the counter file's contents"
+        raise Exception( 'parseUsage: should be overriden in subclass' )
+
+    def usage( self, name ):
+        "Return CPU time used by cgroup name, in seconds"
+        return self.parseUsage( self.read( self.usagePath( name ) ) )
+
+    def counters( self, names ):
+        "Return UsageCounters for reading cgroups' CPU usage repeatedly"
+        return UsageCounters( self, names )
+
+    def limit( self, names, mem=None, memswap=None, pids=None ):
+        """Set memory and process limits (None: leave alone,
+           -1: unlimited)
+           names: cgroup names
+           mem: memory limit in bytes (or a size such as '512M')
+           memswap: memory plus swap limit
+           pids: maximum number of processes"""
+        mem, memswap = sizeBytes( mem ), sizeBytes( memswap )
+        for name in names:
+            self.setMemory( name, mem, memswap )
+            if pids is not None:
+                self.set( name, 'pids.max', 'max' if pids < 0 else pids )
+
+    def setMemory( self, name, mem, memswap ):
+        "Set memory limits in bytes"
+        raise Exception( 'setMemory: should be overriden in subclass', self )
+
+    def memoryStats( self, name ):
+        """Return peak memory use in bytes (None if unknown) and
+           number of OOM kills of cgroup name"""
+        raise Exception( 'memoryStats: should be overriden in subclass', self )
+
+    def readStat( self, name, key, field ):
+        "Return integer field from flat-keyed file key (0 if missing)"
+        try:
+            for line in self.get( name, key ).split( '\n' ):
+                words = line.split()
+                if len( words ) == 2 and words[ 0 ] == field:
+                    return int( words[ 1 ] )
+        except ( IOError, OSError ):
+            pass
+        return 0
+
+    def readInt( self, name, key ):
+        "Return integer value of file key (None if missing)"
+        try:
+            return int( self.get( name, key ) )
+        except ( IOError, OSError, ValueError ):
+            return None
+
+    def delete( self, names, retries=10 ):
+        """Delete cgroups, moving any processes left in them to the
+           root cgroup first
+           returns: names that could not be deleted"""
+        left = list( names )
+        for _ in range( retries ):
+            busy = []
+            for name in left:
+                for path in self.dirs( name ):
+                    try:
+                        pids = self.read( os.path.join(
+                            path, 'cgroup.procs' ) ).split()
+                    except ( IOError, OSError ):
+                        # Already gone
+                        continue
+                    for pid in pids:
+                        try:
+                            self.write( os.path.join( self.parent( path ),
+                                                      'cgroup.procs' ), pid )
+                        except Exception:
+                            # Process exited
+                            pass
+                    if not self.rmdir( path ):
+                        busy.append( name )
+            left = sorted( set( busy ) )
+            if not left:
+                break
+            # Exiting processes take a moment to leave
+            sleep( .05 )
+        return left
+
+    def parent( self, path ):
+        "Return root cgroup directory of the hierarchy containing path"
+        return os.path.dirname( path )
+
+
+class CgroupsV1( Cgroups ):
+    "cgroup v1: one hierarchy per controller"
+
+    version = 1
+
+    def __init__( self, mounts ):
+        "mounts: controller -> mount point"
+        Cgroups.__init__( self )
+        self.mounts = mounts
+
+    def path( self, name, controller='cpu' ):
+        return os.path.join( self.mounts.get(
+            controller, os.path.join( self.root, controller ) ), name )
+
+    def dirs( self, name, controllers=None ):
+        paths = []
+        for controller in controllers or self.controllers:
+            if controller not in self.mounts:
+                continue
+            path = self.path( name, controller )
+            # Controllers may share a hierarchy (e.g. cpu,cpuacct)
+            if path not in paths:
+                paths.append( path )
+        return paths
+
+    def create( self, names ):
+        Cgroups.create( self, names )
+        if not names:
+            return
+        # A cpuset needs cpus and mems before it can have processes
+        cpus = self.get( '', 'cpuset.cpus' )
+        mems = self.get( '', 'cpuset.mems' )
+        for name in names:
+            self.setCPUs( name, cpus, mems )
+
+    def setBandwidth( self, name, period, quota ):
+        return ( int( self.set( name, 'cpu.cfs_period_us', period ) ),
+                 int( self.set( name, 'cpu.cfs_quota_us', quota ) ) )
+
+    def setRT( self, name, period, runtime ):
+        return ( int( self.set( name, 'cpu.rt_period_us', period ) ),
+                 int( self.set( name, 'cpu.rt_runtime_us', runtime ) ) )
+
+    def usagePath( self, name ):
+        return os.path.join( self.path( name, 'cpuacct' ), 'cpuacct.usage' )
+
+    @staticmethod
+    def parseUsage( text ):
+        return int( text ) / 1e9
+
+    def setMemory( self, name, mem, memswap ):
+        if mem is not None:
+            self.set( name, 'memory.limit_in_bytes', mem )
+        if memswap is not None:
+            self.set( name, 'memory.memsw.limit_in_bytes', memswap )
+
+    def memoryStats( self, name ):
+        return { 'peak': self.readInt( name, 'memory.max_usage_in_bytes' ),
+                 'oom': self.readStat( name, 'memory.oom_control',
+                                       'oom_kill' ) }
+
+
+class CgroupsV2( Cgroups ):
+    "cgroup v2: a single unified hierarchy"
+
+    version = 2
+
+    def __init__( self ):
+        Cgroups.__init__( self )
+        # Let our cgroups (children of the root) use these controllers
+        for controller in 'cpu', 'cpuset', 'memory', 'pids':
+            try:
+                self.write( os.path.join( self.root,
+                                          'cgroup.subtree_control' ),
+                            '+' + controller )
+            except Exception:
+                pass
+
+    def path( self, name, controller='cpu' ):
+        return os.path.join( self.root, name )
+
+    def dirs( self, name, controllers=None ):
+        return [ self.path( name ) ]
+
+    def parse( self, key ):
+        # There is only one hierarchy
+        return 'cpu', key
+
+    @staticmethod
+    def unlimited( value ):
+        "Return value to write for a limit (-1: unlimited)"
+        return 'max' if value < 0 else value
+
+    def setBandwidth( self, name, period, quota ):
+        value = self.set( name, 'cpu.max', '%s %d' % (
+            'max' if quota < 0 else quota, period ) )
+        quota, period = value.split()
+        return int( period ), -1 if quota == 'max' else int( quota )
+
+    def usagePath( self, name ):
+        return os.path.join( self.path( name ), 'cpu.stat' )
+
+    @staticmethod
+    def parseUsage( text ):
+        for line in text.split( '\n' ):
+            if line.startswith( 'usage_usec ' ):
+                return int( line.split()[ 1 ] ) / 1e6
+        return 0
+
+    def setMemory( self, name, mem, memswap ):
+        if mem is not None:
+            self.set( name, 'memory.max', self.unlimited( mem ) )
+        if memswap is not None:
+            # v2 limits swap separately
+            if mem is None or mem < 0 or memswap < 0:
+                swap = -1
+            else:
+                swap = max( memswap - mem, 0 )
+            self.set( name, 'memory.swap.max', self.unlimited( swap ) )
+
+    def memoryStats( self, name ):
+        # memory.peak needs Linux 5.19
+        return { 'peak': self.readInt( name, 'memory.peak' ),
+                 'oom': self.readStat( name, 'memory.events', 'oom_kill' ) }
+
+
+class UsageCounters( object ):
+    """CPU usage counters of many cgroups, kept open so that they can
+       all be read in one pass without reopening them"""
+
+    def __init__( self, groups, names ):
+        """groups: Cgroups
+           names: cgroup names"""
+        self.groups = groups
+        self.paths = [ groups.usagePath( name ) for name in names ]
+        self.fds = None
+        if not groups.backend:
+            self.fds = [ os.open( path, os.O_RDONLY ) for path in self.paths ]
+
+    def read( self ):
+        "Return CPU time used by each cgroup, in seconds"
+        parse = self.groups.parseUsage
+        if self.fds is None:
+            return [ parse( self.groups.read( path ) ) for path in self.paths ]
+        lseek, read, values = os.lseek, os.read, []
+        for fd in self.fds:
+            lseek( fd, 0, 0 )
+            values.append( parse( read( fd, 4096 ) ) )
+        return values
+
+    def close( self ):
+        "Close counter files"
+        for fd in self.fds or ():
+            os.close( fd )
+        self.fds = None
+
+
+def sizeBytes( size ):
+    """Return a size such as '512M' or '2g' (or a number) in bytes
+       (None and negative values are returned unchanged)"""
+    if size is None or isinstance( size, ( int, long ) ):
+        return size
+    units = { 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40 }
+    size = str( size ).strip().lower().rstrip( 'b' )
+    if size and size[ -1 ] in units:
+        return int( float( size[ :-1 ] ) * units[ size[ -1 ] ] )
+    return int( float( size ) )
+
+
+def cgroups():
+    "Return Cgroups for the mounted cgroupfs layout"
+    cached = getattr( cgroups, 'cached', None )
+    if cached and cached.backend is Backend.active:
+        return cached
+    reader = Cgroups()
+    mounts = {}
+    for line in reader.read( '/proc/mounts' ).split( '\n' ):
+        fields = line.split()
+        if len( fields ) < 4:
+            continue
+        if fields[ 2 ] == 'cgroup2' and fields[ 1 ] == Cgroups.root:
+            cgroups.cached = CgroupsV2()
+            return cgroups.cached
+        if fields[ 2 ] == 'cgroup':
+            for option in fields[ 3 ].split( ',' ):
+                if option in Cgroups.controllers:
+                    mounts[ option ] = fields[ 1 ]
+    if 'cpu' not in mounts:
+        raise Exception( 'cgroups not mounted on ' + Cgroups.root )
+    if 'cpuset' not in mounts:
+        mountCgroups()
+        mounts[ 'cpuset' ] = os.path.join( Cgroups.root, 'cpuset' )
+    cgroups.cached = CgroupsV1( mounts )
+    return cgroups.cached
@@ -8,88 +8,238 @@
 code), this script may be used to get rid of unwanted garbage.
 It may also get rid of 'false positives', but hopefully
 nothing irreplaceable!
+
+Each kind of resource (processes, datapaths, bridges, links,
+namespaces, cgroups) is listed once and removed in a single batch,
+so cleaning up after a large crashed run doesn't take much longer
+than cleaning up after a small one.
 """
 
-from subprocess import Popen, PIPE, check_output as co
+from subprocess import Popen, PIPE
+import errno
+import os
+from glob import glob
+import re
+import signal
 import time
+from time import sleep
 
 from mininet.log import info
-from mininet.term import cleanUpScreens
+from mininet.cgroup import cgroups
+from mininet.util import ( quietRun, rootCmd, rootCmds, rootIntfNames,
+                           ipBatch, namedNetns, detachNetns )
+
+# Processes we send SIGTERM first, matched by command name
+ZOMBIES = ( 'controller ofprotocol ofdatapath ping nox_core lt-nox_core '
+            'ovs-openflowd ovs-controller udpbwtest mnexec ivs' ).split()
+
+# Processes we kill outright, matched against their full command line:
+# node shells, mnexec'd X11 tunnels, sudo mnexec and ssh tunnels
+STALE = ( 'mininet:', 'mnexec.*socat', 'sudo mnexec',
+          'Tunnel=Ethernet', r'\.ssh/mn' )
 
 def sh( cmd ):
     "Print a command and send it to the shell"
     info( cmd + '\n' )
     return Popen( [ '/bin/sh', '-c', cmd ], stdout=PIPE ).communicate()[ 0 ]
 
+def processes():
+    """Return running processes other than ourselves and our parent
+       (e.g. sudo), skipping zombies that are already dead.
+       returns: list of ( pid, command name, command line )"""
+    skip = ( os.getpid(), os.getppid() )
+    procs = []
+    # Command names may contain spaces, so we read them from /proc
+    # rather than asking ps for them alongside args
+    for line in quietRun( 'ps -eo pid=,stat=,args=' ).splitlines():
+        fields = line.split( None, 2 )
+        if len( fields ) < 3:
+            continue
+        pid, stat, args = fields
+        pid = int( pid )
+        if pid in skip or stat.startswith( 'Z' ):
+            continue
+        try:
+            with open( '/proc/%d/comm' % pid ) as f:
+                comm = f.read().rstrip( '\n' )
+        except IOError:
+            continue  # already gone
+        procs.append( ( pid, comm, args ) )
+    return procs
+
+def running( pid ):
+    "Is process pid still running (i.e. alive and not a zombie)?"
+    try:
+        with open( '/proc/%d/stat' % pid ) as f:
+            stat = f.read()
+    except IOError:
+        return False
+    # The state follows the parenthesized command name
+    return stat[ stat.rfind( ')' ) + 2 ] != 'Z'
+
+def signalAll( pids, sig ):
+    "Send signal sig to each process in pids, ignoring ones that are gone"
+    for pid in pids:
+        try:
+            os.kill( pid, sig )
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+def waitExit( pids, timeout=1.0 ):
+    """Wait for processes to exit, polling with exponential backoff.
+       pids: processes to wait for (which needn't be our children)
+       timeout: maximum time to wait in seconds
+       returns: list of pids still running"""
+    deadline = time.time() + timeout
+    delay = .001
+    pids = [ pid for pid in pids if running( pid ) ]
+    while pids and time.time() < deadline:
+        sleep( delay )
+        delay = min( delay * 2, .1 )
+        pids = [ pid for pid in pids if running( pid ) ]
+    return pids
+
+def killPids( gentle, hard, timeout=1.0 ):
+    """Send SIGTERM to gentle and SIGKILL to hard, then SIGKILL
+       any gentle processes that haven't exited after timeout
+       returns: list of pids that could not be killed"""
+    signalAll( gentle, signal.SIGTERM )
+    signalAll( hard, signal.SIGKILL )
+    remaining = waitExit( gentle, timeout )
+    signalAll( remaining, signal.SIGKILL )
+    return waitExit( remaining + list( hard ), timeout )
+
 def killprocs( pattern ):
     "Reliably terminate processes matching a pattern (including args)"
-    sh( 'pkill -9 -f %s' % pattern )
-    # Make sure they are gone
-    while True:
-        try:
-            pids = co( 'pgrep -f %s' % pattern )
-        except:
-            pids = ''
-        if pids:
-            sh( 'pkill -f 9 mininet:' )
-            sleep( .5 )
+    pids = [ pid for pid, _comm, args in processes()
+             if re.search( pattern, args ) ]
+    return killPids( [], pids )
+
+def killStale( procs ):
+    """Kill leftover Mininet processes.
+       procs: process list from processes()
+       returns: list of ( pid, command name ) that were killed"""
+    stale = re.compile( '|'.join( STALE ) )
+    gentle, hard, killed = [], [], []
+    for pid, comm, args in procs:
+        if comm in ZOMBIES:
+            gentle.append( pid )
+        elif stale.search( args ):
+            hard.append( pid )
         else:
-            break
+            continue
+        killed.append( ( pid, comm ) )
+    remaining = killPids( gentle, hard )
+    if remaining:
+        info( 'could not kill: %s\n' % ' '.join( map( str, remaining ) ) )
+    return [ ( pid, comm ) for pid, comm in killed if pid not in remaining ]
+
+def nodeNames( procs, links ):
+    """Guess names of stale nodes from node shell command lines
+       and interface names.
+       procs: process list from processes()
+       links: interface names like h1-eth0"""
+    names = set()
+    for _pid, _comm, args in procs:
+        names.update( re.findall( r'mininet:(\S+)', args ) )
+    names.update( link.rsplit( '-eth', 1 )[ 0 ] for link in links )
+    return names
+
+def removeFiles( *patterns ):
+    "Remove files matching shell patterns"
+    removed = []
+    for pattern in patterns:
+        for path in glob( os.path.expanduser( pattern ) ):
+            try:
+                os.remove( path )
+                removed.append( path )
+            except OSError:
+                pass
+    return removed
+
+def removeDatapaths( procs ):
+    "Remove kernel datapaths of (now killed) reference switches"
+    dps = sorted( set( 'nl:' + dp for _pid, _comm, args in procs
+                       for dp in re.findall( r'dp([0-9]+)', args ) ) )
+    rootCmds( [ 'dpctl deldp ' + dp for dp in dps ] )
+    return dps
+
+def removeBridges():
+    "Remove all OVS bridges in a single ovs-vsctl transaction"
+    bridges = rootCmd( 'ovs-vsctl --timeout=1 list-br' ).split()
+    if bridges:
+        rootCmd( 'ovs-vsctl ' + ' -- '.join( '--if-exists del-br ' + br
+                                            for br in bridges ) )
+        # And in case the above didn't work...
+        for br in rootCmd( 'ovs-vsctl --timeout=1 list-br' ).split():
+            rootCmd( 'ovs-vsctl del-br ' + br )
+    return bridges
+
+def removeLinks( links ):
+    """Remove links of the pattern foo-ethX with a single ip batch;
+       deleting one end of a veth pair also removes the other,
+       which -force tells ip to ignore"""
+    ipBatch( [ 'link del dev ' + link for link in links ] )
+    return links
+
+def removeCgroups( names ):
+    "Remove cgroups of stale nodes"
+    try:
+        groups = cgroups()
+    except Exception:
+        # cgroups not mounted
+        return []
+    stale = [ name for name in sorted( names ) if
+              os.path.isdir( groups.path( name ) ) ]
+    groups.delete( stale )
+    return stale
+
+def removeNetns():
+    "Remove named network namespaces"
+    names = namedNetns()
+    detachNetns( names )
+    return names
 
 def cleanup():
     """Clean up junk which might be left over from old runs;
-       do fast stuff before slow dp and link removal!"""
-
-    info("*** Removing excess controllers/ofprotocols/ofdatapaths/pings/noxes"
-         "\n")
-    zombies = 'controller ofprotocol ofdatapath ping nox_core lt-nox_core '
-    zombies += 'ovs-openflowd ovs-controller udpbwtest mnexec ivs'
-    # Note: real zombie processes can't actually be killed, since they
-    # are already (un)dead. Then again,
-    # you can't connect to them either, so they're mostly harmless.
-    # Send SIGTERM first to give processes a chance to shutdown cleanly.
-    sh( 'killall ' + zombies + ' 2> /dev/null' )
-    time.sleep(1)
-    sh( 'killall -9 ' + zombies + ' 2> /dev/null' )
-
-    # And kill off sudo mnexec
-    sh( 'pkill -9 -f "sudo mnexec"')
-
-    info( "*** Removing junk from /tmp\n" )
-    sh( 'rm -f /tmp/vconn* /tmp/vlogs* /tmp/*.out /tmp/*.log' )
-
-    info( "*** Removing old X11 tunnels\n" )
-    cleanUpScreens()
-
-    info( "*** Removing excess kernel datapaths\n" )
-    dps = sh( "ps ax | egrep -o 'dp[0-9]+' | sed 's/dp/nl:/'" ).splitlines()
-    for dp in dps:
-        if dp:
-            sh( 'dpctl deldp ' + dp )
-
-    info( "***  Removing OVS datapaths" )
-    dps = sh("ovs-vsctl --timeout=1 list-br").strip().splitlines()
-    if dps:
-        sh( "ovs-vsctl " + " -- ".join( "--if-exists del-br " + dp
-                                       for dp in dps if dp ) )
-    # And in case the above didn't work...
-    dps = sh("ovs-vsctl --timeout=1 list-br").strip().splitlines()
-    for dp in dps:
-        sh( 'ovs-vsctl del-br ' + dp )
-
-    info( "*** Removing all links of the pattern foo-ethX\n" )
-    links = sh( "ip link show | "
-                "egrep -o '([-_.[:alnum:]]+-eth[[:digit:]]+)'" ).splitlines()
-    for link in links:
-        if link:
-            sh( "ip link del " + link )
-
-    info( "*** Killing stale mininet node processes\n" )
-    killprocs( 'mininet:' )
-
-    info ( "*** Shutting down stale tunnels\n" )
-    killprocs( 'Tunnel=Ethernet' )
-    killprocs( '.ssh/mn')
-    sh( 'rm -f ~/.ssh/mn/*' )
-    
-    info( "*** Cleanup complete.\n" )
+       each resource type is listed once and removed in bulk.
+       returns: list of ( phase, items removed, seconds )"""
+    report = []
+
+    def phase( title, fn, *args ):
+        "Run and time one cleanup phase"
+        info( '*** %s\n' % title )
+        start = time.time()
+        removed = fn( *args )
+        report.append( ( title, removed, time.time() - start ) )
+        if removed:
+            info( ' '.join( str( item ) for item in removed ) + '\n' )
+        return removed
+
+    procs = processes()
+    links = [ link for link in rootIntfNames()
+              if re.match( r'[-_.\w]+-eth\d+$', link ) ]
+    names = nodeNames( procs, links )
+
+    # Killing node shells also destroys their namespaces and veths,
+    # so do it first and then only remove links that are still there
+    phase( 'Killing stale controllers, switches, shells and tunnels',
+           lambda: [ '%s(%d)' % ( comm, pid )
+                     for pid, comm in killStale( procs ) ] )
+    phase( 'Removing junk from /tmp', removeFiles, '/tmp/vconn*',
+           '/tmp/vlogs*', '/tmp/*.out', '/tmp/*.log' )
+    phase( 'Removing excess kernel datapaths', removeDatapaths, procs )
+    phase( 'Removing OVS datapaths', removeBridges )
+    present = rootIntfNames()
+    phase( 'Removing all links of the pattern foo-ethX', removeLinks,
+           [ link for link in links if link in present ] )
+    phase( 'Removing named network namespaces', removeNetns )
+    phase( 'Removing stale cgroups', removeCgroups, names )
+    phase( 'Removing ssh tunnel sockets', removeFiles, '~/.ssh/mn/*' )
+
+    info( '*** Cleanup complete.\n' )
+    for title, removed, elapsed in report:
+        info( '%-55s %6d removed %8.3fs\n' %
+              ( title, len( removed ), elapsed ) )
+    return report
@@ -38,6 +38,7 @@
 from mininet.term import makeTerms, runX11
 from mininet.util import ( quietRun, isShellBuiltin, dumpNodeConnections,
                          dumpPorts )
+from mininet.timeline import Timeline
 
 class CLI( Cmd ):
     "Simple command-line interface to talk to nodes."
@@ -251,6 +252,22 @@ def do_link( self, line ):
         else:
             self.mn.configLinkStatus( *args )
 
+    def do_timeline( self, line ):
+        """Apply a schedule of link changes from a file
+           (see mininet/timeline.py).
+           Usage: timeline schedule [log]"""
+        args = line.split()
+        if len( args ) not in ( 1, 2 ):
+            error( 'usage: timeline schedule [log]\n' )
+            return
+        try:
+            timeline = Timeline( self.mn, args[ 0 ] )
+            timeline.run()
+            if len( args ) == 2:
+                timeline.save( args[ 1 ] )
+        except Exception, e:
+            error( '%s\n' % e )
+
     def do_xterm( self, line, term='xterm' ):
         """Spawn xterm(s) for the given node(s).
            Usage: xterm node1 node2 ..."""
@@ -347,8 +364,20 @@ def do_time( self, line ):
         self.stdout.write("*** Elapsed time: %0.6f secs\n" % elapsed)
 
     def do_links( self, line ):
-        "Report on links"
-        for link in self.mn.links:
+        """Report on links, optionally only those of a node or
+           between two nodes.
+           Usage: links [node1 [node2]]"""
+        args = line.split()
+        for arg in args:
+            if arg not in self.mn:
+                error( "node '%s' not in network\n" % arg )
+                return
+        if len( args ) > 2:
+            error( 'usage: links [node1 [node2]]\n' )
+            return
+        links = ( self.mn.linksBetween( *args ) if len( args ) == 2 else
+                  self.mn.linksOf( *args ) if args else self.mn.links )
+        for link in links:
             print link, link.status()
 
     def default( self, line ):
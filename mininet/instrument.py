@@ -0,0 +1,191 @@
+"""
+Build-phase profiling and command accounting
+
+A Profiler records the wall time of each phase of a Mininet run
+(adding hosts, switches and links, configuring hosts, starting,
+waiting for connections, stopping) and, within each phase, how many
+subprocesses were spawned, how many node shell and root shell round
+trips were made, and which node classes they came from. It also
+keeps the slowest individual commands. Results can be dumped as JSON
+so that runs can be compared.
+
+Usage:
+
+    from mininet.instrument import startProfiling, stopProfiling
+    startProfiling()
+    net = Mininet( topo )
+    net.start()
+    net.stop()
+    stopProfiling().dump( 'profile.json' )
+
+or: mn --profile profile.json
+
+Commands are recorded with record(), which is a no-op unless
+a profiler is active, and phases are delimited with phase():
+
+    with phase( 'links' ):
+        ...
+
+Decisions worth keeping with the numbers (e.g. CPU pinning) are added
+to the report with annotate().
+"""
+
+import heapq
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+
+# Kinds of recorded commands
+SPAWN = 'spawn'   # new subprocess (errRun, Node.popen, node shells)
+CMD = 'cmd'       # node shell round trip (sendCmd/waitOutput)
+ROOT = 'root'     # root shell round trip (rootCmds)
+KINDS = ( SPAWN, CMD, ROOT )
+
+
+class Profiler( object ):
+    "Per-phase wall time and command accounting for a Mininet run"
+
+    active = None   # profiler that record() and phase() report to
+
+    def __init__( self, slowest=20 ):
+        """slowest: number of slowest commands to keep"""
+        self.slowest = slowest
+        self.phases = OrderedDict()
+        self.stack = []
+        self.heap = []
+        self.seq = 0
+        self.start = time()
+        self.end = None
+        self.notes = OrderedDict()
+
+    def stats( self, name ):
+        "Return (creating if needed) stats for phase name"
+        stats = self.phases.get( name )
+        if stats is None:
+            stats = { 'seconds': 0.0, 'calls': 0,
+                      'counts': dict.fromkeys( KINDS, 0 ),
+                      'times': dict.fromkeys( KINDS, 0.0 ),
+                      'classes': {} }
+            self.phases[ name ] = stats
+        return stats
+
+    @contextmanager
+    def phase( self, name ):
+        "Context manager: time a phase and attribute commands to it"
+        stats = self.stats( name )
+        self.stack.append( name )
+        start = time()
+        try:
+            yield stats
+        finally:
+            stats[ 'seconds' ] += time() - start
+            stats[ 'calls' ] += 1
+            self.stack.pop()
+
+    def record( self, kind, cmd, seconds, node=None ):
+        """Record a command.
+           kind: SPAWN, CMD or ROOT
+           cmd: command (string or list)
+           seconds: elapsed time
+           node: node the command ran on, if any"""
+        name = self.stack[ -1 ] if self.stack else 'other'
+        stats = self.stats( name )
+        stats[ 'counts' ][ kind ] += 1
+        stats[ 'times' ][ kind ] += seconds
+        cls = type( node ).__name__ if node is not None else 'None'
+        counts = stats[ 'classes' ].get( cls )
+        if counts is None:
+            counts = stats[ 'classes' ][ cls ] = dict.fromkeys( KINDS, 0 )
+        counts[ kind ] += 1
+        self.seq += 1
+        entry = ( seconds, self.seq, kind, cmd, node, name )
+        if len( self.heap ) < self.slowest:
+            heapq.heappush( self.heap, entry )
+        elif seconds > self.heap[ 0 ][ 0 ]:
+            heapq.heapreplace( self.heap, entry )
+
+    def annotate( self, key, value ):
+        "Add a note (anything JSON can encode) to the report"
+        self.notes[ key ] = value
+
+    def stop( self ):
+        "Stop the overall clock"
+        self.end = time()
+
+    def report( self ):
+        "Return results as a dict suitable for JSON"
+        end = self.end if self.end is not None else time()
+        phases = []
+        for name, stats in self.phases.iteritems():
+            result = { 'name': name }
+            result.update( stats )
+            phases.append( result )
+        slowest = []
+        for seconds, _seq, kind, cmd, node, name in sorted(
+                self.heap, reverse=True ):
+            if not isinstance( cmd, basestring ):
+                cmd = ' '.join( str( c ) for c in cmd )
+            slowest.append( { 'seconds': seconds, 'kind': kind,
+                              'cmd': cmd, 'phase': name,
+                              'node': str( node ) if node else None } )
+        return { 'seconds': end - self.start, 'phases': phases,
+                 'slowest': slowest, 'notes': self.notes }
+
+    def dump( self, filename ):
+        "Write results to filename as JSON"
+        with open( filename, 'w' ) as f:
+            json.dump( self.report(), f, indent=1, sort_keys=True )
+            f.write( '\n' )
+
+    def summary( self ):
+        "Return a short human-readable summary"
+        lines = [ '%-16s %9s %7s %7s %7s' %
+                  ( 'phase', 'seconds', SPAWN, CMD, ROOT ) ]
+        for name, stats in self.phases.iteritems():
+            counts = stats[ 'counts' ]
+            lines.append( '%-16s %9.3f %7d %7d %7d' %
+                          ( name, stats[ 'seconds' ], counts[ SPAWN ],
+                            counts[ CMD ], counts[ ROOT ] ) )
+        return '\n'.join( lines ) + '\n'
+
+
+def startProfiling( profiler=None ):
+    """Make profiler (or a new Profiler) the active profiler
+       returns: active profiler"""
+    Profiler.active = profiler if profiler is not None else Profiler()
+    return Profiler.active
+
+def stopProfiling():
+    """Deactivate and stop the active profiler
+       returns: profiler that was active, or None"""
+    profiler, Profiler.active = Profiler.active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+@contextmanager
+def phase( name ):
+    "Context manager: time phase name in the active profiler, if any"
+    profiler = Profiler.active
+    if profiler is None:
+        yield None
+    else:
+        with profiler.phase( name ) as stats:
+            yield stats
+
+def annotate( key, value ):
+    "Add a note to the active profiler's report, if any"
+    profiler = Profiler.active
+    if profiler is not None:
+        profiler.annotate( key, value )
+
+def record( kind, cmd, start, node=None ):
+    """Record a command in the active profiler, if any
+       kind: SPAWN, CMD or ROOT
+       cmd: command (string or list)
+       start: time() when the command started
+       node: node the command ran on, if any"""
+    profiler = Profiler.active
+    if profiler is not None:
+        profiler.record( kind, cmd, time() - start, node )
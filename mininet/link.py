@@ -25,34 +25,66 @@
 """
 
 from mininet.log import info, error, debug
-from mininet.util import makeIntfPair, quietRun
+from mininet.util import makeIntfPair, rootCmd, numCores
+from subprocess import STDOUT
+from tempfile import mkstemp
+from itertools import chain
+import os
 import re
 
+# Interface parameters, shared between interfaces with the same ones
+# (e.g. both ends of every TCLink with the same bw and delay)
+paramRecords = {}
+
+def shareParams( params ):
+    """Return a shared dict equal to params; callers must replace
+       rather than modify it
+       params: parameter dict"""
+    try:
+        key = frozenset( params.iteritems() )
+    except TypeError:
+        # Unhashable values: don't share
+        return params
+    return paramRecords.setdefault( key, params )
+
 class Intf( object ):
 
     "Basic interface object that can configure itself."
 
+    __slots__ = ( 'node', 'name', 'link', 'mac', 'ip', 'prefixLen', 'port',
+                  'params' )
+
     def __init__( self, name, node=None, port=None, link=None,
-                  mac=None, srcNode=None, **params ):
+                  mac=None, srcNode=None, planned=False, **params ):
         """name: interface name (e.g. h1-eth0)
            node: owning node (where this intf most likely lives)
            link: parent link if we're part of a link
+           planned: already created, moved and configured (e.g. by
+                    a build plan), so just record it and its params
            other arguments are passed to config()"""
         self.node = node
         self.name = name
         self.link = link
         self.mac = mac
         self.ip, self.prefixLen = None, None
+        self.port = None  # set by node.addIntf()
         
         # if interface is lo, we know the ip is 127.0.0.1.
         # This saves an ifconfig command per node
         if self.name == 'lo':
             self.ip = '127.0.0.1'
         # Add to node (and move ourselves if necessary )
-        node.addIntf( self, port=port )
+        if planned:
+            node.addIntf( self, port=port, moveIntfFn=lambda *_args: None )
+            ip = params.get( 'ip' )
+            if ip and '/' in ip:
+                self.ip, self.prefixLen = ip.split( '/' )
+        else:
+            node.addIntf( self, port=port )
         # Save params for future reference
-        self.params = params
-        self.config( **params )
+        self.params = shareParams( params )
+        if not planned:
+            self.config( **params )
 
     def cmd( self, *args, **kwargs ):
         "Run a command in our owning node"
@@ -190,7 +222,7 @@ def delete( self ):
         self.cmd( 'ip link del ' + self.name )
         if self.node.inNamespace:
             # Link may have been dumped into root NS
-            quietRun( 'ip link del ' + self.name )
+            rootCmd( 'ip link del ' + self.name )
 
     def status( self ):
         "Return intf status as a string"
@@ -212,9 +244,19 @@ class TCIntf( Intf ):
        Allows specification of bandwidth limits (various methods)
        as well as delay, loss and max queue length"""
 
-    def bwCmds( self, bw=None, speedup=0, use_hfsc=False, use_tbf=False,
-                latency_ms=None, enable_ecn=False, enable_red=False ):
-        "Return tc commands to set bandwidth"
+    __slots__ = ()
+
+    # Parameters handled by tc (see tcCmds())
+    tcParams = ( 'bw', 'delay', 'jitter', 'loss', 'speedup', 'use_hfsc',
+                 'use_tbf', 'latency_ms', 'enable_ecn', 'enable_red',
+                 'max_queue_size' )
+
+    @staticmethod
+    def bwCmds( bw=None, speedup=0, use_hfsc=False, use_tbf=False,
+                latency_ms=None, enable_ecn=False, enable_red=False,
+                nodeName='' ):
+        """Return tc commands to set bandwidth
+           nodeName: name of our node (speedup applies to switches)"""
 
         cmds, parent = [], ' root '
 
@@ -224,7 +266,7 @@ def bwCmds( self, bw=None, speedup=0, use_hfsc=False, use_tbf=False,
         elif bw is not None:
             # BL: this seems a bit brittle...
             if ( speedup > 0 and
-                 self.node.name[0:1] == 's' ):
+                 nodeName[0:1] == 's' ):
                 bw = speedup
             # This may not be correct - we should look more closely
             # at the semantics of burst (and cburst) to make sure we
@@ -289,6 +331,27 @@ def delayCmds( parent, delay=None, jitter=None,
                 parent = ' parent 10:1 '
         return cmds, parent
 
+    @classmethod
+    def tcCmds( cls, nodeName='', bw=None, delay=None, jitter=None,
+                loss=None, speedup=0, use_hfsc=False, use_tbf=False,
+                latency_ms=None, enable_ecn=False, enable_red=False,
+                max_queue_size=None, **_params ):
+        """Return tc commands for bandwidth, delay and loss, as format
+           strings taking the tc command and the interface name
+           nodeName: name of our node
+           returns: cmds, parent"""
+        bwcmds, parent = cls.bwCmds( bw=bw, speedup=speedup,
+                                     use_hfsc=use_hfsc, use_tbf=use_tbf,
+                                     latency_ms=latency_ms,
+                                     enable_ecn=enable_ecn,
+                                     enable_red=enable_red,
+                                     nodeName=nodeName )
+        delaycmds, parent = cls.delayCmds( delay=delay, jitter=jitter,
+                                           loss=loss,
+                                           max_queue_size=max_queue_size,
+                                           parent=parent )
+        return bwcmds + delaycmds, parent
+
     def tc( self, cmd, tc='tc' ):
         "Execute tc command for our interface"
         c = cmd % (tc, self)  # Add in tc command and our name
@@ -303,9 +366,15 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
 
         result = Intf.config( self, **params)
 
+        batch = self.batch()
+
         # Disable GRO
         if disable_gro:
-            self.cmd( 'ethtool -K %s gro off' % self )
+            if batch:
+                batch.add( self.node,
+                           shell=[ 'ethtool -K %s gro off' % self ] )
+            else:
+                self.cmd( 'ethtool -K %s gro off' % self )
 
         # Optimization: return if nothing else to configure
         # Question: what happens if we want to reset things?
@@ -314,25 +383,34 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
             return
 
         # Clear existing configuration
-        tcoutput = self.tc( '%s qdisc show dev %s' )
-        if "priomap" not in tcoutput:
-            cmds = [ '%s qdisc del dev %s root' ]
-        else:
+        if batch:
+            # Our first commands will replace the root qdisc instead
             cmds = []
-
-        # Bandwidth limits via various methods
-        bwcmds, parent = self.bwCmds( bw=bw, speedup=speedup,
-                                      use_hfsc=use_hfsc, use_tbf=use_tbf,
-                                      latency_ms=latency_ms,
+        else:
+            tcoutput = self.tc( '%s qdisc show dev %s' )
+            if "priomap" not in tcoutput:
+                cmds = [ '%s qdisc del dev %s root' ]
+            else:
+                cmds = []
+
+        # Bandwidth limits via various methods, then
+        # delay/jitter/loss/max_queue_size using netem
+        tccmds, parent = self.tcCmds( nodeName=self.node.name, bw=bw,
+                                      delay=delay, jitter=jitter, loss=loss,
+                                      speedup=speedup, use_hfsc=use_hfsc,
+                                      use_tbf=use_tbf, latency_ms=latency_ms,
                                       enable_ecn=enable_ecn,
-                                      enable_red=enable_red )
-        cmds += bwcmds
-
-        # Delay/jitter/loss/max_queue_size using netem
-        delaycmds, parent = self.delayCmds( delay=delay, jitter=jitter,
-                                loss=loss, max_queue_size=max_queue_size,
-                                parent=parent )
-        cmds += delaycmds
+                                      enable_red=enable_red,
+                                      max_queue_size=max_queue_size )
+        if batch and tccmds and ' root ' in tccmds[ 0 ]:
+            # Batches can't check for an existing root qdisc, and tc
+            # replace can't change the kind of an existing 5: root or
+            # drop its classes, so first swap in a plain qdisc (which
+            # replaces any root), then replace that with ours
+            cmds = [ '%s qdisc replace dev %s root pfifo' ]
+            tccmds[ 0 ] = tccmds[ 0 ].replace( 'qdisc add', 'qdisc replace',
+                                               1 )
+        cmds += tccmds
 
         # Ugly but functional: display configuration info
         stuff = ( ( [ '%.2fMbit' % bw ] if bw is not None else [] ) +
@@ -345,7 +423,7 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
 
         # Execute all the commands in our node
         debug("at map stage w/cmds: %s\n" % cmds)
-        tcoutputs = [ self.tc(cmd) for cmd in cmds ]
+        tcoutputs = self.runTC( cmds )
         for output in tcoutputs:
             if output != '':
                 error( "*** Error: %s" % output )
@@ -356,16 +434,162 @@ def config( self, bw=None, delay=None, jitter=None, loss=None,
 
         return result
 
+    # tc qdiscs and classes, for matching up old and new commands
+    tcKinds = ( 'htb', 'hfsc', 'tbf', 'red', 'netem' )
+
+    @classmethod
+    def tcShape( cls, cmds ):
+        """Return the qdiscs and classes that tc commands create:
+           each command up to and including its kind"""
+        shape = []
+        for cmd in cmds:
+            words = cmd.split()
+            for i, word in enumerate( words ):
+                if word in cls.tcKinds:
+                    break
+            shape.append( ' '.join( words[ :i + 1 ] ) )
+        return shape
+
+    def reshape( self, **params ):
+        """Change tc parameters (e.g. bw, delay, loss) at runtime.
+           If the new parameters need the same qdiscs and classes as
+           the current ones, they are changed in place with tc change,
+           keeping queued packets; otherwise the configuration is
+           rebuilt. Use a TCBatch to reshape many interfaces at once.
+           params: tc parameters to change (None: remove)
+           returns: True if changed in place"""
+        old = self.params
+        new = dict( ( key, value ) for key, value
+                    in chain( old.iteritems(), params.iteritems() )
+                    if params.get( key, value ) is not None )
+        self.params = new
+        oldCmds, _parent = self.tcCmds( nodeName=self.node.name, **old )
+        newCmds, _parent = self.tcCmds( nodeName=self.node.name, **new )
+        debug( 'reshape %s: %s\n' % ( self, newCmds ) )
+        if oldCmds and self.tcShape( oldCmds ) == self.tcShape( newCmds ):
+            self.runTC( [ cmd.replace( ' add ', ' change ', 1 )
+                          for cmd in newCmds if cmd not in oldCmds ] )
+            return True
+        if not newCmds:
+            if oldCmds:
+                self.runTC( [ '%s qdisc del dev %s root' ] )
+            return False
+        with TCBatch():
+            self.config( disable_gro=False,
+                         **dict( ( key, new[ key ] ) for key in self.tcParams
+                                 if key in new ) )
+        return False
+
+    def batch( self ):
+        "Return the active TCBatch, if our node can use it"
+        if getattr( self.node, 'isRemote', False ):
+            return None
+        return TCBatch.active
+
+    def runTC( self, cmds ):
+        """Run tc commands for our interface, or add them to the
+           active TCBatch
+           cmds: tc command format strings (see tc())
+           returns: outputs (empty if batched)"""
+        batch = self.batch()
+        if batch:
+            batch.add( self.node, tc=[ ( cmd % ( '', self ) ).strip()
+                                       for cmd in cmds ] )
+            return []
+        return [ self.tc( cmd ) for cmd in cmds ]
+
+
+class TCBatch( object ):
+    """Gather the tc and ethtool commands of TCIntf.config() and run
+       them all at once: one shell script running ethtool, a single
+       ip -batch and a single tc -batch per network namespace, with
+       namespaces configured in parallel.
+       Only failures are reported.
+
+           with TCBatch():
+               ... create TCLinks ...
+
+       Batches don't nest: an inner one adds to the outer one."""
+
+    active = None
+
+    def __init__( self, maxProcs=None ):
+        "maxProcs: maximum namespaces to configure at once"
+        self.maxProcs = maxProcs or 2 * numCores()
+        self.cmds = {}  # namespace -> ( node, shell, ip, tc cmds )
+        self.order = []  # namespaces in order of first use
+        self.outer = None
+
+    def add( self, node, shell=(), ip=(), tc=() ):
+        """Add commands to run in node's namespace
+           shell: shell commands
+           ip: ip commands, without the leading 'ip'
+           tc: tc commands, without the leading 'tc'"""
+        key = node.pid if node.inNamespace else None
+        entry = self.cmds.get( key )
+        if entry is None:
+            entry = self.cmds[ key ] = ( node, [], [], [] )
+            self.order.append( key )
+        entry[ 1 ].extend( shell )
+        entry[ 2 ].extend( ip )
+        entry[ 3 ].extend( tc )
+
+    def __enter__( self ):
+        self.outer = TCBatch.active
+        if self.outer is None:
+            TCBatch.active = self
+        return TCBatch.active
+
+    def __exit__( self, exctype, *_args ):
+        if self.outer is None:
+            TCBatch.active = None
+            if exctype is None:
+                self.run()
+
+    def start( self, node, shell, ip, tc ):
+        """Start commands for one namespace, as a script (since there
+           may be too many for a command line)
+           returns: Popen object, script file name"""
+        script = list( shell )
+        for prog, cmds in ( 'ip', ip ), ( 'tc', tc ):
+            if cmds:
+                script += ( [ "%s -force -batch - <<'EOF'" % prog ] +
+                            list( cmds ) + [ 'EOF' ] )
+        fd, path = mkstemp( prefix='mn-tc-', suffix='.sh' )
+        os.write( fd, '\n'.join( script ) + '\n' )
+        os.close( fd )
+        return node.popen( [ 'sh', path ], stderr=STDOUT ), path
+
+    def run( self ):
+        """Run all commands, reporting failures
+           returns: number of namespaces with failures"""
+        pending, running, failures = list( self.order ), [], 0
+        while pending or running:
+            while pending and len( running ) < self.maxProcs:
+                node, shell, ip, tc = self.cmds[ pending.pop( 0 ) ]
+                running.append( ( node, ) +
+                                self.start( node, shell, ip, tc ) )
+            node, popen, path = running.pop( 0 )
+            out, _err = popen.communicate()
+            os.unlink( path )
+            if popen.returncode or out:
+                error( '*** Error configuring %s:\n%s' % ( node, out ) )
+                failures += 1
+        self.cmds, self.order = {}, []
+        return failures
+
 
 class Link( object ):
 
     """A basic link is just a veth pair.
        Other types of links could be tunnels, link emulators, etc.."""
 
+    __slots__ = ( 'intf1', 'intf2' )
+
     def __init__( self, node1, node2, port1=None, port2=None,
                   intfName1=None, intfName2=None, addr1=None, addr2=None,
                   intf=Intf, cls1=None, cls2=None, params1=None,
-                  params2=None ):
+                  params2=None, planned=False ):
         """Create veth link to another node, making two new interfaces.
            node1: first node
            node2: second node
@@ -376,7 +600,9 @@ def __init__( self, node1, node2, port1=None, port2=None,
            intfName1: node1 interface name (optional)
            intfName2: node2  interface name (optional)
            params1: parameters for interface 1
-           params2: parameters for interface 2"""
+           params2: parameters for interface 2
+           planned: interfaces were already created and configured
+                    (e.g. by a build plan)"""
         # This is a bit awkward; it seems that having everything in
         # params is more orthogonal, but being able to specify
         # in-line arguments is more convenient! So we support both.
@@ -400,7 +626,11 @@ def __init__( self, node1, node2, port1=None, port2=None,
         if not intfName2:
             intfName2 = self.intfName( node2, params2[ 'port' ] )
 
-        self.makeIntfPair( intfName1, intfName2, addr1, addr2 )
+        if planned:
+            params1 = dict( params1, planned=True )
+            params2 = dict( params2, planned=True )
+        else:
+            self.makeIntfPair( intfName1, intfName2, addr1, addr2 )
 
         if not cls1:
             cls1 = intf
@@ -414,6 +644,7 @@ def __init__( self, node1, node2, port1=None, port2=None,
 
         # All we are is dust in the wind, and our two interfaces
         self.intf1, self.intf2 = intf1, intf2
+        node1.addConnection( intf1, intf2 )
 
     def intfName( _self, node, n ):
         "Construct a canonical interface name node-ethN for interface n."
@@ -441,18 +672,37 @@ def status( self ):
         "Return link status as a string"
         return "(%s %s)" % ( self.intf1.status(), self.intf2.status() )
 
+    def reshape( self, **params ):
+        """Change tc parameters of both interfaces at runtime
+           (see TCIntf.reshape())
+           params: tc parameters to change (None: remove)
+           returns: True if both were changed in place"""
+        intfs = [ intf for intf in ( self.intf1, self.intf2 )
+                  if isinstance( intf, TCIntf ) ]
+        if not intfs:
+            raise Exception( 'reshape: %s has no tc interfaces' % self )
+        shared = self.intf1.params is self.intf2.params
+        with TCBatch():
+            inPlace = all( [ intf.reshape( **params ) for intf in intfs ] )
+        if shared and len( intfs ) == 2:
+            self.intf2.params = self.intf1.params
+        return inPlace
+
     def __str__( self ):
         return '%s<->%s' % ( self.intf1, self.intf2 )
 
 class TCLink( Link ):
     "Link with symmetric TC interfaces configured via opts"
+
+    __slots__ = ()
+
     def __init__( self, node1, node2, port1=None, port2=None,
                   intfName1=None, intfName2=None,
-                  addr1=None, addr2=None, **params ):
+                  addr1=None, addr2=None, planned=False, **params ):
         Link.__init__( self, node1, node2, port1=port1, port2=port2,
                        intfName1=intfName1, intfName2=intfName2,
                        cls1=TCIntf,
                        cls2=TCIntf,
                        addr1=addr1, addr2=addr2,
                        params1=params,
-                       params2=params )
+                       params2=params, planned=planned )
@@ -1,6 +1,6 @@
 "Module dependency utility functions for Mininet."
 
-from mininet.util import quietRun
+from mininet.util import quietRun, rootCmds
 from mininet.log import info, error, debug
 from os import environ
 
@@ -60,8 +60,10 @@ def moduleDeps( subtract=None, add=None ):
 def pathCheck( *args, **kwargs ):
     "Make sure each program in *args can be found in $PATH."
     moduleName = kwargs.get( 'moduleName', 'it' )
-    for arg in args:
-        if not quietRun( 'which ' + arg ):
+    # Look everything up in a single round trip
+    found = rootCmds( [ 'which ' + arg for arg in args ] )
+    for arg, ( path, _code ) in zip( args, found ):
+        if not path:
             error( 'Cannot find required executable %s.\n' % arg +
                    'Please make sure that %s is installed ' % moduleName +
                    'and available in your $PATH:\n(%s)\n' % environ[ 'PATH' ] )
@@ -93,21 +93,42 @@
 import random
 import copy
 from time import sleep
+from subprocess import PIPE
 from itertools import chain, groupby
+from functools import wraps
 from math import ceil
 
 from mininet.cli import CLI
 from mininet.log import info, error, debug, output, warn
-from mininet.node import Host, OVSKernelSwitch, DefaultController, Controller
+from mininet.node import ( Node, Host, Switch, OVSSwitch, OVSKernelSwitch,
+                           DefaultController, Controller )
 from mininet.nodelib import NAT
-from mininet.link import Link, Intf
-from mininet.util import quietRun, fixLimits, numCores, ensureRoot
-from mininet.util import macColonHex, ipStr, ipParse, netParse, ipAdd
+from mininet.link import Link, Intf, TCIntf, TCBatch
+from mininet.topo import Topo, linkId
+from mininet.util import quietRun, fixLimits, numCores, ensureRoot, rootCmds
+from mininet.util import monotonic, listeningPorts, waitListening
+from mininet.util import attachNetns, detachNetns, deleteRootIntfs
+from mininet.util import macColonHex, ipStr, ipParse, netParse, natural
 from mininet.term import cleanUpScreens, makeTerms
+from mininet.instrument import phase, annotate
+from mininet.pinning import CPUPlan, formatCpuList
+from mininet.calibrate import checkCapacity
+from mininet.plan import PlanCompiler, PlanExecutor
+from mininet.pool import IPPool, MACPool
+from mininet.sampler import CPUSampler
+from mininet.backend import UseBackend
 
 # Mininet version: should be consistent with README and LICENSE
 VERSION = "2.2.0b1"
 
+def usesBackend( method ):
+    "Decorator: run a Mininet method with the network's backend active"
+    @wraps( method )
+    def wrapped( self, *args, **kwargs ):
+        with UseBackend( self.backend ):
+            return method( self, *args, **kwargs )
+    return wrapped
+
 class Mininet( object ):
     "Network emulation with hosts spawned in network namespaces."
 
@@ -116,7 +137,8 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
                   build=True, xterms=False, cleanup=False, ipBase='10.0.0.0/8',
                   inNamespace=False,
                   autoSetMacs=False, autoStaticArp=False, autoPinCpus=False,
-                  listenPort=None, waitConnected=False ):
+                  listenPort=None, waitConnected=False, namedNetns=False,
+                  plan=False, planCache=None, backend=None ):
         """Create Mininet object.
            topo: Topo (topology) object or None
            switch: default Switch class
@@ -133,7 +155,16 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
            autoStaticArp: set all-pairs static MAC addrs?
            autoPinCpus: pin hosts to (real) cores (requires CPULimitedHost)?
            listenPort: base listening port to open; will be incremented for
-               each additional switch in the net if inNamespace=False"""
+               each additional switch in the net if inNamespace=False
+           namedNetns: bind-mount node namespaces under /var/run/netns
+               so that they can be configured with ip -n <node>?
+           plan: create and configure links from topo by compiling and
+               running a build plan (see mininet.plan)? (implies
+               namedNetns)
+           planCache: directory in which to cache compiled plans
+           backend: execution backend class or instance, e.g.
+               FakeBackend (default: run real processes; see
+               mininet.backend)"""
         self.topo = topo
         self.switch = switch
         self.host = host
@@ -142,7 +173,9 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         self.intf = intf
         self.ipBase = ipBase
         self.ipBaseNum, self.prefixLen = netParse( self.ipBase )
-        self.nextIP = 1  # start for address allocation
+        self.ipPool = IPPool( ipBase )  # host addresses
+        self.heldIPs = {}  # host -> address ipPool holds for it
+        self.macPool = MACPool()  # link MAC addresses
         self.inNamespace = inNamespace
         self.xterms = xterms
         self.cleanup = cleanup
@@ -150,9 +183,14 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
         self.autoStaticArp = autoStaticArp
         self.autoPinCpus = autoPinCpus
         self.numCores = numCores()
-        self.nextCore = 0  # next core for pinning hosts to CPUs
+        self.cpuPlan = None  # CPUPlan for pinning hosts to cores
+        self.vswitchdAffinity = None  # ( pid, mask ) to restore in stop()
         self.listenPort = listenPort
         self.waitConn = waitConnected
+        self.namedNetns = namedNetns or plan
+        self.plan = plan
+        self.planCache = planCache
+        self.plannedHosts = set()  # hosts configured by a build plan
 
         self.hosts = []
         self.switches = []
@@ -163,43 +201,53 @@ def __init__( self, topo=None, switch=OVSKernelSwitch, host=Host,
 
         self.terms = []  # list of spawned xterm processes
 
-        Mininet.init()  # Initialize Mininet if necessary
+        # Nodes we create will use the backend that is active while
+        # our methods run (see usesBackend)
+        if isinstance( backend, type ):
+            backend = backend()
+        self.backend = backend
+        if backend is None:
+            Mininet.init()  # Initialize Mininet if necessary
 
         self.built = False
+        self.started = False
         if topo and build:
             self.build()
 
 
+    @usesBackend
     def waitConnected( self, timeout=None, delay=.5 ):
         """wait for each switch to connect to a controller,
            up to 5 seconds
            timeout: time to wait, or None to wait indefinitely
            delay: seconds to sleep per iteration
            returns: True if all switches are connected"""
-        info( '*** Waiting for switches to connect\n' )
-        time = 0
-        remaining = list( self.switches )
-        while True:
-            for switch in tuple( remaining ):
-                if switch.connected():
-                    info( '%s ' % switch )
+        with phase( 'waitConnected' ):
+            info( '*** Waiting for switches to connect\n' )
+            time = 0
+            remaining = list( self.switches )
+            while True:
+                for switch in tuple( remaining ):
+                    if switch.connected():
+                        info( '%s ' % switch )
+                        remaining.remove( switch )
+                if not remaining:
+                    info( '\n' )
+                    return True
+                if time > timeout and timeout is not None:
+                    break
+                sleep( delay )
+                time += delay
+            warn( 'Timed out after %d seconds\n' % time )
+            for switch in remaining:
+                if not switch.connected():
+                    warn( 'Warning: %s is not connected to a controller\n'
+                          % switch.name )
+                else:
                     remaining.remove( switch )
-            if not remaining:
-                info( '\n' )
-                return True
-            if time > timeout and timeout is not None:
-                break
-            sleep( delay )
-            time += delay
-        warn( 'Timed out after %d seconds\n' % time )
-        for switch in remaining:
-            if not switch.connected():
-                warn( 'Warning: %s is not connected to a controller\n'
-                      % switch.name )
-            else:
-                remaining.remove( switch )
-        return not remaining
+            return not remaining
 
+    @usesBackend
     def addHost( self, name, cls=None, **params ):
         """Add host.
            name: name of host to add
@@ -207,24 +255,29 @@ def addHost( self, name, cls=None, **params ):
            params: parameters for host
            returns: added host"""
         # Default IP and MAC addresses
-        defaults = { 'ip': ipAdd( self.nextIP,
-                                  ipBaseNum=self.ipBaseNum,
-                                  prefixLen=self.prefixLen ) +
-                                  '/%s' % self.prefixLen }
-        if self.autoSetMacs:
-            defaults[ 'mac' ] = macColonHex( self.nextIP )
+        ip, held = self.ipPool.assign( params )
+        defaults = { 'ip': ip }
+        if self.autoSetMacs and ip:
+            # Addresses outside ipBase get a MAC from the MAC pool
+            defaults[ 'mac' ] = ( self.ipPool.mac( ip ) or
+                                  self.macPool.allocate() )
         if self.autoPinCpus:
-            defaults[ 'cores' ] = self.nextCore
-            self.nextCore = ( self.nextCore + 1 ) % self.numCores
-        self.nextIP += 1
+            if self.cpuPlan is None:
+                self.cpuPlan = CPUPlan()
+            defaults[ 'cores' ] = self.cpuPlan.cpu( name )
         defaults.update( params )
         if not cls:
             cls = self.host
         h = cls( name, **defaults )
+        if held:
+            self.heldIPs[ h ] = ip
         self.hosts.append( h )
         self.nameToNode[ name ] = h
+        if self.built and self.namedNetns:
+            self.nameNetns( [ h ] )
         return h
 
+    @usesBackend
     def addSwitch( self, name, cls=None, **params ):
         """Add switch.
            name: name of switch to add
@@ -241,8 +294,11 @@ def addSwitch( self, name, cls=None, **params ):
             self.listenPort += 1
         self.switches.append( sw )
         self.nameToNode[ name ] = sw
+        if self.built and self.namedNetns:
+            self.nameNetns( [ sw ] )
         return sw
 
+    @usesBackend
     def addController( self, name='c0', controller=None, **params ):
         """Add controller.
            controller: Controller class"""
@@ -327,6 +383,7 @@ def randMac():
         return macColonHex( random.randint(1, 2**48 - 1) & 0xfeffffffffff  |
                             0x020000000000 )
     
+    @usesBackend
     def addLink( self, node1, node2, port1=None, port2=None,
                  cls=None, **params ):
         """"Add a link from node1 to node2
@@ -347,17 +404,31 @@ def addLink( self, node1, node2, port1=None, port2=None,
         if port2 is not None:
             options.setdefault( 'port2', port2 )
         # Set default MAC - this should probably be in Link
-        options.setdefault( 'addr1', self.randMac() )
-        options.setdefault( 'addr2', self.randMac() )
+        for addr in 'addr1', 'addr2':
+            if addr in options:
+                # None means no MAC
+                if options[ addr ]:
+                    self.macPool.reserve( options[ addr ] )
+            else:
+                options[ addr ] = self.macPool.allocate()
         cls = self.link if cls is None else cls
         link = cls( node1, node2, **options )
         self.links.append( link )
         return link
 
-    def configHosts( self ):
-        "Configure a set of hosts."
-        for host in self.hosts:
+    @usesBackend
+    def configHosts( self, hosts=None ):
+        """Configure a set of hosts.
+           hosts: hosts to configure (default: all hosts)"""
+        for host in self.hosts if hosts is None else hosts:
             info( host.name + ' ' )
+            if host in self.plannedHosts:
+                # The build plan set addresses and brought lo up
+                if ( type( host ).config.__func__ is not
+                     Node.config.__func__ or
+                     host.params.get( 'defaultRoute' ) ):
+                    host.config( **dict( host.params, ip=None, mac=None ) )
+                continue
             intf = host.defaultIntf()
             if intf:
                 host.configDefault()
@@ -384,54 +455,155 @@ def buildFromTopo( self, topo=None ):
 
         info( '*** Creating network\n' )
 
-        if not self.controllers and self.controller:
-            # Add a default controller
-            info( '*** Adding controller\n' )
-            classes = self.controller
-            if type( classes ) is not list:
-                classes = [ classes ]
-            for i, cls in enumerate( classes ):
-                # Allow Controller objects because nobody understands currying
-                if isinstance( cls, Controller ):
-                    self.addController( cls )
-                else:
-                    self.addController( 'c%d' % i, cls )
+        with phase( 'controllers' ):
+            if not self.controllers and self.controller:
+                # Add a default controller
+                info( '*** Adding controller\n' )
+                classes = self.controller
+                if type( classes ) is not list:
+                    classes = [ classes ]
+                for i, cls in enumerate( classes ):
+                    # Allow Controller objects because nobody
+                    # understands currying
+                    if isinstance( cls, Controller ):
+                        self.addController( cls )
+                    else:
+                        self.addController( 'c%d' % i, cls )
+
+        if self.backend is None:
+            checkCapacity( topo )
+
+        if self.autoPinCpus:
+            self.cpuPlan = CPUPlan().plan( topo )
 
         info( '*** Adding hosts:\n' )
-        for hostName in topo.hosts():
-            self.addHost( hostName, **topo.nodeInfo( hostName ) )
-            info( hostName + ' ' )
+        with phase( 'hosts' ):
+            for hostName in topo.hosts():
+                self.addHost( hostName, **topo.nodeInfo( hostName ) )
+                info( hostName + ' ' )
 
         info( '\n*** Adding switches:\n' )
-        for switchName in topo.switches():
-            self.addSwitch( switchName, **topo.nodeInfo( switchName) )
-            info( switchName + ' ' )
+        with phase( 'switches' ):
+            for switchName in topo.switches():
+                self.addSwitch( switchName, **topo.nodeInfo( switchName) )
+                info( switchName + ' ' )
 
         info( '\n*** Adding links:\n' )
-        for srcName, dstName, params in topo.links(
-                sort=True, withInfo=True ):
-            self.addLink( **params )
-            info( '(%s, %s) ' % ( srcName, dstName ) )
+        with phase( 'links' ), TCBatch():
+            if not self.plan or not self.addPlannedLinks( topo ):
+                for srcName, dstName, params in topo.links(
+                        sort=True, withInfo=True ):
+                    self.addLink( **params )
+                    info( '(%s, %s) ' % ( srcName, dstName ) )
 
         info( '\n' )
 
+    def compilePlan( self, topo=None ):
+        """Compile a build plan for topo with our settings
+           topo: topology (default: self.topo)
+           returns: BuildPlan"""
+        compiler = PlanCompiler( topo or self.topo, switch=self.switch,
+                                 host=self.host, link=self.link,
+                                 ipBase=self.ipBase,
+                                 autoSetMacs=self.autoSetMacs,
+                                 inNamespace=self.inNamespace )
+        return compiler.compile( cacheDir=self.planCache )
+
+    def addPlannedLinks( self, topo ):
+        """Create and configure all of topo's links by running a build
+           plan, then add Link objects for them without running any more
+           commands. Nodes must already have been added.
+           returns: False if the plan couldn't be used"""
+        plan = self.compilePlan( topo )
+        nodes = self.hosts + self.switches
+        if any( getattr( node, 'isRemote', False ) for node in nodes ):
+            warn( '*** Build plans do not support remote nodes\n' )
+            return False
+        for name, addrs in plan.hosts.iteritems():
+            if self[ name ].params.get( 'ip' ) != addrs[ 'ip' ]:
+                warn( '*** Host %s address does not match build plan\n'
+                      % name )
+                return False
+        self.nameNetns()
+        planned = [ self[ name ] for _cls, node1, node2, _opts in plan.links
+                    for name in node1, node2 ]
+        unnamed = set( node.name for node in planned
+                       if node.inNamespace and not node.netns )
+        if unnamed:
+            warn( '*** Build plan needs named namespaces for %s\n' %
+                  ' '.join( sorted( unnamed, key=natural ) ) )
+            return False
+        info( '(%d steps, %d commands) ' % ( len( plan.steps ),
+                                             plan.count() ) )
+        # Nodes made their own namespaces, and switches are
+        # configured by start()
+        if not PlanExecutor( plan, skip=( 'netns', 'switches' ) ).run():
+            warn( '*** Build plan failed: adding links one at a time\n' )
+            # Deleting one end of a veth pair deletes both
+            rootCmds( [ 'ip %slink del dev %s' % (
+                '-n %s ' % self[ node1 ].netns
+                if self[ node1 ].inNamespace else '', opts[ 'intfName1' ] )
+                for _cls, node1, _node2, opts in plan.links ] )
+            return False
+        for cls, node1, node2, opts in plan.links:
+            self.links.append( cls( self[ node1 ], self[ node2 ],
+                                    planned=True, **opts ) )
+            self.macPool.reserve( opts[ 'addr1' ] )
+            self.macPool.reserve( opts[ 'addr2' ] )
+        for name, addrs in plan.hosts.iteritems():
+            host = self[ name ]
+            if host.intfs:
+                intf = host.defaultIntf()
+                intf.ip, intf.prefixLen = addrs[ 'ip' ].split( '/' )
+                self.plannedHosts.add( host )
+        for params in plan.unplanned:
+            self.addLink( **params )
+        return True
+
+    @usesBackend
+    def nameNetns( self, nodes=None ):
+        """Bind-mount node namespaces under /var/run/netns/<node>, so
+           that any number of nodes can be configured from the root
+           namespace (e.g. with ip -n <node> -batch) without a round
+           trip through each node's shell.
+           nodes: nodes to name (default: all nodes in namespaces)"""
+        if nodes is None:
+            nodes = self.controllers + self.switches + self.hosts
+        nodes = [ node for node in nodes
+                  if node.inNamespace and not node.netns ]
+        failed = attachNetns( [ ( node.name, node.pid ) for node in nodes ] )
+        if failed:
+            error( '*** Error naming network namespaces of %s:\n%s' % (
+                ' '.join( sorted( failed, key=natural ) ),
+                ''.join( failed.itervalues() ) ) )
+        # Nodes whose namespace has no name keep using their shells
+        for node in nodes:
+            if node.name not in failed:
+                node.netns = node.name
+
     def configureControlNetwork( self ):
         "Control net config hook: override in subclass"
         raise Exception( 'configureControlNetwork: '
                          'should be overriden in subclass', self )
 
+    @usesBackend
     def build( self ):
         "Build mininet."
         if self.topo:
             self.buildFromTopo( self.topo )
         if self.inNamespace:
             self.configureControlNetwork()
+        if self.namedNetns:
+            self.nameNetns()
         info( '*** Configuring hosts\n' )
-        self.configHosts()
+        with phase( 'configHosts' ):
+            self.configHosts()
         if self.xterms:
             self.startTerms()
         if self.autoStaticArp:
             self.staticArp()
+        if self.cpuPlan:
+            annotate( 'pinning', self.cpuPlan.report() )
         self.built = True
 
     def startTerms( self ):
@@ -458,49 +630,375 @@ def staticArp( self ):
                 if src != dst:
                     src.setARP( ip=dst.IP(), mac=dst.MAC() )
 
+    @usesBackend
     def start( self ):
         "Start controller and switches."
         if not self.built:
             self.build()
-        info( '*** Starting controller\n' )
-        for controller in self.controllers:
-            controller.start()
-        info( '*** Starting %s switches\n' % len( self.switches ) )
-        for switch in self.switches:
-            info( switch.name + ' ')
-            switch.start( self.controllers )
-        info( '\n' )
+        with phase( 'start' ):
+            if self.cpuPlan:
+                self.pinNodes()
+            info( '*** Starting controller\n' )
+            for controller in self.controllers:
+                controller.start()
+            info( '*** Starting %s switches\n' % len( self.switches ) )
+            with TCBatch():
+                for switch in self.switches:
+                    info( switch.name + ' ')
+                    switch.start( self.controllers )
+            info( '\n' )
+        self.started = True
         if self.waitConn:
             self.waitConnected()
 
+    def pinNodes( self ):
+        """Pin controller and switch shells, and so the processes they
+           start, to the cores self.cpuPlan reserved for them. Open
+           vSwitch switches do their work in the system's ovs-vswitchd
+           rather than in their shells, so if there are any we pin
+           ovs-vswitchd to the switch cores too, until stop()."""
+        plan = self.cpuPlan
+        cmds = [ 'taskset -a -p -c %s %d' % ( formatCpuList( cpus ),
+                                              node.pid )
+                 for nodes, cpus in ( ( self.controllers,
+                                        plan.controllers ),
+                                      ( self.switches, plan.switches ) )
+                 if cpus for node in nodes
+                 if node.shell and not getattr( node, 'isRemote', False ) ]
+        ovs = [ s for s in self.switches if isinstance( s, OVSSwitch ) ]
+        # Processes that do the work of switches on the switch cores
+        workers = ( [ 'switch shells' ]
+                    if len( ovs ) < len( self.switches ) else [] )
+        vswitchd = None
+        if plan.switches and ovs:
+            pids = rootCmds( [ 'pidof ovs-vswitchd' ] )[ 0 ][ 0 ].split()
+            if pids and pids[ 0 ].isdigit():
+                vswitchd = int( pids[ 0 ] )
+                workers.append( 'ovs-vswitchd' )
+                # Save its affinity first, so that stop() can restore it
+                cmds = [ 'taskset -p %d' % vswitchd,
+                         'taskset -a -p -c %s %d' % (
+                             formatCpuList( plan.switches ),
+                             vswitchd ) ] + cmds
+        results = rootCmds( cmds )
+        if vswitchd and not results[ 0 ][ 1 ]:
+            # pid 1234's current affinity mask: ff
+            self.vswitchdAffinity = ( vswitchd,
+                                      results[ 0 ][ 0 ].split()[ -1 ] )
+        if any( code for _out, code in results ):
+            warn( '*** Warning: could not pin controllers and switches '
+                  'to cores\n' )
+        if plan.switches:
+            if workers:
+                info( '*** Pinned %s to cores %s\n' % (
+                    ' and '.join( workers ), formatCpuList( plan.switches ) ) )
+            else:
+                warn( '*** Warning: ovs-vswitchd not found: cores %s, '
+                      'reserved for switches, are unused\n' %
+                      formatCpuList( plan.switches ) )
+        annotate( 'pinning', dict( plan.report(), switchWorkers=workers ) )
+
+    @usesBackend
     def stop( self ):
         "Stop the controller(s), switches and hosts"
-        info( '*** Stopping %i controllers\n' % len( self.controllers ) )
-        for controller in self.controllers:
-            info( controller.name + ' ' )
-            controller.stop()
-        info( '\n' )
-        if self.terms:
-            info( '*** Stopping %i terms\n' % len( self.terms ) )
-            self.stopXterms()
-        info( '*** Stopping %i switches\n' % len( self.switches ) )
-        for swclass, switches in groupby( sorted( self.switches, key=type ), type ):
+        with phase( 'stop' ):
+            named = [ node for node in self.controllers + self.switches +
+                      self.hosts if node.netns ]
+            if named:
+                info( '*** Removing %i named namespaces\n' % len( named ) )
+                detachNetns( [ node.netns for node in named ] )
+                for node in named:
+                    node.netns = None
+            info( '*** Stopping %i controllers\n' % len( self.controllers ) )
+            for controller in self.controllers:
+                info( controller.name + ' ' )
+                controller.stop()
+            info( '\n' )
+            if self.terms:
+                info( '*** Stopping %i terms\n' % len( self.terms ) )
+                self.stopXterms()
+            info( '*** Stopping %i switches\n' % len( self.switches ) )
+            self.stopSwitches( self.switches )
+            info( '\n' )
+            if self.vswitchdAffinity:
+                pid, mask = self.vswitchdAffinity
+                rootCmds( [ 'taskset -a -p %s %d' % ( mask, pid ) ] )
+                self.vswitchdAffinity = None
+            info( '*** Stopping %i links\n' % len( self.links ) )
+            for link in self.links:
+                link.stop()
+            info( '\n' )
+            self.reportMemory()
+            info( '*** Stopping %i hosts\n' % len( self.hosts ) )
+            for host in self.hosts:
+                info( host.name + ' ' )
+            self.terminateNodes( self.switches + self.hosts )
+            self.started = False
+            info( '\n*** Done\n' )
+
+    @usesBackend
+    def reportMemory( self, hosts=None ):
+        """Report peak memory use and OOM kills of hosts with cgroups
+           (e.g. CPULimitedHost), and add them to the build report
+           hosts: hosts to report on (default: all)
+           returns: { host name: { 'peak': bytes, 'oom': kills } }"""
+        stats = dict( ( host.name, host.memoryStats() ) for host in
+                      ( self.hosts if hosts is None else hosts )
+                      if hasattr( host, 'memoryStats' ) )
+        if not stats:
+            return stats
+        peaks = [ ( stat[ 'peak' ], name ) for name, stat in stats.iteritems()
+                  if stat[ 'peak' ] is not None ]
+        if peaks:
+            peak, name = max( peaks )
+            info( '*** Peak memory: %.1fMB max (%s), %.1fMB mean\n' % (
+                peak / 1e6, name, sum( p for p, _n in peaks ) / 1e6 /
+                len( peaks ) ) )
+        oom = sorted( ( name for name, stat in stats.iteritems()
+                        if stat[ 'oom' ] ), key=natural )
+        if oom:
+            warn( '*** Warning: out of memory kills on %d hosts: %s\n' %
+                  ( len( oom ), ' '.join( oom ) ) )
+        annotate( 'memory', stats )
+        return stats
+
+    @staticmethod
+    def stopSwitches( switches ):
+        """Stop switches, in a single batch per switch class where the
+           class supports it (batchShutdown())
+           switches: list of switches"""
+        stopped = set()
+        for swclass, group in groupby( sorted( switches, key=type ), type ):
+            group = tuple( group )
             if hasattr( swclass, 'batchShutdown' ):
-                swclass.batchShutdown( switches )
-        for switch in self.switches:
+                stopped.update( swclass.batchShutdown( group ) or () )
+        for switch in switches:
             info( switch.name + ' ' )
-            switch.stop()
-            switch.terminate()
-        info( '\n' )
-        info( '*** Stopping %i links\n' % len( self.links ) )
-        for link in self.links:
+            if switch not in stopped:
+                switch.stop( deleteIntfs=False )
+
+    @staticmethod
+    def batchPorts( ports, method ):
+        """Attach or detach data ports of running switches, in a single
+           batch per switch class where the class supports it
+           (batchAttach(), batchDetach())
+           ports: list of ( switch, intf )
+           method: 'attach' or 'detach'"""
+        def key( port ):
+            "Group ports by switch class"
+            return type( port[ 0 ] )
+
+        for swclass, group in groupby( sorted( ports, key=key ), key ):
+            group = list( group )
+            batch = getattr( swclass, 'batch' + method.capitalize(), None )
+            if batch:
+                batch( group )
+            elif hasattr( swclass, method ):
+                for switch, intf in group:
+                    getattr( switch, method )( intf )
+
+    @usesBackend
+    def delLinks( self, links ):
+        """Delete links in bulk: detach their switch ports, then delete
+           the veth pairs, deleting root namespace ends with a single
+           ip batch.
+           links: links to delete"""
+        links = list( links )
+        if self.started:
+            self.batchPorts( [ ( intf.node, intf ) for link in links
+                               for intf in ( link.intf1, link.intf2 )
+                               if isinstance( intf.node, Switch ) ], 'detach' )
+        rootIntfs = []
+        for link in links:
             link.stop()
-        info( '\n' )
-        info( '*** Stopping %i hosts\n' % len( self.hosts ) )
-        for host in self.hosts:
-            info( host.name + ' ' )
-            host.terminate()
-        info( '\n*** Done\n' )
+            intfs = link.intf1, link.intf2
+            root = [ intf for intf in intfs
+                     if not intf.node.inNamespace and
+                     not getattr( intf.node, 'isRemote', False ) ]
+            if ( root and type( link ).delete.__func__ is
+                 Link.delete.__func__ and
+                 all( type( intf ).delete.__func__ is Intf.delete.__func__
+                      for intf in intfs ) ):
+                # Deleting either end of a veth pair deletes both
+                rootIntfs.append( root[ 0 ].name )
+            else:
+                link.delete()
+            for intf in intfs:
+                intf.node.delIntf( intf )
+                if intf.mac:
+                    self.macPool.release( intf.mac )
+        deleteRootIntfs( rootIntfs )
+        doomed = set( links )
+        self.links = [ link for link in self.links if link not in doomed ]
+
+    def delLink( self, link ):
+        "Delete a link"
+        self.delLinks( [ link ] )
+
+    @usesBackend
+    def delNodes( self, nodes ):
+        """Delete nodes in bulk, along with their links
+           nodes: nodes (or names) to delete"""
+        nodes = [ self[ node ] if isinstance( node, basestring ) else node
+                  for node in nodes ]
+        doomed = set( nodes )
+        self.delLinks( self.unique( link for node in nodes
+                                    for link in self.linksOf( node ) ) )
+        controllers = set( self.controllers ) & doomed
+        for controller in controllers:
+            controller.stop()
+        switches = set( self.switches ) & doomed
+        self.stopSwitches( [ node for node in nodes if node in switches ] )
+        self.terminateNodes( [ node for node in nodes
+                               if node not in controllers ] )
+        self.hosts = [ h for h in self.hosts if h not in doomed ]
+        self.switches = [ s for s in self.switches if s not in doomed ]
+        self.controllers = [ c for c in self.controllers if c not in doomed ]
+        for node in nodes:
+            del self.nameToNode[ node.name ]
+            self.plannedHosts.discard( node )
+            # Explicit addresses that were already in use aren't ours
+            if node in self.heldIPs:
+                self.ipPool.release( self.heldIPs.pop( node ) )
+
+    @staticmethod
+    def unique( links ):
+        "Return links without duplicates, in order"
+        seen = set()
+        return [ link for link in links
+                 if link not in seen and not seen.add( link ) ]
+
+    def linksBetween( self, node1, node2 ):
+        """Return links between two nodes
+           node1, node2: nodes or names
+           returns: list of links"""
+        node1 = self[ node1 ] if isinstance( node1, basestring ) else node1
+        node2 = self[ node2 ] if isinstance( node2, basestring ) else node2
+        return self.unique( intf.link for intf, _peer
+                            in node1.connectionsTo( node2 ) )
+
+    def linksOf( self, node ):
+        """Return links of a node
+           node: node or name
+           returns: list of links"""
+        node = self[ node ] if isinstance( node, basestring ) else node
+        return self.unique( intf.link for connections
+                            in node.peers.itervalues()
+                            for intf, _peer in connections )
+
+    def topoLink( self, info ):
+        """Return the link built from topo link info, if any
+           info: link info (see Topo.linkInfo())"""
+        node1, node2, port1, port2 = linkId( info )
+        if node1 not in self or node2 not in self:
+            return None
+        for link in self.linksBetween( node1, node2 ):
+            intf1, intf2 = link.intf1, link.intf2
+            if ( intf1.node.name == node1 and
+                 intf1.node.ports.get( intf1 ) == port1 and
+                 intf2.node.ports.get( intf2 ) == port2 ):
+                return link
+        return None
+
+    def delNode( self, node ):
+        "Delete a node (or name) and its links"
+        self.delNodes( [ node ] )
+
+    def delHost( self, host ):
+        "Convenience alias for delNode"
+        self.delNode( host )
+
+    def delSwitch( self, switch ):
+        "Convenience alias for delNode"
+        self.delNode( switch )
+
+    @usesBackend
+    def apply( self, topo ):
+        """Change the network to match topo, touching only what differs
+           from the topology it was built from (self.topo): removed nodes
+           and links are deleted in bulk, new ones are added (and, if the
+           network is running, started and attached to their switches),
+           and links whose only changes are tc parameters are reshaped
+           in place (see Link.reshape()). Nodes and links that did not
+           come from self.topo (e.g. NAT) are left alone.
+           topo: new topology
+           returns: TopoDiff"""
+        diff = ( self.topo or Topo() ).diff( topo )
+        self.topo = topo
+        if not self.built or not diff:
+            return diff
+        info( '*** Applying topology changes: %s\n' % diff )
+        with phase( 'apply' ), TCBatch():
+            delLinks, addLinks = list( diff.delLinks ), list( diff.addLinks )
+            retune = []
+            for old, new in diff.changedLinks:
+                link = self.topoLink( old )
+                changed = set( key for key in set( old ) | set( new )
+                               if old.get( key ) != new.get( key ) )
+                if ( link and isinstance( link.intf1, TCIntf ) and
+                     isinstance( link.intf2, TCIntf ) and
+                     changed <= set( TCIntf.tcParams ) ):
+                    retune.append( ( link, new ) )
+                else:
+                    delLinks.append( old )
+                    addLinks.append( new )
+            self.delLinks( [ found for found in
+                             map( self.topoLink, delLinks ) if found ] )
+            self.delNodes( [ name for name in diff.delNodes
+                             if name in self.nameToNode ] )
+            hosts = [ self.addHost( name, **topo.nodeInfo( name ) )
+                      for name in diff.addNodes if not topo.isSwitch( name ) ]
+            switches = [ self.addSwitch( name, **topo.nodeInfo( name ) )
+                         for name in diff.addNodes if topo.isSwitch( name ) ]
+            added = [ self.addLink( **params ) for params in addLinks ]
+            for link, params in retune:
+                link.reshape( **dict( ( key, params.get( key ) )
+                                      for key in TCIntf.tcParams ) )
+            self.configHosts( hosts )
+            if self.started:
+                new = set( switches )
+                self.batchPorts( [ ( intf.node, intf ) for link in added
+                                   for intf in ( link.intf1, link.intf2 )
+                                   if isinstance( intf.node, Switch ) and
+                                   intf.node not in new ], 'attach' )
+                for switch in switches:
+                    switch.start( self.controllers )
+        return diff
+
+    @staticmethod
+    def terminateNodes( nodes ):
+        """Terminate nodes in bulk: signal all node shells at once,
+           then delete their leftover root namespace interfaces with a
+           single batch. Remote nodes and nodes that override
+           terminate() are terminated one at a time.
+           nodes: list of nodes to terminate"""
+        local = []
+        for node in nodes:
+            if ( getattr( node, 'isRemote', False ) or
+                 type( node ).terminate.__func__ is not
+                 Node.terminate.__func__ ):
+                node.terminate()
+            else:
+                local.append( node )
+        # Unmounting needs a live shell, so do it before signaling
+        for node in local:
+            if node.privateDirs:
+                node.unmountPrivateDirs()
+        named = [ node for node in local if node.netns ]
+        if named:
+            detachNetns( [ node.netns for node in named ] )
+            for node in named:
+                node.netns = None
+        for node in local:
+            if node.shell and node.shell.poll() is None:
+                os.killpg( node.shell.pid, signal.SIGHUP )
+        # Killing a namespace destroys its veths (and their peers),
+        # so deleteRootIntfs() only removes what is still there
+        deleteRootIntfs( [ intfName for node in local
+                           for intfName in node.intfNames()
+                           if node.name in intfName ] )
+        for node in local:
+            node.cleanup( deleteIntfs=False )
 
     def run( self, test, *args, **kwargs ):
         "Perform a complete start/test/stop cycle."
@@ -697,6 +1195,7 @@ def _parseIperf( iperfOutput ):
 
     # XXX This should be cleaned up
 
+    @usesBackend
     def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', format=None,
                seconds=5):
         """Run iperf between two hosts.
@@ -750,17 +1249,136 @@ def iperf( self, hosts=None, l4Type='TCP', udpBw='10M', format=None,
         output( '*** Results: %s\n' % result )
         return result
 
-    def runCpuLimitTest( self, cpu, duration=5 ):
+    @staticmethod
+    def _parseIperfCsv( iperfOutput ):
+        """Parse iperf -y C output.
+           iperfOutput: string
+           returns: ( Mbps, jitter in ms, loss % ) of the last report
+                    (jitter and loss are None unless it is a UDP
+                    server report)"""
+        rows = [ line.split( ',' ) for line in iperfOutput.split( '\n' )
+                 if line.count( ',' ) >= 8 ]
+        if not rows:
+            error( 'could not parse iperf output: ' + iperfOutput )
+            return 0.0, None, None
+        row = rows[ -1 ]
+        mbps = float( row[ 8 ] ) / 1e6
+        if len( row ) >= 13:
+            # ..., bits/s, jitter, lost, total, loss %[, out of order]
+            return mbps, float( row[ 9 ] ), float( row[ 12 ] )
+        return mbps, None, None
+
+    @staticmethod
+    def _waitServers( flows, proto, timeout ):
+        """Wait until the iperf servers of flows are listening, by
+           checking their namespaces' sockets rather than connecting
+           flows: list of ( client, server, port, bandwidth )
+           returns: True if all are listening within timeout seconds"""
+        pending = {}  # namespace pid (None: root) -> ports
+        for client, server, port, _bw in flows:
+            if getattr( server, 'isRemote', False ):
+                waitListening( client, server, port )
+            else:
+                pending.setdefault( server.pid if server.inNamespace
+                                    else None, set() ).add( port )
+        deadline = monotonic() + timeout
+        while pending:
+            for pid in pending.keys():
+                pending[ pid ] -= listeningPorts( pid, proto.lower() )
+                if not pending[ pid ]:
+                    del pending[ pid ]
+            if not pending:
+                break
+            if monotonic() > deadline:
+                error( '*** Error: iperf servers not listening after %ds\n'
+                       % timeout )
+                return False
+            sleep( .01 )
+        return True
+
+    @usesBackend
+    def trafficMatrix( self, pairs, seconds=5, proto='TCP', udpBw='10M',
+                       parallel=1, port=5001, timeout=10 ):
+        """Run iperf flows between many pairs of hosts at once.
+           pairs: list of ( client, server[, UDP bandwidth ] ), or traffic
+                  matrix { ( client, server ): UDP bandwidth }; hosts
+                  may be given by name
+           seconds: iperf time to transmit
+           proto: string, one of [ TCP, UDP ]
+           udpBw: UDP bandwidth of flows that don't specify one
+           parallel: parallel streams per flow (iperf -P)
+           port: first server port; flows to the same server use
+                 successive ports
+           timeout: seconds to wait for servers to start listening
+           returns: { 'mbps': aggregate Mbps, 'skew': seconds between
+                      releasing the first and the last client (closing
+                      their stdin), 'flows': [ { 'src', 'dst', 'mbps',
+                      'jitter', 'loss' } ] }, or None if the servers did
+                    not start
+           note: as with iperf(), TCP rates are the clients' send rates;
+           UDP rates, jitter and loss come from the servers' reports"""
+        if proto not in ( 'TCP', 'UDP' ):
+            raise Exception( 'Unexpected l4 type: %s' % proto )
+        if isinstance( pairs, dict ):
+            pairs = [ ( s, d, b ) for ( s, d ), b in pairs.iteritems() ]
+        flows, ports = [], {}
+        for pair in pairs:
+            src, dst = [ node if isinstance( node, Node ) else self[ node ]
+                         for node in pair[ :2 ] ]
+            ports[ dst ] = ports.get( dst, port - 1 ) + 1
+            bw = pair[ 2 ] if len( pair ) > 2 and pair[ 2 ] else udpBw
+            flows.append( ( src, dst, ports[ dst ], bw ) )
+        output( '*** Iperf: testing %s bandwidth of %d flows\n' %
+                ( proto, len( flows ) ) )
+        udpArgs = [ '-u' ] if proto == 'UDP' else []
+        servers = [ d.popen( [ 'iperf', '-s', '-p', str( p ) ] + udpArgs )
+                    for _s, d, p, _b in flows ]
+        try:
+            if not self._waitServers( flows, proto, timeout ):
+                return None
+            # Clients wait for their stdin to close, so that all of them
+            # start together
+            clients = [ s.popen(
+                [ 'sh', '-c', 'read go; exec "$@"', 'iperf', 'iperf',
+                  '-y', 'C', '-c', d.IP(), '-p', str( p ),
+                  '-t', str( seconds ), '-P', str( parallel ) ] +
+                ( udpArgs + [ '-b', str( b ) ] if udpArgs else [] ),
+                stdin=PIPE ) for s, d, p, b in flows ]
+            start = monotonic()
+            for client in clients:
+                client.stdin.close()
+            skew = monotonic() - start
+            outputs = [ client.communicate()[ 0 ] for client in clients ]
+        finally:
+            for server in servers:
+                server.terminate()
+                server.wait()
+        results = []
+        for ( src, dst, _p, _bw ), out in zip( flows, outputs ):
+            debug( 'Client output: %s\n' % out )
+            mbps, jitter, loss = self._parseIperfCsv( out )
+            results.append( { 'src': src.name, 'dst': dst.name,
+                              'mbps': mbps, 'jitter': jitter,
+                              'loss': loss } )
+        total = sum( flow[ 'mbps' ] for flow in results )
+        output( '*** Results: %.2f Mbps aggregate, %.2f Mbps per flow\n' %
+                ( total, total / max( len( results ), 1 ) ) )
+        return { 'mbps': total, 'skew': skew, 'flows': results }
+
+    @usesBackend
+    def runCpuLimitTest( self, cpu, duration=5, sampler=None ):
         """run CPU limit test with 'while true' processes.
         cpu: desired CPU fraction of each host
         duration: test duration in seconds
-        returns a single list of measured CPU fractions as floats.
+        sampler: CPUSampler for self.hosts (default: one sample/second)
+        returns a single list of measured CPU percentages as floats.
         """
-        cores = int( quietRun( 'nproc' ) )
         pct = cpu * 100
         info( '*** Testing CPU %.0f%% bandwidth limit\n' % pct )
         hosts = self.hosts
-        cores = int( quietRun( 'nproc' ) )
+        cores = numCores()
+        if sampler is None:
+            sampler = CPUSampler( hosts, interval=1, seconds=duration )
         # number of processes to run a while loop on per host
         num_procs = int( ceil( cores * cpu ) )
         pids = {}
@@ -769,28 +1387,15 @@ def runCpuLimitTest( self, cpu, duration=5 ):
             for _core in range( num_procs ):
                 h.cmd( 'while true; do a=1; done &' )
                 pids[ h ].append( h.cmd( 'echo $!' ).strip() )
-        outputs = {}
-        time = {}
-        # get the initial cpu time for each host
-        for host in hosts:
-            outputs[ host ] = []
-            with open( '/sys/fs/cgroup/cpuacct/%s/cpuacct.usage' % host, 'r' ) as f:
-                time[ host ] = float( f.read() )
-        for _ in range( 5 ):
-            sleep( 1 )
-            for host in hosts:
-                with open( '/sys/fs/cgroup/cpuacct/%s/cpuacct.usage' % host, 'r' ) as f:
-                    readTime = float( f.read() )
-                outputs[ host ].append( ( ( readTime - time[ host ] )
-                                        / 1000000000 ) / cores * 100 )
-                time[ host ] = readTime
+        sampler.run( duration )
+        sampler.stop()
         for h, pids in pids.items():
             for pid in pids:
                 h.cmd( 'kill -9 %s' % pid )
         cpu_fractions = []
-        for _host, outputs in outputs.items():
-            for pct in outputs:
-                cpu_fractions.append( pct )
+        for host in hosts:
+            cpu_fractions.extend( frac * 100 for frac in
+                                  sampler.utilization( host ) )
         output( '*** Results: %s\n' % cpu_fractions )
         return cpu_fractions
 
@@ -806,11 +1411,7 @@ def configLinkStatus( self, src, dst, status ):
         elif dst not in self.nameToNode:
             error( 'dst not in network: %s\n' % dst )
         else:
-            if type( src ) is str:
-                src = self.nameToNode[ src ]
-            if type( dst ) is str:
-                dst = self.nameToNode[ dst ]
-            connections = src.connectionsTo( dst )
+            connections = self[ src ].connectionsTo( self[ dst ] )
             if len( connections ) == 0:
                 error( 'src and dst not connected: %s %s\n' % ( src, dst) )
             for srcIntf, dstIntf in connections:
@@ -0,0 +1,145 @@
+"""
+Minimal rtnetlink client
+
+Just enough rtnetlink to list interfaces and read root qdisc
+statistics (backlog, drops, overlimits) without running ip or tc. A
+netlink socket stays in the network namespace it was opened in, so
+Netlink( pid ) briefly enters pid's namespace with setns() to open its
+socket, and can then be used from the root namespace indefinitely.
+"""
+
+import ctypes
+import os
+import socket
+import struct
+
+NETLINK_ROUTE = 0
+RTM_NEWLINK, RTM_GETLINK = 16, 18
+RTM_NEWQDISC, RTM_GETQDISC = 36, 38
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+IFLA_IFNAME = 3
+TCA_STATS2, TCA_STATS_QUEUE = 7, 3
+TC_H_ROOT = 0xFFFFFFFF
+CLONE_NEWNET = 0x40000000
+
+NLMSGHDR = struct.Struct( '=LHHLL' )  # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct( '=BxHiII' )  # family, type, index, flags, change
+TCMSG = struct.Struct( '=BxxxiLLL' )  # family, ifindex, handle, parent, info
+RTATTR = struct.Struct( '=HH' )  # len, type
+# struct gnet_stats_queue: qlen, backlog, drops, requeues, overlimits
+GNET_STATS_QUEUE = struct.Struct( '=LLLLL' )
+
+
+def setns( fd, nstype=CLONE_NEWNET ):
+    "Move the calling thread into the namespace open as fd"
+    if not hasattr( setns, 'call' ):
+        setns.call = ctypes.CDLL( None, use_errno=True ).setns
+    if setns.call( fd, nstype ) != 0:
+        errno = ctypes.get_errno()
+        raise OSError( errno, os.strerror( errno ) )
+
+def attributes( data, offset, end ):
+    "Yield ( type, offset, length ) of the rtattrs in data[ offset:end ]"
+    while offset + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from( data, offset )
+        if length < RTATTR.size:
+            return
+        # Strip NLA_F_NESTED and NLA_F_NET_BYTEORDER
+        yield kind & 0x3fff, offset + RTATTR.size, length - RTATTR.size
+        offset += ( length + 3 ) & ~3
+
+
+class Netlink( object ):
+    "rtnetlink socket in a network namespace"
+
+    def __init__( self, pid=None ):
+        "pid: process whose network namespace to use (None: ours)"
+        if pid is None:
+            self.sock = self.open()
+        else:
+            with open( '/proc/self/ns/net' ) as ours:
+                with open( '/proc/%d/ns/net' % pid ) as theirs:
+                    setns( theirs.fileno() )
+                    try:
+                        self.sock = self.open()
+                    finally:
+                        setns( ours.fileno() )
+        self.seq = 0
+
+    @staticmethod
+    def open():
+        "Return a new rtnetlink socket"
+        sock = socket.socket( socket.AF_NETLINK, socket.SOCK_RAW,
+                              NETLINK_ROUTE )
+        sock.setsockopt( socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20 )
+        sock.bind( ( 0, 0 ) )
+        return sock
+
+    def dump( self, msgType, body ):
+        """Send a dump request and yield its replies
+           msgType: request type (e.g. RTM_GETLINK)
+           body: request header (e.g. ifinfomsg)
+           yields: ( type, data, offset, end ) of each reply message"""
+        self.seq += 1
+        self.sock.send( NLMSGHDR.pack( NLMSGHDR.size + len( body ), msgType,
+                                       NLM_F_REQUEST | NLM_F_DUMP,
+                                       self.seq, 0 ) + body )
+        while True:
+            data = self.sock.recv( 1 << 16 )
+            offset = 0
+            while offset + NLMSGHDR.size <= len( data ):
+                length, kind, _flags, seq, _pid = NLMSGHDR.unpack_from(
+                    data, offset )
+                if length < NLMSGHDR.size:
+                    break
+                if seq == self.seq:
+                    if kind == NLMSG_DONE:
+                        return
+                    if kind == NLMSG_ERROR:
+                        code = -struct.unpack_from(
+                            '=i', data, offset + NLMSGHDR.size )[ 0 ]
+                        if code:
+                            raise OSError( code, os.strerror( code ) )
+                        return
+                    yield kind, data, offset + NLMSGHDR.size, offset + length
+                offset += ( length + 3 ) & ~3
+
+    def links( self ):
+        "Return { interface name: ifindex }"
+        result = {}
+        for _kind, data, offset, end in self.dump(
+                RTM_GETLINK, IFINFOMSG.pack( socket.AF_UNSPEC, 0, 0, 0, 0 ) ):
+            index = IFINFOMSG.unpack_from( data, offset )[ 2 ]
+            for kind, start, length in attributes(
+                    data, offset + IFINFOMSG.size, end ):
+                if kind == IFLA_IFNAME:
+                    name = data[ start:start + length ].rstrip( '\0' )
+                    result[ name ] = index
+                    break
+        return result
+
+    def qdiscs( self ):
+        "Return { ifindex: ( backlog, drops, overlimits ) } of root qdiscs"
+        result = {}
+        for _kind, data, offset, end in self.dump(
+                RTM_GETQDISC, TCMSG.pack( socket.AF_UNSPEC, 0, 0, 0, 0 ) ):
+            _family, index, _handle, parent, _info = TCMSG.unpack_from(
+                data, offset )
+            if parent != TC_H_ROOT:
+                continue
+            for kind, start, length in attributes(
+                    data, offset + TCMSG.size, end ):
+                if kind != TCA_STATS2:
+                    continue
+                for kind, start, _length in attributes(
+                        data, start, start + length ):
+                    if kind == TCA_STATS_QUEUE:
+                        _qlen, backlog, drops, _requeues, overlimits = (
+                            GNET_STATS_QUEUE.unpack_from( data, start ) )
+                        result[ index ] = ( backlog, drops, overlimits )
+        return result
+
+    def close( self ):
+        "Close socket"
+        self.sock.close()
@@ -53,16 +53,106 @@
 import select
 from subprocess import Popen, PIPE, STDOUT
 from operator import or_
-from time import sleep
+from collections import Mapping, MutableMapping
+from time import sleep, time
 
 from mininet.log import info, error, warn, debug
-from mininet.util import ( quietRun, errRun, errFail, moveIntf, isShellBuiltin,
-                           numCores, retry, mountCgroups )
+from mininet.instrument import record, SPAWN, CMD
+from mininet.backend import Backend
+from mininet.util import ( quietRun, errRun, moveIntf, isShellBuiltin,
+                           numCores, detachNetns,
+                           rootCmd, rootCmds, deleteRootIntfs, ipBatch )
 from mininet.moduledeps import moduleDeps, pathCheck, OVS_KMOD, OF_KMOD, TUN
-from mininet.link import Link, Intf, TCIntf
+from mininet.link import Link, Intf, TCIntf, TCBatch
+from mininet.cgroup import cgroups
+from mininet.pinning import cpuTopology, parseCpuList, formatCpuList
 from re import findall
 from distutils.version import StrictVersion
 
+
+# A node's interfaces are kept in one table, intfs ( port -> intf ),
+# with each Intf holding its own port number; ports and nameToIntf
+# are views of that table rather than dicts of their own.
+
+class PortView( Mapping ):
+    "A node's interfaces as a read-only mapping of interfaces to ports"
+
+    __slots__ = ( 'intfs', )
+
+    def __init__( self, intfs ):
+        "intfs: port table ( port -> intf )"
+        self.intfs = intfs
+
+    def __getitem__( self, intf ):
+        port = getattr( intf, 'port', None )
+        if port is None or self.intfs.get( port ) is not intf:
+            raise KeyError( intf )
+        return port
+
+    def __iter__( self ):
+        return self.intfs.itervalues()
+
+    def __len__( self ):
+        return len( self.intfs )
+
+
+class NameView( MutableMapping ):
+    """A node's interfaces as a mapping of names to interfaces. Names
+       follow the interfaces (e.g. after Intf.rename()); other names may
+       be added as aliases."""
+
+    __slots__ = ( 'node', 'aliases' )
+
+    def __init__( self, node ):
+        "node: node whose port table we view"
+        self.node = node
+        self.aliases = None  # extra names -> intfs, if any
+
+    def __getitem__( self, name ):
+        intfs = self.node.intfs
+        # Fast path for canonical names (see Link.intfName())
+        prefix = self.node.name + '-eth'
+        if name.startswith( prefix ) and name[ len( prefix ): ].isdigit():
+            intf = intfs.get( int( name[ len( prefix ): ] ) )
+            if intf is not None and intf.name == name:
+                return intf
+        if self.aliases and name in self.aliases:
+            return self.aliases[ name ]
+        for intf in intfs.itervalues():
+            if intf.name == name:
+                return intf
+        raise KeyError( name )
+
+    def __setitem__( self, name, intf ):
+        if intf.name != name:
+            if self.aliases is None:
+                self.aliases = {}
+            self.aliases[ name ] = intf
+
+    def __delitem__( self, name ):
+        "Remove an alias (an interface's own name follows the interface)"
+        if self.aliases and name in self.aliases:
+            del self.aliases[ name ]
+        elif name not in self:
+            raise KeyError( name )
+
+    def __iter__( self ):
+        for intf in self.node.intfs.itervalues():
+            yield intf.name
+        for name in self.aliases or ():
+            yield name
+
+    def __len__( self ):
+        return len( self.node.intfs ) + len( self.aliases or () )
+
+    def forget( self, intf ):
+        "Remove any aliases for intf"
+        if self.aliases:
+            for name, other in self.aliases.items():
+                if other is intf:
+                    del self.aliases[ name ]
+
+
 class Node( object ):
     """A virtual network node is simply a shell in a network namespace.
        We communicate with it using pipes."""
@@ -86,16 +176,20 @@ def __init__( self, name, inNamespace=True, **params ):
         self.params = params
 
         self.intfs = {}  # dict of port numbers to interfaces
-        self.ports = {}  # dict of interfaces to port numbers
-                         # replace with Port objects, eventually ?
-        self.nameToIntf = {}  # dict of interface names to Intfs
+        self.ports = PortView( self.intfs )  # interfaces to port numbers
+        self.nameToIntf = NameView( self )  # interface names to Intfs
+        self.peers = {}  # dict of linked nodes to [ ( intf, peer intf ) ]
+        self.lastPort = None  # highest port number allocated so far
+        self.netns = None  # name under NETNS_DIR, if bind-mounted
 
         # Make pylint happy
         ( self.shell, self.execed, self.pid, self.stdin, self.stdout,
             self.lastPid, self.lastCmd, self.pollOut ) = (
                 None, None, None, None, None, None, None, None )
         self.waiting = False
+        self.cmdStart = None  # when the pending command was sent
         self.readbuf = ''
+        self.backend = Backend.active  # None: run real processes
 
         # Start command interpreter shell
         self.startShell()
@@ -121,6 +215,12 @@ def startShell( self, mnopts=None ):
         if self.shell:
             error( "%s: shell is already running\n" % self.name )
             return
+        if self.backend is not None:
+            self.shell = self.backend.startShell( self )
+            self.pid = self.shell.pid
+            self.execed, self.lastCmd, self.lastPid = False, None, None
+            self.readbuf, self.waiting = '', False
+            return
         # mnexec: (c)lose descriptors, (d)etach from tty,
         # (p)rint pid, and run in (n)amespace
         opts = '-cd' if mnopts is None else mnopts
@@ -135,6 +235,7 @@ def startShell( self, mnopts=None ):
         # in the subprocess and insulate it from signals (e.g. SIGINT)
         # received by the parent
         master, slave = pty.openpty()
+        start = time()
         self.shell = self._popen( cmd, stdin=slave, stdout=slave, stderr=slave,
                                   close_fds=False )
         self.stdin = os.fdopen( master, 'rw' )
@@ -157,6 +258,7 @@ def startShell( self, mnopts=None ):
             if data[ -1 ] == chr( 127 ):
                 break
             self.pollOut.poll()
+        record( SPAWN, cmd, start, self )
         self.waiting = False
         self.cmd( 'stty -echo' )
         self.cmd( 'set +m' )
@@ -189,14 +291,18 @@ def _popen( self, cmd, **params ):
         """Internal method: spawn and return a process
             cmd: command to run (list)
             params: parameters to Popen()"""
+        if self.backend is not None:
+            return self.backend.popen( self, cmd, **params )
         return Popen( cmd, **params )
 
-    def cleanup( self ):
-        "Help python collect its garbage."
+    def cleanup( self, deleteIntfs=True ):
+        """Help python collect its garbage.
+           deleteIntfs: delete our interfaces left in root NS? (True)"""
         # Intfs may end up in root NS
-        for intfName in self.intfNames():
-            if self.name in intfName:
-                quietRun( 'ip link del ' + intfName )
+        if deleteIntfs:
+            rootCmds( [ 'ip link del ' + intfName
+                        for intfName in self.intfNames()
+                        if self.name in intfName ] )
         self.shell = None
 
     # Subshell I/O, commands and control
@@ -235,13 +341,19 @@ def write( self, data ):
     def terminate( self ):
         "Send kill signal to Node and clean up after it."
         self.unmountPrivateDirs()
+        if self.netns:
+            detachNetns( [ self.netns ] )
+            self.netns = None
         if self.shell:
             if self.shell.poll() is None:
                 os.killpg( self.shell.pid, signal.SIGHUP )
         self.cleanup()
 
-    def stop( self ):
-        "Stop node."
+    def stop( self, deleteIntfs=False ):
+        """Stop node.
+           deleteIntfs: delete interfaces? (False)"""
+        if deleteIntfs:
+            self.deleteIntfs()
         self.terminate()
 
     def waitReadable( self, timeoutms=None ):
@@ -270,12 +382,19 @@ def sendCmd( self, *args, **kwargs ):
             # Replace empty commands with something harmless
             cmd = 'echo -n'
         self.lastCmd = cmd
+        if self.backend is not None:
+            self.cmdStart = time()
+            self.readbuf += self.backend.nodeCmd( self, cmd )
+            self.lastPid = None
+            self.waiting = True
+            return
         # if a builtin command is backgrounded, it still yields a PID
         if len( cmd ) > 0 and cmd[ -1 ] == '&':
             # print ^A{pid}\n so monitor() can set lastPid
             cmd += ' printf "\\001%d\\012" $! '
         elif printPid and not isShellBuiltin( cmd ):
             cmd = 'mnexec -p ' + cmd
+        self.cmdStart = time()
         self.write( cmd + '\n' )
         self.lastPid = None
         self.waiting = True
@@ -290,6 +409,10 @@ def monitor( self, timeoutms=None, findPid=True ):
            Set self.waiting to False if command has completed.
            timeoutms: timeout in ms or None to wait indefinitely
            findPid: look for PID from mnexec -p"""
+        if self.backend is not None:
+            data, self.readbuf = self.readbuf, ''
+            self.waiting = False
+            return data
         self.waitReadable( timeoutms )
         data = self.read( 1024 )
         pidre = r'\[\d+\] \d+\r\n'
@@ -327,6 +450,9 @@ def waitOutput( self, verbose=False, findPid=True ):
             data = self.monitor()
             output += data
             log( data )
+        if self.cmdStart is not None:
+            record( CMD, self.lastCmd, self.cmdStart, self )
+            self.cmdStart = None
         return output
 
     def cmd( self, *args, **kwargs ):
@@ -368,7 +494,9 @@ def popen( self, *args, **kwargs ):
         # Shell requires a string, not a list!
         if defaults.get( 'shell', False ):
             cmd = ' '.join( cmd )
+        start = time()
         popen = self._popen( cmd, **defaults )
+        record( SPAWN, cmd, start, self )
         return popen
 
     def pexec( self, *args, **kwargs ):
@@ -391,8 +519,8 @@ def pexec( self, *args, **kwargs ):
 
     def newPort( self ):
         "Return the next port number to allocate."
-        if len( self.ports ) > 0:
-            return max( self.ports.values() ) + 1
+        if self.lastPort is not None:
+            return self.lastPort + 1
         return self.portBase
 
     def addIntf( self, intf, port=None, moveIntfFn=moveIntf ):
@@ -402,9 +530,14 @@ def addIntf( self, intf, port=None, moveIntfFn=moveIntf ):
            moveIntfFn: function to move interface (optional)"""
         if port is None:
             port = self.newPort()
+        intf.port = port
         self.intfs[ port ] = intf
-        self.ports[ intf ] = port
-        self.nameToIntf[ intf.name ] = intf
+        if self.lastPort is None or port > self.lastPort:
+            self.lastPort = port
+        # Moving a linked interface here (see Link for new links)
+        peer = self.peerIntf( intf )
+        if peer is not None and peer in peer.node.ports:
+            self.addConnection( intf, peer )
         debug( '\n' )
         debug( 'added intf %s (%d) to node %s\n' % (
                 intf, port, self.name ) )
@@ -412,6 +545,42 @@ def addIntf( self, intf, port=None, moveIntfFn=moveIntf ):
             debug( 'moving', intf, 'into namespace for', self.name, '\n' )
             moveIntfFn( intf.name, self  )
 
+    def delIntf( self, intf ):
+        """Forget an interface (without deleting it; see
+           Intf.delete())
+           intf: interface"""
+        if intf in self.ports:
+            del self.intfs[ intf.port ]
+            self.nameToIntf.forget( intf )
+        peer = self.peerIntf( intf )
+        if peer is not None:
+            for node, other, entry in ( ( self, peer.node, ( intf, peer ) ),
+                                        ( peer.node, self, ( peer, intf ) ) ):
+                connections = node.peers.get( other, [] )
+                if entry in connections:
+                    connections.remove( entry )
+                    if not connections:
+                        del node.peers[ other ]
+
+    @staticmethod
+    def peerIntf( intf ):
+        "Return the interface at the other end of intf's link, if any"
+        link = intf.link
+        intf1, intf2 = ( getattr( link, 'intf1', None ),
+                         getattr( link, 'intf2', None ) )
+        if intf1 is None or intf2 is None:
+            # Not linked, or link still being created
+            return None
+        return intf2 if intf is intf1 else intf1
+
+    def addConnection( self, intf, peer ):
+        """Record, on both nodes, that our intf is linked to peer
+           (see connectionsTo())
+           intf: our interface
+           peer: interface on the other end"""
+        self.peers.setdefault( peer.node, [] ).append( ( intf, peer ) )
+        peer.node.peers.setdefault( self, [] ).append( ( peer, intf ) )
+
     def defaultIntf( self ):
         "Return interface for lowest port"
         ports = self.intfs.keys()
@@ -438,18 +607,8 @@ def intf( self, intf='' ):
             return intf
 
     def connectionsTo( self, node):
-        "Return [ intf1, intf2... ] for all intfs that connect self to node."
-        # We could optimize this if it is important
-        connections = []
-        for intf in self.intfList():
-            link = intf.link
-            if link:
-                node1, node2 = link.intf1.node, link.intf2.node
-                if node1 == self and node2 == node:
-                    connections += [ ( intf, link.intf2 ) ]
-                elif node1 == node and node2 == self:
-                    connections += [ ( intf, link.intf1 ) ]
-        return connections
+        "Return [ ( intf, peer intf )... ] for all links from self to node."
+        return list( self.peers.get( node, () ) )
 
     def deleteIntfs( self, checkName=True ):
         """Delete all of our interfaces.
@@ -631,11 +790,10 @@ def __init__( self, name, sched='cfs', **kwargs ):
         if not CPULimitedHost.inited:
             CPULimitedHost.init()
         # Create a cgroup and move shell into it
-        self.cgroup = 'cpu,cpuacct,cpuset:/' + self.name
-        errFail( 'cgcreate -g ' + self.cgroup )
-        # We don't add ourselves to a cpuset because you must
-        # specify the cpu and memory placement first
-        errFail( 'cgclassify -g cpu,cpuacct:/%s %s' % ( self.name, self.pid ) )
+        self.cgroup = self.name
+        self.cgroups = cgroups()
+        self.cgroups.create( [ self.cgroup ] )
+        self.cgroups.attach( self.cgroup, [ self.pid ] )
         # BL: Setting the correct period/quota is tricky, particularly
         # for RT. RT allows very small quotas, but the overhead
         # seems to be high. CFS has a mininimum quota of 1 ms, but
@@ -648,10 +806,10 @@ def __init__( self, name, sched='cfs', **kwargs ):
 
     def cgroupSet( self, param, value, resource='cpu' ):
         "Set a cgroup parameter and return its value"
-        cmd = 'cgset -r %s.%s=%s /%s' % (
-            resource, param, value, self.name )
-        quietRun( cmd )
-        nvalue = int( self.cgroupGet( param, resource ) )
+        nvalue = self.cgroups.set( self.cgroup, '%s.%s' % ( resource, param ),
+                                   value )
+        if type( value ) is int:
+            nvalue = int( nvalue )
         if nvalue != value:
             error( '*** error: cgroupSet: %s set to %s instead of %s\n'
                    % ( param, nvalue, value ) )
@@ -659,15 +817,17 @@ def cgroupSet( self, param, value, resource='cpu' ):
 
     def cgroupGet( self, param, resource='cpu' ):
         "Return value of cgroup parameter"
-        cmd = 'cgget -r %s.%s /%s' % (
-            resource, param, self.name )
-        return int( quietRun( cmd ).split()[ -1 ] )
+        return int( self.cgroups.get( self.cgroup,
+                                      '%s.%s' % ( resource, param ) ) )
 
     def cgroupDel( self ):
-        "Clean up our cgroup"
-        # info( '*** deleting cgroup', self.cgroup, '\n' )
-        _out, _err, exitcode = errRun( 'cgdelete -r ' + self.cgroup )
-        return exitcode != 0
+        """Clean up our cgroup
+           returns: True if it was deleted"""
+        return not self.cgroups.delete( [ self.cgroup ] )
+
+    def cpuTime( self ):
+        "Return CPU time used by our cgroup, in seconds"
+        return self.cgroups.usage( self.cgroup )
 
     def popen( self, *args, **kwargs ):
         """Return a Popen() object in node's namespace
@@ -686,10 +846,11 @@ def popen( self, *args, **kwargs ):
                       'Using cfs scheduler for subprocess\n' )
         return Host.popen( self, *args, mncmd=mncmd, **kwargs )
 
-    def cleanup( self ):
+    def cleanup( self, **kwargs ):
         "Clean up Node, then clean up our cgroup"
-        super( CPULimitedHost, self ).cleanup()
-        retry( retries=3, delaySecs=1, fn=self.cgroupDel )
+        super( CPULimitedHost, self ).cleanup( **kwargs )
+        if not self.cgroupDel():
+            error( '*** error: could not delete cgroup %s\n' % self.cgroup )
 
     _rtGroupSched = False   # internal class var: Is CONFIG_RT_GROUP_SCHED set?
     
@@ -763,39 +924,65 @@ def setCPUFrac( self, f, sched=None ):
         else:
             return
         # Set cgroup's period and quota
-        setPeriod = self.cgroupSet( pstr, period )
-        setQuota = self.cgroupSet( qstr, quota )
+        if sched == 'rt':
+            setPeriod, setQuota = self.cgroups.setRT( self.cgroup, period,
+                                                      quota )
+        else:
+            setPeriod, setQuota = self.cgroups.setBandwidth( self.cgroup,
+                                                             period, quota )
+        if ( setPeriod, setQuota ) != ( period, quota ):
+            error( '*** error: setCPUFrac: %s/%s set to %s/%s instead of '
+                   '%s/%s\n' % ( qstr, pstr, setQuota, setPeriod, quota,
+                                 period ) )
         if sched == 'rt':
             # Set RT priority if necessary
             sched = self.chrt()
         info( '(%s %d/%dus) ' % ( sched, setQuota, setPeriod ) )
 
-    def setCPUs( self, cores, mems=0 ):
-        "Specify (real) cores that our cgroup can run on"
-        if not cores:
+    def setCPUs( self, cores, mems=None ):
+        """Specify (real) cores that our cgroup can run on
+           cores: core, list of cores, or list such as '0-3'
+           mems: memory nodes (default: the NUMA nodes of cores)"""
+        if cores is None or cores == '' or cores == []:
             return
-        if type( cores ) is list:
-            cores = ','.join( [ str( c ) for c in cores ] )
-        self.cgroupSet( resource='cpuset', param='cpus',
-                        value=cores )
-        # Memory placement is probably not relevant, but we
-        # must specify it anyway
-        self.cgroupSet( resource='cpuset', param='mems',
-                        value=mems)
-        # We have to do this here after we've specified
-        # cpus and mems
-        errFail( 'cgclassify -g cpuset:/%s %s' % (
-                 self.name, self.pid ) )
-
-    def config( self, cpu=-1, cores=None, **params ):
+        if mems is None:
+            mems = cpuTopology().nodesOf( cores )
+        self.cgroups.setCPUs( self.cgroup, formatCpuList(
+            parseCpuList( cores ) ), mems )
+
+    def setLimits( self, mem=None, memswap=None, pids=None ):
+        """Limit memory and processes of our cgroup (-1: unlimited)
+           mem: memory limit in bytes, or size such as '512M'
+           memswap: memory plus swap limit
+           pids: maximum number of processes"""
+        self.cgroups.limit( [ self.cgroup ], mem=mem, memswap=memswap,
+                            pids=pids )
+        info( '(%s) ' % ' '.join( '%s=%s' % ( key, value ) for key, value in
+                                  ( ( 'mem', mem ), ( 'memswap', memswap ),
+                                    ( 'pids', pids ) )
+                                  if value is not None ) )
+
+    def memoryStats( self ):
+        """Return peak memory use of our cgroup in bytes (None if the
+           kernel doesn't report it) and number of OOM kills in it
+           returns: { 'peak': bytes, 'oom': kills }"""
+        return self.cgroups.memoryStats( self.cgroup )
+
+    def config( self, cpu=-1, cores=None, mem=None, memswap=None, pids=None,
+                **params ):
         """cpu: desired overall system CPU fraction
            cores: (real) core(s) this host can run on
+           mem: memory limit in bytes, or size such as '512M'
+           memswap: memory plus swap limit
+           pids: maximum number of processes
            params: parameters for Node.config()"""
         r = Node.config( self, **params )
         # Was considering cpu={'cpu': cpu , 'sched': sched}, but
         # that seems redundant
         self.setParam( r, 'setCPUFrac', cpu=cpu )
         self.setParam( r, 'setCPUs', cores=cores )
+        if ( mem, memswap, pids ) != ( None, None, None ):
+            self.setLimits( mem=mem, memswap=memswap, pids=pids )
         return r
 
     inited = False
@@ -803,7 +990,7 @@ def config( self, cpu=-1, cores=None, **params ):
     @classmethod
     def init( cls ):
         "Initialization for CPULimitedHost class"
-        mountCgroups()
+        cgroups()
         cls.inited = True
 
 
@@ -949,12 +1136,13 @@ def TCReapply( intf ):
             # Re-add qdisc, root, and default classes user switch created, but
             # with new parent, as setup by Mininet's TCIntf
             parent = res['parent']
-            intf.tc( "%s qdisc add dev %s " + parent +
-                     " handle 1: htb default 0xfffe" )
-            intf.tc( "%s class add dev %s classid 1:0xffff parent 1: htb rate "
-                     + str(ifspeed) )
-            intf.tc( "%s class add dev %s classid 1:0xfffe parent 1:0xffff " +
-                     "htb rate " + str(minspeed) + " ceil " + str(ifspeed) )
+            intf.runTC( [ "%s qdisc add dev %s " + parent +
+                          " handle 1: htb default 0xfffe",
+                          "%s class add dev %s classid 1:0xffff parent 1: "
+                          "htb rate " + str(ifspeed),
+                          "%s class add dev %s classid 1:0xfffe parent "
+                          "1:0xffff htb rate " + str(minspeed) +
+                          " ceil " + str(ifspeed) ] )
 
     def start( self, controllers ):
         """Start OpenFlow reference user datapath.
@@ -977,15 +1165,18 @@ def start( self, controllers ):
         if "no-slicing" not in self.dpopts:
             # Only TCReapply if slicing is enable
             sleep(1) # Allow ofdatapath to start before re-arranging qdisc's
-            for intf in self.intfList():
-                if not intf.IP():
-                    self.TCReapply( intf )
-
-    def stop( self ):
-        "Stop OpenFlow reference user datapath."
+            with TCBatch():
+                for intf in self.intfList():
+                    if not intf.IP():
+                        self.TCReapply( intf )
+
+    def stop( self, deleteIntfs=True ):
+        """Stop OpenFlow reference user datapath.
+           deleteIntfs: delete interfaces? (True)"""
         self.cmd( 'kill %ofdatapath' )
         self.cmd( 'kill %ofprotocol' )
-        self.deleteIntfs()
+        if deleteIntfs:
+            self.deleteIntfs()
 
 
 class OVSLegacyKernelSwitch( Switch ):
@@ -1031,11 +1222,13 @@ def start( self, controllers ):
                   ' 1>' + ofplog + ' 2>' + ofplog + '&' )
         self.execed = False
 
-    def stop( self ):
-        "Terminate kernel datapath."
+    def stop( self, deleteIntfs=True ):
+        """Terminate kernel datapath.
+           deleteIntfs: delete interfaces? (True)"""
         quietRun( 'ovs-dpctl del-dp ' + self.dp )
         self.cmd( 'kill %ovs-openflowd' )
-        self.deleteIntfs()
+        if deleteIntfs:
+            self.deleteIntfs()
 
 
 class OVSSwitch( Switch ):
@@ -1083,10 +1276,47 @@ def isOldOVS( cls ):
 
     @classmethod
     def batchShutdown( cls, switches ):
-        "Call ovs-vsctl del-br on all OVSSwitches in a list"
-        quietRun( 'ovs-vsctl ' +
-                  ' -- '.join( '--if-exists del-br %s' % s
-                               for s in switches ) )
+        """Call ovs-vsctl del-br on all OVSSwitches in a list,
+           as a single ovsdb transaction
+           returns: switches that no longer need stop()"""
+        if not switches:
+            return []
+        rootCmd( 'ovs-vsctl ' +
+                 ' -- '.join( '--if-exists del-br %s' % s
+                              for s in switches ) )
+        deleteRootIntfs( [ s.name for s in switches
+                           if s.datapath == 'user' ] )
+        return switches
+
+    @classmethod
+    def batchAttach( cls, ports ):
+        """Add data ports to running OVSSwitches as a single ovsdb
+           transaction, requesting our port numbers
+           ports: list of ( switch, intf )"""
+        if not ports:
+            return
+        if cls.isOldOVS():
+            for switch, intf in ports:
+                switch.attach( intf )
+            return
+        rootCmd( 'ovs-vsctl ' + ' -- '.join(
+            'add-port %s %s -- set Interface %s ofport_request=%s' % (
+                switch, intf, intf, switch.ports[ intf ] )
+            for switch, intf in ports ) )
+        ipBatch( [ 'link set dev %s up' % intf for _switch, intf in ports ] )
+        with TCBatch():
+            for switch, intf in ports:
+                switch.TCReapply( intf )
+
+    @classmethod
+    def batchDetach( cls, ports ):
+        """Remove data ports from OVSSwitches as a single ovsdb
+           transaction
+           ports: list of ( switch, intf )"""
+        if ports:
+            rootCmd( 'ovs-vsctl ' + ' -- '.join(
+                '--if-exists del-port %s %s' % ( switch, intf )
+                for switch, intf in ports ) )
 
     def dpctl( self, *args ):
         "Run ovs-ofctl command"
@@ -1179,16 +1409,19 @@ def start( self, controllers ):
             cmd += '-- set Controller %smax_backoff=1000 ' % uuid
         # Do it!!
         self.cmd( cmd )
-        for intf in self.intfList():
-            self.TCReapply( intf )
+        with TCBatch():
+            for intf in self.intfList():
+                self.TCReapply( intf )
 
 
-    def stop( self ):
-        "Terminate OVS switch."
+    def stop( self, deleteIntfs=True ):
+        """Terminate OVS switch.
+           deleteIntfs: delete interfaces? (True)"""
         self.cmd( 'ovs-vsctl del-br', self )
         if self.datapath == 'user':
             self.cmd( 'ip link del', self )
-        self.deleteIntfs()
+        if deleteIntfs:
+            self.deleteIntfs()
 
 
 OVSKernelSwitch = OVSSwitch
@@ -1251,11 +1484,13 @@ def start( self, controllers ):
 
         self.cmd( ' '.join(args) + ' >' + logfile + ' 2>&1 </dev/null &' )
 
-    def stop( self ):
-        "Terminate IVS switch."
+    def stop( self, deleteIntfs=True ):
+        """Terminate IVS switch.
+           deleteIntfs: delete interfaces? (True)"""
         self.cmd( 'kill %ivs' )
         self.cmd( 'wait' )
-        self.deleteIntfs()
+        if deleteIntfs:
+            self.deleteIntfs()
 
     def attach( self, intf ):
         "Connect a data port"
@@ -42,9 +42,13 @@ def start( self, controllers ):
                 self.cmd( 'brctl addif', self, i )
         self.cmd( 'ifconfig', self, 'up' )
 
-    def stop( self ):
+    def stop( self, deleteIntfs=True ):
+        """Stop Linux bridge
+           deleteIntfs: delete interfaces? (True)"""
         self.cmd( 'ifconfig', self, 'down' )
         self.cmd( 'brctl delbr', self )
+        if deleteIntfs:
+            self.deleteIntfs()
 
 class NAT( Node ):
     """NAT: Provides connectivity to external network"""
@@ -0,0 +1,237 @@
+"""
+CPU pinning
+
+With autoPinCpus, Mininet pins each host to a core. A CPUPlan decides
+which, using the CPU topology from sysfs (CPUTopology):
+
+- A few physical cores (with their SMT siblings) are reserved for the
+  controllers and for the switches, whose processes are pinned there
+  when the network starts, so hosts don't compete with them. Open
+  vSwitch switches run in the system's ovs-vswitchd, which is pinned
+  to the switch cores until the network stops.
+- Hosts are ordered by a breadth-first walk of the emulated topology,
+  so that hosts on the same or nearby switches are consecutive, and
+  the order is split into contiguous runs, one per NUMA node, in
+  proportion to the cores each node has left. Linked hosts thus
+  mostly share a node, and veth traffic between them stays local.
+- Within a node, hosts get distinct physical cores before any SMT
+  sibling is used.
+- Each host's cpuset.mems is the NUMA node of its cores.
+
+Mininet puts the plan into the build report (see mininet.instrument).
+"""
+
+import os
+from collections import defaultdict, deque
+from glob import glob
+
+from mininet.log import info, warn
+from mininet.util import numCores
+
+
+def parseCpuList( cpus ):
+    "Return list of CPUs from a list such as '0-3,8' (or an int or list)"
+    if isinstance( cpus, ( int, long ) ):
+        return [ cpus ]
+    if not isinstance( cpus, basestring ):
+        return [ int( cpu ) for cpu in cpus ]
+    result = []
+    for part in cpus.strip().split( ',' ):
+        if '-' in part:
+            first, last = part.split( '-' )
+            result.extend( range( int( first ), int( last ) + 1 ) )
+        elif part:
+            result.append( int( part ) )
+    return result
+
+def formatCpuList( cpus ):
+    "Return a CPU list such as '0-3,8' for a list of CPUs"
+    cpus, runs = sorted( set( cpus ) ), []
+    for cpu in cpus:
+        if runs and runs[ -1 ][ 1 ] == cpu - 1:
+            runs[ -1 ][ 1 ] = cpu
+        else:
+            runs.append( [ cpu, cpu ] )
+    return ','.join( '%d' % first if first == last else '%d-%d' % (
+        first, last ) for first, last in runs )
+
+
+class CPUTopology( object ):
+    "Online CPUs with their NUMA node, package and core"
+
+    def __init__( self, cpus ):
+        "cpus: list of ( cpu, node, package, core )"
+        self.cpus = sorted( cpus )
+        self.node = dict( ( cpu[ 0 ], cpu[ 1 ] ) for cpu in self.cpus )
+
+    @classmethod
+    def read( cls, root='/sys/devices/system' ):
+        """Read the CPU topology from sysfs, assuming one node and no
+           SMT where it is missing
+           root: sysfs system devices directory"""
+        def readFile( *path ):
+            try:
+                with open( os.path.join( root, *path ) ) as f:
+                    return f.read().strip()
+            except IOError:
+                return None
+        online = readFile( 'cpu', 'online' )
+        cpus = parseCpuList( online ) if online else range( numCores() )
+        nodes = {}
+        for path in glob( os.path.join( root, 'node', 'node*', 'cpulist' ) ):
+            node = int( os.path.basename( os.path.dirname( path ) )[ 4: ] )
+            for cpu in parseCpuList( readFile( path ) or '' ):
+                nodes[ cpu ] = node
+        result = []
+        for cpu in cpus:
+            package = readFile( 'cpu', 'cpu%d' % cpu, 'topology',
+                                'physical_package_id' )
+            core = readFile( 'cpu', 'cpu%d' % cpu, 'topology', 'core_id' )
+            result.append( ( cpu, nodes.get( cpu, 0 ),
+                             int( package ) if package else 0,
+                             int( core ) if core else cpu ) )
+        return cls( result )
+
+    def nodes( self ):
+        "Return NUMA node ids"
+        return sorted( set( self.node.itervalues() ) )
+
+    def nodesOf( self, cpus ):
+        "Return NUMA nodes of cpus as a list such as '0,1'"
+        return formatCpuList( self.node.get( cpu, 0 )
+                              for cpu in parseCpuList( cpus ) )
+
+    def physicalCores( self, node ):
+        "Return physical cores of node, as lists of SMT sibling CPUs"
+        cores = defaultdict( list )
+        for cpu, cpuNode, package, core in self.cpus:
+            if cpuNode == node:
+                cores[ package, core ].append( cpu )
+        return sorted( cores.itervalues() )
+
+def cpuTopology():
+    "Return (cached) CPUTopology of this machine"
+    if not hasattr( cpuTopology, 'cached' ):
+        cpuTopology.cached = CPUTopology.read()
+    return cpuTopology.cached
+
+
+class CPUPlan( object ):
+    "Assignment of hosts, switches and controllers to CPUs"
+
+    def __init__( self, topology=None, controllerCores=1, switchCores=1 ):
+        """topology: CPUTopology (default: this machine's)
+           controllerCores: physical cores to reserve for controllers
+           switchCores: physical cores to reserve for switches"""
+        self.topology = topology or cpuTopology()
+        self.controllers, self.switches = [], []
+        self.hostCpus = {}  # NUMA node -> CPUs for hosts, in order of use
+        self.hosts = {}  # host name -> CPU
+        self.used = defaultdict( int )  # NUMA node -> hosts placed
+        self.reserve( controllerCores, switchCores )
+
+    def reserve( self, controllerCores, switchCores ):
+        "Set aside physical cores, taking them from each node in turn"
+        nodes = self.topology.nodes()
+        cores = dict( ( node, self.topology.physicalCores( node ) )
+                      for node in nodes )
+        total = sum( len( c ) for c in cores.itervalues() )
+        # Every node keeps at least one core for hosts
+        if controllerCores + switchCores > total - len( nodes ):
+            warn( '*** Warning: only %d cores: not reserving cores for '
+                  'controllers and switches\n' % total )
+            controllerCores = switchCores = 0
+        turn = 0
+        for reserved, count in ( ( self.controllers, controllerCores ),
+                                 ( self.switches, switchCores ) ):
+            for _ in range( count ):
+                # Next node that will have a core left
+                while len( cores[ nodes[ turn % len( nodes ) ] ] ) <= 1:
+                    turn += 1
+                reserved.extend( cores[ nodes[ turn % len( nodes ) ] ].pop() )
+                turn += 1
+        for node in nodes:
+            # First threads of all cores, then second threads, ...
+            siblings = cores[ node ]
+            depth = max( len( s ) for s in siblings ) if siblings else 0
+            self.hostCpus[ node ] = [ s[ i ] for i in range( depth )
+                                      for s in siblings if i < len( s ) ]
+
+    @staticmethod
+    def order( topo ):
+        "Return hosts of topo in breadth-first order over its links"
+        adjacent = defaultdict( list )
+        for src, dst in topo.iterLinks():
+            adjacent[ src ].append( dst )
+            adjacent[ dst ].append( src )
+        hosts, seen = [], set()
+        for start in topo.switches() + topo.hosts():
+            if start in seen:
+                continue
+            seen.add( start )
+            queue = deque( [ start ] )
+            while queue:
+                node = queue.popleft()
+                if not topo.isSwitch( node ):
+                    hosts.append( node )
+                # Hosts first, so that a switch's hosts are consecutive
+                for neighbor in sorted( adjacent[ node ], key=lambda n: (
+                        topo.isSwitch( n ), topo.sortKey( n ) ) ):
+                    if neighbor not in seen:
+                        seen.add( neighbor )
+                        queue.append( neighbor )
+        return hosts
+
+    def plan( self, topo ):
+        """Assign topo's hosts to CPUs
+           returns: self"""
+        hosts = self.order( topo )
+        nodes = [ node for node in self.topology.nodes()
+                  if self.hostCpus[ node ] ]
+        capacity = sum( len( self.hostCpus[ node ] ) for node in nodes )
+        start = 0
+        for i, node in enumerate( nodes ):
+            share = len( self.hostCpus[ node ] )
+            end = ( len( hosts ) if i == len( nodes ) - 1 else
+                    start + ( len( hosts ) * share + capacity - 1 ) //
+                    capacity )
+            for name in hosts[ start:end ]:
+                self.place( name, node )
+            start = end
+        info( '*** Pinning %d hosts to %d cores on %d NUMA nodes '
+              '(controllers: %s, switches: %s)\n' % (
+                  len( hosts ), capacity, len( nodes ),
+                  formatCpuList( self.controllers ) or 'any',
+                  formatCpuList( self.switches ) or 'any' ) )
+        return self
+
+    def place( self, name, node=None ):
+        """Assign a host to the next CPU on node (default: the node
+           with the fewest hosts per CPU)
+           returns: CPU"""
+        if node is None:
+            node = min( ( node for node in self.hostCpus
+                          if self.hostCpus[ node ] ),
+                        key=lambda n: float( self.used[ n ] ) /
+                        len( self.hostCpus[ n ] ) )
+        cpus = self.hostCpus[ node ]
+        self.hosts[ name ] = cpus[ self.used[ node ] % len( cpus ) ]
+        self.used[ node ] += 1
+        return self.hosts[ name ]
+
+    def cpu( self, name ):
+        "Return CPU for host name, placing it if it wasn't planned"
+        if name not in self.hosts:
+            self.place( name )
+        return self.hosts[ name ]
+
+    def report( self ):
+        "Return plan as a dict suitable for JSON"
+        return {
+            'controllers': formatCpuList( self.controllers ),
+            'switches': formatCpuList( self.switches ),
+            'nodes': dict( ( str( node ), formatCpuList( cpus ) )
+                           for node, cpus in self.hostCpus.iteritems() ),
+            'hosts': dict( ( name, { 'cpu': cpu,
+                                     'node': self.topology.node[ cpu ] } )
+                           for name, cpu in self.hosts.iteritems() ) }
@@ -0,0 +1,468 @@
+"""
+Build plans: compile a topology into explicit batches of commands
+
+Normally Mininet builds a network by calling Python methods that each
+run a shell command right away. A PlanCompiler instead turns a Topo
+and the Mininet settings (ipBase, autoSetMacs, link class and TCLink
+parameters, switch class) into a BuildPlan: an ordered set of Steps,
+each of which is a batch of commands of one kind run in one network
+namespace:
+
+- ip -batch input (namespaces, veth pairs, addresses, links up)
+- tc -batch input (bandwidth, delay and loss for TCLinks)
+- ovs-vsctl transactions (bridges and ports)
+- sh scripts (everything else, e.g. ethtool)
+
+Steps name the steps they depend on, and a PlanExecutor runs them with
+as much parallelism as the dependencies allow. Namespaces are referred
+to by name (see Mininet( namedNetns=True )), so every step runs from
+the root namespace without a round trip through any node's shell.
+
+A plan can be printed as a shell script without being root:
+
+    mn --topo fattree,4 --link tc,bw=10 --dry-run
+
+and is used by Mininet( plan=True ), which spawns nodes as usual and
+then runs the plan instead of creating and configuring links one by
+one. Since compiling depends only on the topology and the settings,
+plans may be cached under topo.fingerprint().
+"""
+
+import os
+from collections import OrderedDict
+from hashlib import sha1
+from subprocess import Popen, STDOUT
+from tempfile import TemporaryFile
+from time import sleep, time
+import re
+
+from mininet.backend import Backend
+from mininet.log import info, error
+from mininet.link import Link, TCLink, TCIntf
+from mininet.node import Host, OVSSwitch, OVSBridge, OVSKernelSwitch
+from mininet.instrument import record, SPAWN
+from mininet.topo import dumpJSON, loadJSON
+from mininet.pool import IPPool
+from mininet.util import macColonHex, numCores
+
+# Kinds of steps
+IP, TC, VSCTL, SH = 'ip', 'tc', 'ovs-vsctl', 'sh'
+
+
+class Step( object ):
+    "A batch of commands of one kind, run in one namespace"
+
+    def __init__( self, name, kind, cmds=None, netns=None, deps=(),
+                  check=True ):
+        """name: unique step name
+           kind: IP, TC, VSCTL or SH
+           cmds: commands (ip/tc batch lines, ovs-vsctl commands
+                 or shell command lines)
+           netns: named namespace to run in (None for root namespace)
+           deps: names of steps which must finish first
+           check: report errors? (False for e.g. deleting stale intfs)"""
+        self.name = name
+        self.kind = kind
+        self.cmds = cmds if cmds is not None else []
+        self.netns = netns
+        self.deps = list( deps )
+        self.check = check
+
+    def argv( self ):
+        "Return command line that runs this step"
+        if self.kind in ( IP, TC ):
+            nsopt = [ '-n', self.netns ] if self.netns else []
+            return [ self.kind ] + nsopt + [ '-force', '-batch', '-' ]
+        if self.kind == VSCTL:
+            argv = [ 'ovs-vsctl' ]
+            for cmd in self.cmds:
+                argv += [ '--' ] + cmd.split()
+            return argv
+        nsopt = [ 'ip', 'netns', 'exec', self.netns ] if self.netns else []
+        return nsopt + [ 'sh', '-s' ]
+
+    def input( self ):
+        "Return standard input for this step, or None"
+        if self.kind == VSCTL:
+            return None
+        return '\n'.join( self.cmds ) + '\n'
+
+    def script( self ):
+        "Return this step as a shell script fragment"
+        deps = ' (after %s)' % ' '.join( self.deps ) if self.deps else ''
+        lines = [ '# %s%s' % ( self.name, deps ) ]
+        argv = self.argv()
+        if self.kind == VSCTL:
+            lines.append( argv[ 0 ] + ' \\\n' + ' \\\n'.join(
+                '  -- ' + cmd for cmd in self.cmds ) )
+        else:
+            lines += [ ' '.join( argv ) + " <<'EOF'" ] + self.cmds + [ 'EOF' ]
+        return '\n'.join( lines ) + '\n'
+
+    def __repr__( self ):
+        return '<Step %s: %d %s cmds>' % ( self.name, len( self.cmds ),
+                                           self.kind )
+
+
+class BuildPlan( object ):
+    """Ordered steps plus what Mininet needs to know about the result:
+       links (constructor arguments) and host addresses"""
+
+    def __init__( self ):
+        self.steps = OrderedDict()
+        self.links = []      # ( link class, node1, node2, options )
+        self.hosts = {}      # host name -> { 'ip':, 'mac': }
+        self.unplanned = []  # topo links that must be built by Python
+        self.key = None      # cache key, if any
+
+    def add( self, name, kind, cmds=None, netns=None, deps=(),
+             check=True ):
+        """Add a step, or return the existing step called name
+           returns: Step"""
+        step = self.steps.get( name )
+        if step is None:
+            step = self.steps[ name ] = Step( name, kind, cmds, netns, deps,
+                                              check )
+        return step
+
+    def prune( self ):
+        "Remove empty steps (and dependencies on them)"
+        empty = set( name for name, step in self.steps.iteritems()
+                     if not step.cmds )
+        for name in empty:
+            del self.steps[ name ]
+        for step in self.steps.itervalues():
+            step.deps = [ dep for dep in step.deps if dep not in empty ]
+
+    def script( self ):
+        "Return the plan as a (serial) shell script"
+        header = ( '#!/bin/sh\n# Mininet build plan: %d steps, %d commands\n'
+                   % ( len( self.steps ), self.count() ) )
+        if self.unplanned:
+            header += '# %d links are built by Python:\n' % len(
+                self.unplanned ) + ''.join(
+                '#   %s %s\n' % ( opts[ 'node1' ], opts[ 'node2' ] )
+                for opts in self.unplanned )
+        return header + '\n'.join( step.script()
+                                   for step in self.steps.itervalues() )
+
+    def count( self ):
+        "Return total number of commands"
+        return sum( len( step.cmds ) for step in self.steps.itervalues() )
+
+    def save( self, path ):
+        "Save plan as JSON"
+        data = { 'key': self.key, 'hosts': self.hosts,
+                 'links': self.links, 'unplanned': self.unplanned,
+                 'steps': [ ( s.name, s.kind, s.cmds, s.netns, s.deps,
+                              s.check )
+                            for s in self.steps.itervalues() ] }
+        with open( path, 'w' ) as f:
+            f.write( dumpJSON( data ) )
+
+    @staticmethod
+    def load( path ):
+        "Load plan saved with save()"
+        with open( path ) as f:
+            data = loadJSON( f.read() )
+        plan = BuildPlan()
+        for name, kind, cmds, netns, deps, check in data[ 'steps' ]:
+            plan.add( name, kind, cmds, netns, deps, check )
+        plan.links = [ tuple( link ) for link in data[ 'links' ] ]
+        plan.hosts = data[ 'hosts' ]
+        plan.unplanned = data[ 'unplanned' ]
+        plan.key = data[ 'key' ]
+        return plan
+
+
+def unwrap( constructor ):
+    """Return class and params of constructor, which may be
+       a class or a custom()/customConstructor() function"""
+    return ( getattr( constructor, 'cls', constructor ),
+             dict( getattr( constructor, 'params', {} ) ) )
+
+def issub( cls, parent ):
+    "Is cls a class and a subclass of parent?"
+    return isinstance( cls, type ) and issubclass( cls, parent )
+
+
+class PlanCompiler( object ):
+    "Compile a Topo and Mininet settings into a BuildPlan"
+
+    def __init__( self, topo, switch=OVSKernelSwitch, host=Host, link=Link,
+                  ipBase='10.0.0.0/8', autoSetMacs=False,
+                  inNamespace=False ):
+        """topo: Topo
+           switch, host, link: default classes (or custom constructors)
+           ipBase, autoSetMacs, inNamespace: as for Mininet()"""
+        self.topo = topo
+        self.switch = switch
+        self.host = host
+        self.link = link
+        self.ipBase = ipBase
+        self.autoSetMacs = autoSetMacs
+        self.inNamespace = inNamespace
+
+    def key( self ):
+        "Return cache key for topology and settings"
+        settings = [ unwrap( c ) for c in self.switch, self.host, self.link ]
+        settings += [ self.ipBase, self.autoSetMacs, self.inNamespace ]
+        return sha1( self.topo.fingerprint() +
+                     dumpJSON( settings ) ).hexdigest()
+
+    def compile( self, cacheDir=None ):
+        """Compile (or load from cacheDir) a build plan
+           cacheDir: directory for cached plans (optional)
+           returns: BuildPlan"""
+        path = None
+        if cacheDir:
+            key = self.key()
+            path = os.path.join( cacheDir, key + '.plan' )
+            if os.path.exists( path ):
+                return BuildPlan.load( path )
+        plan = self.build()
+        if path:
+            plan.key = key
+            if not os.path.isdir( cacheDir ):
+                os.makedirs( cacheDir )
+            plan.save( path )
+        return plan
+
+    def nodeClass( self, name ):
+        "Return node class and default params for node name"
+        info = self.topo.nodeInfo( name )
+        if 'cls' in info:
+            return unwrap( info[ 'cls' ] )
+        return unwrap( self.switch if self.topo.isSwitch( name )
+                       else self.host )
+
+    def linkOptions( self, opts ):
+        """Return link class and constructor options for topo link
+           options, or None if the link can't be planned"""
+        opts = dict( opts )
+        for name in 'node1', 'node2':
+            opts.pop( name, None )
+        cls, params = unwrap( opts.pop( 'cls', None ) or self.link )
+        opts.update( params )
+        if cls not in ( Link, TCLink ):
+            return None
+        if cls is Link and set( opts ) & set( ( 'intf', 'cls1', 'cls2' ) ):
+            return None
+        return cls, opts
+
+    def build( self ):
+        "Compile the plan"
+        topo, plan = self.topo, BuildPlan()
+        netns = {}
+        for name in topo.nodes():
+            cls, params = self.nodeClass( name )
+            params.update( topo.nodeInfo( name ) )
+            default = not topo.isSwitch( name ) or self.inNamespace
+            netns[ name ] = ( name if params.get( 'inNamespace', default )
+                              else None )
+        # Host addresses, as assigned by Mininet.addHost()
+        pool = IPPool( self.ipBase )
+        for name in topo.hosts():
+            params = topo.nodeInfo( name )
+            ip, _held = pool.assign( params )
+            # Addresses outside ipBase keep their link end's MAC
+            mac = params.get( 'mac', pool.mac( ip )
+                              if self.autoSetMacs and ip else None )
+            plan.hosts[ name ] = { 'ip': ip, 'mac': mac }
+        # Links, with interface names, MACs and per-end params
+        ends = {}   # node -> [ ( port, intf, params, opts, end, tc ) ]
+        for n, ( node1, node2, opts ) in enumerate(
+                topo.links( sort=True, withInfo=True ) ):
+            planned = self.linkOptions( opts )
+            if planned is None:
+                plan.unplanned.append( opts )
+                continue
+            cls, opts = planned
+            for i, node in ( 1, node1 ), ( 2, node2 ):
+                port = opts[ 'port%d' % i ]
+                opts.setdefault( 'intfName%d' % i,
+                                 '%s-eth%d' % ( node, port ) )
+                # Locally administered, unique per link end
+                opts.setdefault( 'addr%d' % i,
+                                 macColonHex( 0x020000000000 | 2 * n + i ) )
+                if cls is TCLink:
+                    params = dict( opts )
+                else:
+                    params = dict( opts.get( 'params%d' % i ) or {} )
+                ends.setdefault( node, [] ).append(
+                    ( port, opts[ 'intfName%d' % i ], params, opts, i,
+                      cls is TCLink ) )
+            plan.links.append( ( cls, node1, node2, opts ) )
+        # Hosts' default (lowest port) interfaces get the host's addresses
+        for name, addrs in plan.hosts.iteritems():
+            if name in ends:
+                _port, _intf, params, opts, i, _tc = min( ends[ name ] )
+                params[ 'ip' ] = addrs[ 'ip' ]
+                if addrs[ 'mac' ]:
+                    opts[ 'addr%d' % i ] = addrs[ 'mac' ]
+        self.addSteps( plan, netns, ends )
+        plan.prune()
+        return plan
+
+    def addSteps( self, plan, netns, ends ):
+        "Add namespace, link, address, tc and switch steps"
+        nsStep = plan.add( 'netns', IP )
+        nsStep.cmds += [ 'netns add ' + ns for ns in sorted(
+            set( netns.itervalues() ) - set( [ None ] ) ) ]
+        # Delete any old root namespace intfs with the same names
+        stale = plan.add( 'stale', IP, check=False )
+        links = plan.add( 'links', IP, deps=[ 'netns', 'stale' ] )
+        for _cls, node1, node2, opts in plan.links:
+            cmd = 'link add'
+            for i, node in ( 1, node1 ), ( 2, node2 ):
+                intf, ns = opts[ 'intfName%d' % i ], netns[ node ]
+                if not ns:
+                    stale.cmds.append( 'link del dev ' + intf )
+                cmd += ' name %s address %s%s%s' % (
+                    intf, opts[ 'addr%d' % i ], ' netns %s' % ns if ns else '',
+                    ' type veth peer' if i == 1 else '' )
+            links.cmds.append( cmd )
+        for node in sorted( ends, key=self.topo.sortKey ):
+            ns = netns[ node ]
+            suffix = ns or 'root'
+            ip = plan.add( 'ip:' + suffix, IP, netns=ns, deps=[ 'links' ] )
+            tc = plan.add( 'tc:' + suffix, TC, netns=ns, deps=[ 'links' ] )
+            sh = plan.add( 'sh:' + suffix, SH, netns=ns, deps=[ 'links' ] )
+            if ns:
+                ip.cmds.append( 'link set lo up' )
+            for _port, intf, params, _opts, _i, isTC in sorted( ends[ node ] ):
+                if params.get( 'ip' ):
+                    ip.cmds.append( 'addr add %s dev %s' % (
+                        params[ 'ip' ], intf ) )
+                ip.cmds.append( 'link set %s up' % intf )
+                if not isTC:
+                    continue
+                if params.get( 'disable_gro', True ):
+                    sh.cmds.append( 'ethtool -K %s gro off' % intf )
+                cmds, _parent = TCIntf.tcCmds( nodeName=node, **params )
+                tc.cmds += [ ( line % ( '', intf ) ).strip()
+                             for line in cmds ]
+        self.addSwitches( plan, ends )
+
+    def addSwitches( self, plan, ends ):
+        "Add one ovs-vsctl transaction for all OVS switches"
+        step = plan.add( 'switches', VSCTL, deps=[ 'links' ] )
+        for name in self.topo.switches():
+            cls, params = self.nodeClass( name )
+            if not issub( cls, OVSSwitch ):
+                continue
+            params.update( self.topo.nodeInfo( name ) )
+            # As in Switch.defaultDpid()
+            nums = re.findall( r'\d+', name )
+            dpid = params.get( 'dpid' ) or '%x' % int(
+                nums[ 0 ] if nums else 0 )
+            failMode = ( 'standalone' if issub( cls, OVSBridge )
+                         else params.get( 'failMode', 'secure' ) )
+            step.cmds += [
+                '--if-exists del-br %s' % name,
+                'add-br %s' % name,
+                'set Bridge %s other_config:datapath-id=%016x' % (
+                    name, int( dpid.replace( ':', '' ), 16 ) ),
+                'set-fail-mode %s %s' % ( name, failMode ) ]
+            for port, intf, _params, _opts, _i, _tc in sorted(
+                    ends.get( name, [] ) ):
+                step.cmds += [ 'add-port %s %s' % ( name, intf ),
+                               'set Interface %s ofport_request=%s' % (
+                                   intf, port ) ]
+
+
+class PlanExecutor( object ):
+    """Run a BuildPlan, starting each step as soon as the steps it
+       depends on have finished"""
+
+    def __init__( self, plan, maxProcs=None, skip=() ):
+        """plan: BuildPlan
+           maxProcs: maximum concurrent steps (default: 2 * cores)
+           skip: names of steps to skip (treated as done)"""
+        self.plan = plan
+        self.maxProcs = maxProcs or 2 * numCores()
+        self.skip = set( skip )
+        self.results = OrderedDict()   # step name -> ( exitcode, output )
+        self.backend = Backend.active
+
+    def start( self, step ):
+        "Start a step: returns Popen and output file"
+        if self.backend is not None:
+            return self.backend.popen( None, step.argv() ), TemporaryFile()
+        stdin = None
+        data = step.input()
+        if data is not None:
+            stdin = TemporaryFile()
+            stdin.write( data )
+            stdin.seek( 0 )
+        output = TemporaryFile()
+        popen = Popen( step.argv(), stdin=stdin, stdout=output,
+                       stderr=STDOUT, close_fds=True )
+        if stdin:
+            stdin.close()
+        return popen, output
+
+    def run( self ):
+        """Run all steps
+           returns: True if every step succeeded"""
+        steps = self.plan.steps
+        waiting = dict( ( name, set( dep for dep in step.deps
+                                     if dep in steps ) )
+                        for name, step in steps.iteritems() )
+        dependents = dict( ( name, [] ) for name in steps )
+        for name, deps in waiting.iteritems():
+            for dep in deps:
+                dependents[ dep ].append( name )
+        ready = [ name for name, deps in waiting.iteritems() if not deps ]
+        running = {}
+        delay = .001
+        while ready or running:
+            while ready and len( running ) < self.maxProcs:
+                name = ready.pop( 0 )
+                del waiting[ name ]
+                if name in self.skip:
+                    self.results[ name ] = ( 0, '' )
+                    ready += self.finish( name, waiting, dependents )
+                    continue
+                running[ name ] = self.start( steps[ name ] ) + ( time(), )
+            done = [ n for n, ( popen, _out, _start )
+                     in running.iteritems() if popen.poll() is not None ]
+            if not done:
+                sleep( delay )
+                delay = min( delay * 2, .05 )
+                continue
+            delay = .001
+            for name in done:
+                popen, output, start = running.pop( name )
+                output.seek( 0 )
+                self.results[ name ] = ( popen.returncode, output.read() )
+                output.close()
+                record( SPAWN, steps[ name ].argv(), start )
+                ready += self.finish( name, waiting, dependents )
+        failed = [ ( name, out ) for name, ( code, out )
+                   in self.results.iteritems()
+                   if ( code or out ) and steps[ name ].check ]
+        for name, out in failed:
+            error( '*** Error in build step %s:\n%s' % ( name, out ) )
+        return not failed
+
+    @staticmethod
+    def finish( name, waiting, dependents ):
+        "Mark step name done: returns steps that are now ready"
+        ready = []
+        for other in dependents[ name ]:
+            deps = waiting[ other ]
+            deps.discard( name )
+            if not deps:
+                ready.append( other )
+        return ready
+
+
+def dryRun( topo, **settings ):
+    """Print the build plan for topo as a shell script
+       settings: PlanCompiler settings"""
+    plan = PlanCompiler( topo, **settings ).compile()
+    info( '*** Build plan: %d steps, %d commands\n' % (
+        len( plan.steps ), plan.count() ) )
+    print plan.script()
+    return plan
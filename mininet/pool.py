@@ -0,0 +1,261 @@
+"""
+Address pools
+
+Mininet allocates host IP addresses and link MAC addresses from pools
+(Mininet.ipPool and Mininet.macPool) rather than from counters, so
+that the addresses of deleted hosts and links are reused, and so that
+blocks of addresses can be carved out for pods, racks or servers:
+
+    pod = net.ipPool.subnet( 16 )
+    net.addHost( 'h1', ip=pod.allocate() )
+
+Each pool keeps a bitmap of the values in use (up to the highest value
+handed out) and a free list of released values, so allocate() and
+release() take constant time, and 16M addresses in use take 2MB.
+Released values are reused oldest first.
+"""
+
+import random
+from collections import deque
+
+from mininet.util import ipStr, ipParse, netParse, macColonHex
+
+
+class Pool( object ):
+    "Pool of integers in [ start, end ) with O(1) get and put"
+
+    def __init__( self, base, start, end ):
+        """base: value of bit 0 of the bitmap (e.g. network address)
+           start: first value to hand out
+           end: one more than the last value to hand out"""
+        self.base, self.start, self.end = base, start, end
+        self.next = start  # lowest value not yet handed out in order
+        self.used = bytearray()  # bitmap of values in use, from base
+        self.free = deque()  # released values
+        self.subnets = []  # [ ( start, end, child pool ) ] carved out
+        self.count = 0  # values in use (including carved blocks)
+
+    def inUse( self, value ):
+        "Is value allocated, reserved or carved out?"
+        i = value - self.base
+        return ( i >> 3 < len( self.used ) and
+                 bool( self.used[ i >> 3 ] & ( 1 << ( i & 7 ) ) ) )
+
+    def mark( self, value, inUse=True ):
+        "Mark value as in use (or not)"
+        i = value - self.base
+        if i >> 3 >= len( self.used ):
+            self.used.extend( bytearray( ( i >> 3 ) + 1 - len( self.used ) ) )
+        if inUse:
+            self.used[ i >> 3 ] |= 1 << ( i & 7 )
+            self.count += 1
+        else:
+            self.used[ i >> 3 ] &= ~( 1 << ( i & 7 ) ) & 0xff
+            self.count -= 1
+
+    def child( self, value ):
+        "Return the carved-out pool containing value, if any"
+        for start, end, pool in self.subnets:
+            if start <= value < end:
+                return pool
+        return None
+
+    def get( self ):
+        "Hand out a free value"
+        while self.free:
+            value = self.free.popleft()
+            if not self.inUse( value ):
+                self.mark( value )
+                return value
+        used = self.used
+        while self.next < self.end:
+            i = self.next - self.base
+            if i >> 3 >= len( used ):
+                break
+            if not i & 7 and used[ i >> 3 ] == 0xff:
+                self.next += 8
+            elif used[ i >> 3 ] & ( 1 << ( i & 7 ) ):
+                self.next += 1
+            else:
+                break
+        if self.next >= self.end:
+            raise Exception( '%s is exhausted' % self )
+        value = self.next
+        self.next += 1
+        self.mark( value )
+        return value
+
+    def put( self, value ):
+        """Return value to the pool (or to the carved-out pool it
+           belongs to)
+           returns: True if value was in use"""
+        pool = self.child( value )
+        if pool is not None:
+            return pool.put( value )
+        if not self.start <= value < self.end or not self.inUse( value ):
+            return False
+        self.mark( value, False )
+        self.free.append( value )
+        return True
+
+    def take( self, value ):
+        """Mark a value chosen elsewhere as in use, e.g. an address
+           given explicitly
+           returns: True if value was free"""
+        pool = self.child( value )
+        if pool is not None:
+            return pool.take( value )
+        if not self.start <= value < self.end or self.inUse( value ):
+            return False
+        self.mark( value )
+        return True
+
+    def carve( self, size ):
+        """Set aside an aligned block of values
+           size: block size (a power of two)
+           returns: first value of block"""
+        begin = ( max( self.next, self.start ) + size - 1 ) // size * size
+        while begin + size <= self.end:
+            i, j = begin - self.base, begin + size - self.base
+            if size >= 8 and not i & 7:
+                busy = any( self.used[ i >> 3: j >> 3 ] )
+            else:
+                busy = any( self.inUse( v ) for v in
+                            xrange( begin, begin + size ) )
+            if not busy:
+                break
+            begin += size
+        else:
+            raise Exception( '%s has no free block of %d' % ( self, size ) )
+        if size >= 8 and not i & 7:
+            if j >> 3 > len( self.used ):
+                self.used.extend( bytearray( ( j >> 3 ) - len( self.used ) ) )
+            self.used[ i >> 3: j >> 3 ] = '\xff' * ( size >> 3 )
+            self.count += size
+        else:
+            for value in xrange( begin, begin + size ):
+                self.mark( value )
+        return begin
+
+    def __len__( self ):
+        "Number of values in use"
+        return self.count
+
+    def __repr__( self ):
+        return '<%s %d-%d>' % ( self.__class__.__name__, self.start,
+                                self.end - 1 )
+
+
+class IPPool( Pool ):
+    """Pool of IP addresses in a network, e.g. IPPool( '10.0.0.0/8' ).
+       The network and broadcast addresses are never handed out."""
+
+    def __init__( self, ipBase='10.0.0.0/8', prefixLen=None ):
+        """ipBase: network, as address/prefix length
+           prefixLen: prefix length of allocated addresses (default:
+                      ipBase's; subnets use their parent's)"""
+        base, baseLen = netParse( ipBase )
+        size = 1 << ( 32 - baseLen )
+        base &= ~( size - 1 ) & 0xffffffff
+        Pool.__init__( self, base, base + 1, base + size - 1 )
+        self.baseLen = baseLen
+        self.prefixLen = baseLen if prefixLen is None else prefixLen
+
+    @staticmethod
+    def num( ip ):
+        "Return IP address (with or without prefix length) as an int"
+        return ipParse( ip.split( '/' )[ 0 ] )
+
+    def allocate( self ):
+        "Return a free address as address/prefix length"
+        return '%s/%d' % ( ipStr( self.get() ), self.prefixLen )
+
+    def release( self, ip ):
+        """Return an address to the pool
+           returns: True if it was in use"""
+        return self.put( self.num( ip ) )
+
+    def reserve( self, ip ):
+        """Mark an address chosen elsewhere as in use
+           returns: True if it was free"""
+        return self.take( self.num( ip ) )
+
+    def offset( self, ip ):
+        "Return the host part of an address"
+        return self.num( ip ) - self.base
+
+    def mac( self, ip ):
+        """Return the MAC address autoSetMacs derives from ip (its host
+           part), or None if ip is not one of our host addresses"""
+        value = self.num( ip )
+        if self.start <= value < self.end:
+            return macColonHex( value - self.base )
+        return None
+
+    def assign( self, params ):
+        """Return a host's address as Mininet.addHost() assigns it:
+           params[ 'ip' ] if given (reserving it), else a free one
+           params: host params
+           returns: address, and whether we hold it for the host (not
+                    if it was already in use or isn't one of ours)"""
+        if 'ip' in params:
+            ip = params[ 'ip' ]
+            return ip, bool( ip ) and self.reserve( ip )
+        return self.allocate(), True
+
+    def subnet( self, prefixLen ):
+        """Carve out a block of addresses, e.g. for a pod or a server
+           prefixLen: prefix length of the block
+           returns: IPPool for the block; its addresses keep our
+                    prefix length, and releasing them here returns
+                    them to it"""
+        if prefixLen <= self.baseLen:
+            raise Exception( 'subnet: /%d is not smaller than %s' %
+                             ( prefixLen, self ) )
+        begin = self.carve( 1 << ( 32 - prefixLen ) )
+        pool = IPPool( '%s/%d' % ( ipStr( begin ), prefixLen ),
+                       prefixLen=self.prefixLen )
+        self.subnets.append( ( begin, begin + ( 1 << ( 32 - prefixLen ) ),
+                               pool ) )
+        return pool
+
+    def __repr__( self ):
+        return '<IPPool %s/%d>' % ( ipStr( self.base ), self.baseLen )
+
+
+class MACPool( Pool ):
+    """Pool of locally administered unicast MAC addresses: a random
+       16-bit prefix (so that separate networks are unlikely to clash)
+       followed by a 32-bit counter, so addresses never collide within
+       a pool"""
+
+    def __init__( self, prefix=None ):
+        "prefix: first two bytes of addresses (default: random)"
+        if prefix is None:
+            prefix = random.randint( 0, 0xffff )
+        # Set the locally administered bit, clear the multicast bit
+        prefix = prefix & 0xfeff | 0x0200
+        base = prefix << 32
+        Pool.__init__( self, base, base + 1, base + ( 1 << 32 ) )
+
+    @staticmethod
+    def num( mac ):
+        "Return MAC address as an int"
+        return int( mac.replace( ':', '' ), 16 )
+
+    def allocate( self ):
+        "Return a free MAC address"
+        return macColonHex( self.get() )
+
+    def release( self, mac ):
+        """Return an address to the pool
+           returns: True if it was in use"""
+        return self.put( self.num( mac ) )
+
+    def reserve( self, mac ):
+        """Mark an address chosen elsewhere as in use
+           returns: True if it was free"""
+        return self.take( self.num( mac ) )
+
+    def __repr__( self ):
+        return '<MACPool %s/16>' % macColonHex( self.base )
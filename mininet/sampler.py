@@ -0,0 +1,351 @@
+"""
+CPU and interface sampling
+
+A CPUSampler reads the CPU usage counters of a set of hosts' cgroups
+(see mininet.cgroup; cgroup v1 or v2) at a fixed interval, up to about
+100 Hz, and keeps the samples in a RingBuffer:
+
+    sampler = CPUSampler( net.hosts, interval=.01 )
+    sampler.start()
+    ... run experiment ...
+    sampler.stop()
+    print sampler.utilization( h1 )  # fraction of machine per interval
+    print sampler.stats()
+
+The counters are kept open and all read in one pass per sample, and
+samples go into a single preallocated array, so sampling thousands of
+hosts costs no allocation beyond the row being read. The buffer holds
+the most recent samples (by default, a minute's worth).
+
+An IntfSampler does the same for the interfaces of a set of nodes:
+
+    sampler = IntfSampler( net.hosts + net.switches, interval=.1 )
+    sampler.start()
+    ... run experiment ...
+    sampler.stop()
+    print sampler.linkSeries( net.links[ 0 ] )
+    sampler.export( 'links.csv' )  # or .json
+
+For each namespace, it keeps /proc/<pid>/net/dev open (the interface
+counters of /sys/class/net/*/statistics, all in one file) and an
+rtnetlink socket (see mininet.netlink) for root qdisc statistics, so
+sampling spawns no processes, and costs two reads per namespace.
+"""
+
+import csv
+import json
+import math
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+from mininet.backend import Backend
+from mininet.netlink import Netlink
+from mininet.util import monotonic, waitUntil, numCores
+
+
+class RingBuffer( object ):
+    "Fixed number of rows of floats, in one preallocated array"
+
+    def __init__( self, width, capacity ):
+        """width: values per row
+           capacity: rows kept (older rows are overwritten)"""
+        self.width, self.capacity = width, capacity
+        self.data = array( 'd', [ 0.0 ] ) * ( width * capacity )
+        self.count = 0  # rows appended so far
+
+    def append( self, row ):
+        "Add a row, overwriting the oldest if full"
+        start = ( self.count % self.capacity ) * self.width
+        self.data[ start:start + self.width ] = array( 'd', row )
+        self.count += 1
+
+    def __len__( self ):
+        return min( self.count, self.capacity )
+
+    def column( self, j ):
+        "Return column j, oldest row first"
+        width, data = self.width, self.data
+        if self.count <= self.capacity:
+            return data[ j:self.count * width:width ].tolist()
+        split = ( self.count % self.capacity ) * width
+        return ( data[ split + j::width ] + data[ j:split:width ] ).tolist()
+
+    def row( self, i ):
+        "Return row i (negative: from the newest)"
+        if i < 0:
+            i += len( self )
+        if not 0 <= i < len( self ):
+            raise IndexError( 'row %d out of range' % i )
+        start = ( self.count - len( self ) + i ) % self.capacity
+        start *= self.width
+        return self.data[ start:start + self.width ].tolist()
+
+
+class Sampler( object ):
+    """Periodic samples of counters, in a RingBuffer whose column 0 is
+       the sample time; subclasses implement read() and close()"""
+
+    def __init__( self, width, interval, seconds ):
+        """width: counters per sample
+           interval: seconds between samples
+           seconds: how much history to keep"""
+        self.interval = interval
+        self.buffer = RingBuffer( width + 1, int( seconds / interval ) + 1 )
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def read( self ):
+        "Return current counter values"
+        raise Exception( 'read: should be overriden in subclass', self )
+
+    def close( self ):
+        "Release counters"
+        pass
+
+    def sample( self ):
+        "Take a sample now"
+        now = monotonic()
+        self.buffer.append( [ now ] + self.read() )
+
+    def run( self, duration ):
+        """Take samples every interval for duration seconds (plus one
+           at the start)"""
+        start, tick = monotonic(), 0
+        while ( tick * self.interval <= duration + 1e-9 and
+                not self.stopping.is_set() ):
+            waitUntil( start + tick * self.interval )
+            self.sample()
+            tick += 1
+
+    def start( self, duration=None ):
+        """Sample in the background until stop() (or for duration
+           seconds)"""
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, args=( duration if duration is not None
+                                    else float( 'inf' ), ) )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop( self ):
+        "Stop background sampling and close counters"
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.close()
+
+    def intervals( self, j ):
+        """Return ( end time, seconds, change in column j, value at end )
+           for each interval between samples"""
+        times, values = self.buffer.column( 0 ), self.buffer.column( j )
+        return [ ( times[ i ], times[ i ] - times[ i - 1 ],
+                   values[ i ] - values[ i - 1 ], values[ i ] )
+                 for i in range( 1, len( times ) )
+                 if times[ i ] > times[ i - 1 ] ]
+
+
+class CPUSampler( Sampler ):
+    "Periodic samples of hosts' cgroup CPU usage"
+
+    def __init__( self, hosts, interval=.01, seconds=60 ):
+        """hosts: hosts with cgroups (e.g. CPULimitedHost)
+           interval: seconds between samples
+           seconds: how much history to keep"""
+        self.hosts = list( hosts )
+        self.column = dict( ( host, j ) for j, host in
+                            enumerate( self.hosts, 1 ) )
+        self.cores = numCores()
+        self.counters = None
+        if self.hosts:
+            self.counters = self.hosts[ 0 ].cgroups.counters(
+                [ host.cgroup for host in self.hosts ] )
+        Sampler.__init__( self, len( self.hosts ), interval, seconds )
+
+    def read( self ):
+        return self.counters.read() if self.counters else []
+
+    def close( self ):
+        if self.counters:
+            self.counters.close()
+
+    def utilization( self, host ):
+        """Return host's CPU use in each interval, as a fraction of the
+           whole machine"""
+        return [ used / seconds / self.cores for _time, seconds, used, _total
+                 in self.intervals( self.column[ host ] ) ]
+
+    def stats( self ):
+        """Return summary statistics of each host's utilization
+           returns: { host name: { 'mean', 'min', 'max', 'stdev',
+                                   'samples' } }"""
+        result = {}
+        for host in self.hosts:
+            series = self.utilization( host )
+            if not series:
+                continue
+            mean = sum( series ) / len( series )
+            result[ host.name ] = {
+                'mean': mean, 'min': min( series ), 'max': max( series ),
+                'stdev': math.sqrt( sum( ( x - mean ) ** 2 for x in series )
+                                    / len( series ) ),
+                'samples': len( series ) }
+        return result
+
+
+def parseNetDev( text ):
+    """Parse /proc/net/dev
+       returns: { intf name: ( rxBytes, rxPackets, rxDropped, txBytes,
+                               txPackets, txDropped ) }"""
+    result = {}
+    # Skip the two header lines
+    for line in text.split( '\n' )[ 2: ]:
+        name, _, data = line.partition( ':' )
+        fields = data.split()
+        if len( fields ) >= 12:
+            result[ name.strip() ] = (
+                int( fields[ 0 ] ), int( fields[ 1 ] ), int( fields[ 3 ] ),
+                int( fields[ 8 ] ), int( fields[ 9 ] ), int( fields[ 11 ] ) )
+    return result
+
+
+class IntfSampler( Sampler ):
+    "Periodic samples of interface and root qdisc counters"
+
+    fields = ( 'rxBytes', 'rxPackets', 'rxDropped', 'txBytes', 'txPackets',
+               'txDropped', 'backlog', 'qdrops', 'overlimits' )
+
+    def __init__( self, nodes, interval=1, seconds=60, qdiscs=True ):
+        """nodes: nodes whose interfaces to sample
+           interval: seconds between samples
+           seconds: how much history to keep
+           qdiscs: also sample root qdisc statistics"""
+        nodes = list( nodes )
+        # Read counters through the backend the nodes were created with
+        self.backend = nodes[ 0 ].backend if nodes else Backend.active
+        self.intfs = []
+        self.column = {}  # intf -> column of its first field
+        # [ ( net/dev path, fd, Netlink, ifindexes, intf names ) ]
+        self.namespaces = []
+        groups = OrderedDict()  # namespace pid (None: root) -> intfs
+        for node in nodes:
+            if getattr( node, 'isRemote', False ):
+                continue
+            groups.setdefault( node.pid if node.inNamespace else None,
+                               [] ).extend( intf for intf in node.intfList()
+                                            if intf.name != 'lo' )
+        for pid, intfs in groups.iteritems():
+            path = '/proc/%d/net/dev' % pid if pid else '/proc/net/dev'
+            fd, netlink, indexes = None, None, {}
+            if not self.backend:
+                fd = os.open( path, os.O_RDONLY )
+                if qdiscs:
+                    netlink = Netlink( pid )
+                    indexes = netlink.links()
+            names = [ intf.name for intf in intfs ]
+            self.namespaces.append( ( path, fd, netlink, [
+                indexes.get( name ) for name in names ], names ) )
+            width = len( self.fields )
+            for intf in intfs:
+                self.column[ intf ] = 1 + len( self.intfs ) * width
+                self.intfs.append( intf )
+        Sampler.__init__( self, len( self.intfs ) * len( self.fields ),
+                          interval, seconds )
+
+    def readFile( self, path, fd ):
+        "Return contents of path, from fd if it is open"
+        if fd is None:
+            return self.backend.readFile( path )
+        os.lseek( fd, 0, 0 )
+        chunks = []
+        while True:
+            chunk = os.read( fd, 1 << 16 )
+            if not chunk:
+                return ''.join( chunks )
+            chunks.append( chunk )
+
+    def read( self ):
+        row, noDev, noQueue = [], ( 0, ) * 6, ( 0, 0, 0 )
+        for path, fd, netlink, indexes, names in self.namespaces:
+            counters = parseNetDev( self.readFile( path, fd ) )
+            queues = netlink.qdiscs() if netlink else {}
+            for name, index in zip( names, indexes ):
+                row.extend( counters.get( name, noDev ) )
+                row.extend( queues.get( index, noQueue ) )
+        return row
+
+    def close( self ):
+        for _path, fd, netlink, _indexes, _names in self.namespaces:
+            if fd is not None:
+                os.close( fd )
+            if netlink:
+                netlink.close()
+
+    def series( self, intf, field ):
+        "Return intervals() of counter field of intf"
+        return self.intervals( self.column[ intf ] +
+                               self.fields.index( field ) )
+
+    def linkSeries( self, link ):
+        """Return throughput, drops and backlog of each direction of link
+           in each interval
+           returns: { 'intf1->intf2': { 'time': seconds since first sample,
+                      'mbps': [...], 'drops': [...], 'backlog': [...] },
+                      'intf2->intf1': ... }"""
+        result = OrderedDict()
+        start = self.buffer.row( 0 )[ 0 ] if len( self.buffer ) else 0
+        for src, dst in ( link.intf1, link.intf2 ), ( link.intf2, link.intf1 ):
+            if src not in self.column or dst not in self.column:
+                continue
+            # What dst received is what the link delivered
+            received = self.series( dst, 'rxBytes' )
+            drops = zip( self.series( src, 'qdrops' ),
+                         self.series( src, 'txDropped' ),
+                         self.series( dst, 'rxDropped' ) )
+            result[ '%s->%s' % ( src, dst ) ] = {
+                'time': [ time - start for time, _s, _c, _v in received ],
+                'mbps': [ change * 8 / seconds / 1e6
+                          for _t, seconds, change, _v in received ],
+                'drops': [ sum( counter[ 2 ] for counter in counters )
+                           for counters in drops ],
+                'backlog': [ value for _t, _s, _c, value in
+                             self.series( src, 'backlog' ) ] }
+        return result
+
+    def links( self ):
+        "Return links of sampled interfaces"
+        links, seen = [], set()
+        for intf in self.intfs:
+            link = getattr( intf, 'link', None )
+            if link and id( link ) not in seen:
+                seen.add( id( link ) )
+                links.append( link )
+        return links
+
+    def export( self, filename, links=None, fmt=None ):
+        """Write linkSeries() of links as CSV (one row per direction and
+           interval) or JSON
+           links: links to export (default: links())
+           fmt: 'csv' or 'json' (default: from filename)"""
+        series = OrderedDict()
+        for link in self.links() if links is None else links:
+            series.update( self.linkSeries( link ) )
+        if fmt is None:
+            fmt = 'json' if filename.endswith( '.json' ) else 'csv'
+        with open( filename, 'w' ) as f:
+            if fmt == 'json':
+                json.dump( { 'interval': self.interval, 'links': series }, f )
+                return
+            writer = csv.writer( f )
+            writer.writerow( [ 'time', 'src', 'dst', 'mbps', 'drops',
+                               'backlog' ] )
+            for direction, columns in series.iteritems():
+                src, dst = direction.split( '->' )
+                for time, mbps, drops, backlog in zip(
+                        columns[ 'time' ], columns[ 'mbps' ],
+                        columns[ 'drops' ], columns[ 'backlog' ] ):
+                    writer.writerow( [ '%.6f' % time, src, dst,
+                                       '%.6f' % mbps, int( drops ),
+                                       int( backlog ) ] )
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+benchmem.py: measure the memory used by Mininet's Python-side link
+bookkeeping (Link and Intf objects, interface params, node port
+tables), using FakeBackend so that no interfaces are created.
+
+usage: benchmem.py [links...] [--link Link|TCLink]
+
+For each count, adds that many host-switch links (48 per switch) to a
+network and prints the bytes of Python objects reachable from the
+network per link, and per host/switch pair for the nodes alone.
+"""
+
+import gc
+import sys
+from optparse import OptionParser
+from types import ModuleType, FunctionType, BuiltinFunctionType
+
+from mininet.net import Mininet
+from mininet.backend import Backend, FakeBackend
+from mininet.link import Link, TCLink
+from mininet.log import setLogLevel
+
+
+def deepSize( root, exclude=() ):
+    """Return the total size of objects reachable from root, counting
+       shared objects once and skipping classes, modules and functions
+       exclude: objects (and their referents) to skip"""
+    seen = set( id( obj ) for obj in exclude )
+    stack = [ root ]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id( obj ) in seen or isinstance(
+                obj, ( type, ModuleType, FunctionType,
+                       BuiltinFunctionType ) ):
+            continue
+        seen.add( id( obj ) )
+        total += sys.getsizeof( obj )
+        stack.extend( gc.get_referents( obj ) )
+    return total
+
+def bench( links, link=Link, fanout=48 ):
+    """Add links (and their nodes) to an unbuilt network
+       returns: bytes per link, bytes per link for nodes alone"""
+    backend = FakeBackend( record=False )
+    net = Mininet( backend=backend, build=False, link=link )
+    params = { 'bw': 10, 'delay': '1ms' } if link is TCLink else {}
+    exclude = [ backend, Backend ]
+    start = deepSize( net, exclude )
+    switches = [ net.addSwitch( 's%d' % i )
+                 for i in range( 1, links / fanout + 2 ) ]
+    hosts = [ net.addHost( 'h%d' % i ) for i in range( 1, links + 1 ) ]
+    nodes = deepSize( net, exclude )
+    for i, host in enumerate( hosts ):
+        net.addLink( host, switches[ i / fanout ], **params )
+    end = deepSize( net, exclude )
+    return ( end - nodes ) / float( links ), ( nodes - start ) / float( links )
+
+def main():
+    "Run benchmarks"
+    parser = OptionParser( usage=__doc__.strip().split( '\n' )[ 4 ] )
+    parser.add_option( '--link', default='Link' )
+    options, args = parser.parse_args()
+    link = { 'Link': Link, 'TCLink': TCLink }[ options.link ]
+    setLogLevel( 'warning' )
+    print '%8s %12s %12s' % ( 'links', 'bytes/link', 'bytes/node' )
+    for count in [ int( arg ) for arg in args ] or [ 1000, 100000 ]:
+        perLink, perNode = bench( count, link )
+        print '%8d %12.0f %12.0f' % ( count, perLink, perNode )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+benchscale.py: measure the Python-side cost of building, starting and
+stopping large networks, using FakeBackend so that no processes,
+namespaces or interfaces are created (and root is not required).
+
+usage: benchscale.py [nodes...] [--topo linear|tree|fattree|jellyfish]
+                     [--json FILE]
+
+For each size, prints wall time per phase (from mininet.instrument) and
+the number of commands that would have been run. Track these numbers
+across changes to catch anything that scales worse than linearly.
+"""
+
+import gc
+import json
+import sys
+from optparse import OptionParser
+from time import time
+
+from mininet.net import Mininet
+from mininet.backend import FakeBackend
+from mininet.instrument import startProfiling, stopProfiling
+from mininet.topo import LinearTopo, CompactMultiGraph
+from mininet.topolib import TreeTopo, FatTreeTopo, JellyfishTopo
+from mininet.log import setLogLevel
+
+
+def makeTopo( kind, nodes ):
+    "Return a topology of the given kind with roughly nodes nodes"
+    if kind == 'linear':
+        # n switches with one host each
+        return LinearTopo( max( nodes / 2, 1 ), graph=CompactMultiGraph )
+    if kind == 'tree':
+        # fanout 10: 10^d hosts + (10^d - 1)/9 switches
+        depth = 1
+        while 10 ** ( depth + 1 ) * 10 / 9 <= nodes:
+            depth += 1
+        return TreeTopo( depth, 10, graph=CompactMultiGraph )
+    if kind == 'fattree':
+        # k^3/4 hosts + 5k^2/4 switches
+        k = 2
+        while ( k + 2 ) ** 3 / 4 + 5 * ( k + 2 ) ** 2 / 4 <= nodes:
+            k += 2
+        return FatTreeTopo( k, graph=CompactMultiGraph )
+    if kind == 'jellyfish':
+        # one host per switch
+        return JellyfishTopo( max( nodes / 2, 8 ), 4, 1, seed=1,
+                              graph=CompactMultiGraph )
+    raise Exception( 'unknown topology %s' % kind )
+
+def bench( topo ):
+    "Build, start and stop topo on a FakeBackend: returns results dict"
+    backend = FakeBackend( record=False )
+    gc.collect()
+    start = time()
+    profiler = startProfiling()
+    net = Mininet( topo, backend=backend )
+    net.start()
+    net.stop()
+    stopProfiling()
+    phases = dict( ( p[ 'name' ], p[ 'seconds' ] )
+                   for p in profiler.report()[ 'phases' ] )
+    return { 'nodes': len( topo.nodes() ), 'links': len( topo.links() ),
+             'seconds': time() - start, 'phases': phases,
+             'commands': sum( backend.counts.itervalues() ) }
+
+def main():
+    "Run benchmarks"
+    parser = OptionParser( usage=__doc__.strip().split( '\n' )[ 4 ] )
+    parser.add_option( '--topo', default='linear' )
+    parser.add_option( '--json', default=None, metavar='FILE' )
+    options, args = parser.parse_args()
+    sizes = [ int( arg ) for arg in args ] or [ 1000, 10000, 100000 ]
+    setLogLevel( 'warning' )
+    results = []
+    print '%8s %8s %9s %9s %9s %9s %9s %9s' % (
+        'nodes', 'links', 'total', 'hosts', 'switches', 'links', 'start',
+        'stop' )
+    for size in sizes:
+        result = bench( makeTopo( options.topo, size ) )
+        results.append( result )
+        phases = result[ 'phases' ]
+        print '%8d %8d %9.2f %9.2f %9.2f %9.2f %9.2f %9.2f' % (
+            result[ 'nodes' ], result[ 'links' ], result[ 'seconds' ],
+            phases.get( 'hosts', 0 ), phases.get( 'switches', 0 ),
+            phases.get( 'links', 0 ), phases.get( 'start', 0 ),
+            phases.get( 'stop', 0 ) )
+        sys.stdout.flush()
+    if options.json:
+        with open( options.json, 'w' ) as f:
+            json.dump( results, f, indent=1, sort_keys=True )
+
+
+if __name__ == '__main__':
+    main()
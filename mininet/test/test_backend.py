@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test building networks on FakeBackend (no root or network needed)."""
+
+import socket
+import unittest
+
+from mininet.net import Mininet
+from mininet.backend import Backend, FakeBackend
+from mininet.topo import LinearTopo
+from mininet.node import CPULimitedHost
+from mininet.link import TCLink
+from mininet.timeline import Timeline
+from mininet.pool import IPPool
+from mininet.util import custom, numCores, listeningPorts
+from mininet.log import setLogLevel
+
+
+class testFakeBackend( unittest.TestCase ):
+    "Build, start and stop networks without running anything"
+
+    def testLinear( self ):
+        "Interfaces, addresses and bridges should be tracked"
+        net = Mininet( LinearTopo( 3, 2 ), backend=FakeBackend )
+        backend = net.backend
+        self.assertTrue( Backend.active is None )
+        net.start()
+        h1 = net.get( 'h1s1' )
+        self.assertEqual( h1.IP(), '10.0.0.1' )
+        self.assertEqual( backend.location[ 'h1s1-eth0' ], h1.pid )
+        self.assertEqual( backend.bridges, set( [ 's1', 's2', 's3' ] ) )
+        net.stop()
+        self.assertTrue( Backend.active is None )
+        self.assertEqual( backend.bridges, set() )
+        self.assertTrue( any( 'add-br s1' in cmd
+                              for _node, cmd in backend.log ) )
+
+    def testScope( self ):
+        "A network's backend should be active only while it works"
+        net1 = Mininet( LinearTopo( 2 ), backend=FakeBackend )
+        net2 = Mininet( LinearTopo( 2 ), backend=FakeBackend )
+        count = len( net2.backend.log )
+        net1.start()
+        self.assertEqual( len( net2.backend.log ), count )
+        self.assertTrue( any( 'add-br s1' in cmd
+                              for _node, cmd in net1.backend.log ) )
+        net1.stop()
+        net2.stop()
+
+        def broken( *_args, **_kwargs ):
+            "Host class that fails"
+            raise Exception( 'broken host' )
+        self.assertRaises( Exception, Mininet, LinearTopo( 2 ),
+                           host=broken, backend=FakeBackend )
+        self.assertTrue( Backend.active is None )
+
+    def testLinkIndex( self ):
+        "Links should be found by node pair and node without scanning"
+        net = Mininet( LinearTopo( 3, 1 ), backend=FakeBackend )
+        s1, s2, h1 = net.get( 's1', 's2', 'h1' )
+        link = net.addLink( s1, s2 )
+        self.assertEqual( len( net.linksBetween( 's2', 's1' ) ), 2 )
+        self.assertTrue( net.linksBetween( s1, s2 )[ -1 ] is link )
+        self.assertEqual( len( net.linksOf( s1 ) ), 3 )
+        self.assertEqual( s1.connectionsTo( h1 ),
+                          [ ( s1.intf( 's1-eth1' ), h1.intf() ) ] )
+        self.assertEqual( s1.newPort(), 4 )
+        net.delLink( link )
+        self.assertEqual( len( net.linksBetween( s1, s2 ) ), 1 )
+        self.assertEqual( s1.newPort(), 4 )
+        # Moving an interface (as in examples/mobility.py)
+        intf = s1.intf( 's1-eth1' )
+        s1.delIntf( intf )
+        s2.addIntf( intf, port=9 )
+        self.assertEqual( net.linksBetween( s1, h1 ), [] )
+        self.assertEqual( net.linksBetween( h1, s2 ), [ intf.link ] )
+        net.stop()
+
+    def testPortTable( self ):
+        "ports and nameToIntf are views of each node's port table"
+        net = Mininet( LinearTopo( 2, 1, lopts={ 'cls': TCLink, 'bw': 10 } ),
+                       backend=FakeBackend )
+        s1, h1 = net.get( 's1', 'h1' )
+        intf = s1.intf( 's1-eth2' )
+        self.assertEqual( s1.ports[ intf ], 2 )
+        self.assertEqual( len( s1.ports ), len( s1.intfs ) )
+        self.assertFalse( h1.intf() in s1.ports )
+        intf.rename( 'uplink' )
+        self.assertTrue( s1.intf( 'uplink' ) is intf )
+        self.assertFalse( 's1-eth2' in s1.nameToIntf )
+        s1.nameToIntf[ 'alias' ] = intf
+        self.assertTrue( s1.intf( 'alias' ) is intf )
+        # Both ends of both links share one params dict
+        self.assertTrue( s1.intf( 's1-eth1' ).params is intf.params )
+        self.assertFalse( hasattr( intf, '__dict__' ) )
+        net.stop()
+
+    def testTCBatch( self ):
+        "tc configuration should run as one batch per namespace"
+        net = Mininet( LinearTopo( 2, 1, lopts={ 'cls': TCLink, 'bw': 10 } ),
+                       backend=FakeBackend )
+        log = net.backend.log
+        self.assertEqual( [ node for node, cmd in log
+                            if 'mn-tc-' in cmd ],
+                          [ 'h1', 's1', 'h2' ] )
+        self.assertEqual( len( [ cmd for _node, cmd in log
+                                 if cmd.startswith( 'tc -force -batch' ) ] ),
+                          3 )
+        self.assertFalse( any( 'qdisc show' in cmd for _node, cmd in log ) )
+        net.stop()
+
+    def testReshape( self ):
+        "reshape() should change existing qdiscs and classes in place"
+        net = Mininet( LinearTopo( 2, 1, lopts={ 'cls': TCLink, 'bw': 10,
+                                                 'delay': '5ms' } ),
+                       backend=FakeBackend )
+        log = net.backend.log
+        link = net.linksBetween( 'h1', 's1' )[ 0 ]
+        del log[ : ]
+        self.assertTrue( link.reshape( bw=20, delay='10ms', loss=1 ) )
+        cmds = [ cmd for _node, cmd in log if cmd.startswith( 'class' ) or
+                 cmd.startswith( 'qdisc' ) ]
+        self.assertEqual( len( cmds ), 4 )
+        self.assertTrue( all( ' change ' in cmd for cmd in cmds ) )
+        self.assertTrue( 'netem delay 10ms loss 1' in cmds[ 1 ] )
+        self.assertEqual( link.intf1.params[ 'bw' ], 20 )
+        self.assertTrue( link.intf1.params is link.intf2.params )
+        # Removing the bandwidth limit needs a new root qdisc
+        del log[ : ]
+        self.assertFalse( link.reshape( bw=None ) )
+        self.assertFalse( 'bw' in link.intf1.params )
+        self.assertTrue( any( cmd.startswith( 'qdisc replace' )
+                              for _node, cmd in log ) )
+        # Adding a delay keeps the 5: htb root but adds a netem qdisc,
+        # so the old tree must go before the new root replaces it
+        link.reshape( bw=10, delay=None, loss=None )
+        del log[ : ]
+        self.assertFalse( link.reshape( delay='5ms' ) )
+        cmds = [ cmd for node, cmd in log if node == 'h1' and
+                 cmd.split()[ 0 ] in ( 'qdisc', 'class' ) ]
+        self.assertEqual( [ ' '.join( cmd.split()[ :7 ] ) for cmd in cmds ],
+                          [ 'qdisc replace dev h1-eth0 root pfifo',
+                            'qdisc replace dev h1-eth0 root handle 5:0',
+                            'class add dev h1-eth0 parent 5:0 classid',
+                            'qdisc add dev h1-eth0 parent 5:1 handle' ] )
+        net.stop()
+
+    def testTimeline( self ):
+        "Timeline events due in the same tick should share a batch"
+        net = Mininet( LinearTopo( 2, 1, lopts={ 'cls': TCLink, 'bw': 10 } ),
+                       backend=FakeBackend )
+        log = net.backend.log
+        del log[ : ]
+        timeline = Timeline( net, [ ( 0, 's1', 's2', 'down' ),
+                                    ( .001, 'h1', 's1', 'bw', 5 ),
+                                    ( .05, 's1', 's2', 'up' ) ] )
+        entries = timeline.run()
+        self.assertEqual( [ entry[ 4 ] for entry in entries ],
+                          [ 'down', 'bw', 'up' ] )
+        # The first two events share a tick
+        self.assertEqual( entries[ 0 ][ 1 ], entries[ 1 ][ 1 ] )
+        self.assertTrue( entries[ 2 ][ 1 ] >= .05 )
+        cmds = [ cmd for _node, cmd in log ]
+        self.assertEqual( len( [ cmd for cmd in cmds
+                                 if cmd.startswith( 'ip -force -batch' ) ] ),
+                          2 )
+        self.assertTrue( 'link set dev s1-eth2 down' in cmds )
+        self.assertEqual( net.get( 'h1' ).intf().params[ 'bw' ], 5 )
+        net.stop()
+
+    def testTimelineErrors( self ):
+        "Bad events should be refused, and not stop the rest of a tick"
+        net = Mininet( LinearTopo( 2, 1 ), backend=FakeBackend )
+        log = net.backend.log
+        timeline = Timeline( net )
+        self.assertRaises( Exception, timeline.add, 0, 'h1', 's1', 'bw', 5 )
+        self.assertRaises( Exception, timeline.add, 0, 'h1', 's2', 'down' )
+        self.assertRaises( Exception, timeline.add, 0, 'h1', 'x9', 'down' )
+        del log[ : ]
+        timeline.apply( [ ( 0, 'h1', 's1', 'bw', 5 ),
+                          ( 0, 's1', 's2', 'down', None ) ] )
+        self.assertTrue( 'link set dev s1-eth2 down' in
+                         [ cmd for _node, cmd in log ] )
+        net.stop()
+
+    def testCgroups( self ):
+        "CPULimitedHost should write cgroupfs files directly"
+        net = Mininet( LinearTopo( 2, 1 ), backend=FakeBackend,
+                       host=custom( CPULimitedHost, cpu=.25 ) )
+        backend = net.backend
+        h1 = net.get( 'h1' )
+        files = backend.files
+        self.assertEqual( files[ '/sys/fs/cgroup/h1/cgroup.procs' ],
+                          str( h1.pid ) )
+        quota, period = files[ '/sys/fs/cgroup/h1/cpu.max' ].split()
+        self.assertEqual( int( quota ), int( period ) * numCores() / 4 )
+        h1.setCPUs( [ 0, 1 ] )
+        self.assertEqual( files[ '/sys/fs/cgroup/h1/cpuset.cpus' ], '0-1' )
+        h1.setLimits( mem='512M', memswap='1G', pids=-1 )
+        self.assertEqual( files[ '/sys/fs/cgroup/h1/memory.max' ],
+                          str( 512 << 20 ) )
+        self.assertEqual( files[ '/sys/fs/cgroup/h1/memory.swap.max' ],
+                          str( 512 << 20 ) )
+        self.assertEqual( files[ '/sys/fs/cgroup/h1/pids.max' ], 'max' )
+        files[ '/sys/fs/cgroup/h1/memory.events' ] = 'low 0\noom_kill 2\n'
+        stats = net.reportMemory()
+        self.assertEqual( stats[ 'h1' ], { 'peak': None, 'oom': 2 } )
+        net.stop()
+        self.assertEqual( backend.dirs, set() )
+        self.assertFalse( any( cmd.startswith( 'cg' )
+                               for _node, cmd in backend.log ) )
+
+    def testAddresses( self ):
+        "Only addresses the pools hold for nodes should be released"
+        net = Mininet( backend=FakeBackend )
+        h1 = net.addHost( 'h1', ip='10.0.0.5/8' )
+        h2 = net.addHost( 'h2', ip='10.0.0.5/8' )
+        # addr1=None means no MAC
+        net.addLink( h1, h2, addr1=None )
+        net.delNodes( [ h2 ] )
+        self.assertTrue( net.ipPool.inUse( IPPool.num( '10.0.0.5' ) ) )
+        net.delNodes( [ h1 ] )
+        self.assertFalse( net.ipPool.inUse( IPPool.num( '10.0.0.5' ) ) )
+        net.stop()
+
+    def testApply( self ):
+        "apply() should change only what differs"
+        topo = LinearTopo( 3, 1, lopts={ 'cls': TCLink, 'bw': 10 } )
+        net = Mininet( topo, backend=FakeBackend )
+        backend = net.backend
+        net.start()
+        h1 = net.get( 'h1' )
+        new = LinearTopo( 2, 1, lopts={ 'cls': TCLink, 'bw': 10 } )
+        new.addHost( 'h4' )
+        new.addLink( 'h4', 's2' )
+        new.setlinkInfo( 'h1', 's1', dict( new.linkInfo( 'h1', 's1' ),
+                                           bw=5 ) )
+        del backend.log[ : ]
+        net.apply( new )
+        self.assertTrue( net.get( 'h1' ) is h1 )
+        self.assertEqual( sorted( net ), [ 'c0', 'h1', 'h2', 'h4',
+                                           's1', 's2' ] )
+        self.assertEqual( len( net.links ), 4 )
+        self.assertEqual( h1.intf().params[ 'bw' ], 5 )
+        self.assertFalse( 'h3-eth0' in backend.location )
+        self.assertTrue( 's3' not in backend.bridges )
+        cmds = [ cmd for _node, cmd in backend.log ]
+        self.assertTrue( any( 'add-port s2 s2-eth3' in cmd for cmd in cmds ) )
+        self.assertFalse( any( 'add-br s1' in cmd for cmd in cmds ) )
+        # h3's address is reused
+        self.assertEqual( net.get( 'h4' ).IP(), '10.0.0.3' )
+        net.stop()
+
+
+class testTrafficMatrix( unittest.TestCase ):
+    "Helpers of Mininet.trafficMatrix()"
+
+    def testParseIperfCsv( self ):
+        "TCP client and UDP server reports should parse"
+        tcp = '20240101000000,10.0.0.1,5001,10.0.0.2,5001,3,0.0-5.0,' \
+              '6250000,10000000\n'
+        self.assertEqual( Mininet._parseIperfCsv( tcp ), ( 10, None, None ) )
+        udp = tcp + '20240101000000,10.0.0.2,5001,10.0.0.1,5001,3,' \
+            '0.0-5.0,5000000,8000000,0.125,10,100,10.000,0\n'
+        self.assertEqual( Mininet._parseIperfCsv( udp ), ( 8, .125, 10 ) )
+
+    def testListeningPorts( self ):
+        "A listening socket should be found in /proc"
+        sock = socket.socket()
+        sock.bind( ( '127.0.0.1', 0 ) )
+        sock.listen( 1 )
+        self.assertTrue( sock.getsockname()[ 1 ] in listeningPorts() )
+        sock.close()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -12,6 +12,7 @@
 from mininet.link import TCLink
 from mininet.topo import Topo
 from mininet.log import setLogLevel
+from mininet.sampler import CPUSampler
 from mininet.util import quietRun
 
 # Number of hosts for each test
@@ -93,11 +94,14 @@ def testCPULimits( self ):
                       host=CPULimitedHost, switch=self.switchClass,
                       waitConnected=True )
         mn.start()
-        results = mn.runCpuLimitTest( cpu=CPU_FRACTION )
+        sampler = CPUSampler( mn.hosts, interval=.5 )
+        results = mn.runCpuLimitTest( cpu=CPU_FRACTION, sampler=sampler )
         mn.stop()
-        hostUsage = '\n'.join( 'h%s: %s' %
-                               ( n + 1, results[ ( n - 1 ) * 5: ( n * 5 ) - 1 ] )
-                               for n in range( N ) )
+        hostUsage = '\n'.join(
+            '%s: mean %.1f%%, min %.1f%%, max %.1f%%, stdev %.1f%%' % (
+                name, stats[ 'mean' ] * 100, stats[ 'min' ] * 100,
+                stats[ 'max' ] * 100, stats[ 'stdev' ] * 100 )
+            for name, stats in sorted( sampler.stats().items() ) )
         hoptsStr = ', '.join( '%s: %s' % ( opt, value )
                               for opt, value in hopts.items() )
         msg = ( '\nTesting cpu limited to %d%% of cpu per host\n'
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test NUMA-aware CPU pinning plans (no root needed)."""
+
+import unittest
+
+from mininet.pinning import ( CPUTopology, CPUPlan, parseCpuList,
+                              formatCpuList )
+from mininet.topo import LinearTopo
+from mininet.log import setLogLevel
+
+
+def twoSockets():
+    "Two NUMA nodes of 4 cores with 2 SMT threads each (cpus 0-15)"
+    return CPUTopology( [ ( cpu, cpu % 8 // 4, cpu % 8 // 4, cpu % 4 )
+                          for cpu in range( 16 ) ] )
+
+
+class testPinning( unittest.TestCase ):
+    "Plan host placement on a synthetic two-socket machine"
+
+    def testCpuLists( self ):
+        "CPU lists should round-trip"
+        self.assertEqual( parseCpuList( '0-2,8' ), [ 0, 1, 2, 8 ] )
+        self.assertEqual( formatCpuList( [ 8, 0, 2, 1 ] ), '0-2,8' )
+
+    def testPlan( self ):
+        "Neighbors share a node; cores before SMT siblings"
+        topology = twoSockets()
+        self.assertEqual( topology.physicalCores( 0 )[ 0 ], [ 0, 8 ] )
+        plan = CPUPlan( topology ).plan( LinearTopo( 4, 3 ) )
+        # One core (both threads) reserved for each
+        self.assertEqual( ( plan.controllers, plan.switches ),
+                          ( [ 3, 11 ], [ 7, 15 ] ) )
+        node = topology.node
+        # Hosts on the same switch are on the same node
+        for s in 1, 2, 3, 4:
+            self.assertEqual( len( set( node[ plan.hosts[ 'h%ss%d' % (
+                h, s ) ] ] for h in ( 1, 2, 3 ) ) ), 1 )
+        self.assertEqual( node[ plan.hosts[ 'h1s1' ] ], 0 )
+        self.assertEqual( node[ plan.hosts[ 'h1s4' ] ], 1 )
+        # Physical cores first
+        self.assertEqual( [ plan.hosts[ 'h%ds1' % h ] for h in 1, 2, 3 ],
+                          [ 0, 1, 2 ] )
+        self.assertEqual( topology.nodesOf( '0,4' ), '0-1' )
+        self.assertEqual( plan.report()[ 'hosts' ][ 'h1s4' ][ 'node' ], 1 )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
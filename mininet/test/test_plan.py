@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test build plan compilation and execution (no root needed)."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mininet.plan import ( PlanCompiler, PlanExecutor, BuildPlan,
+                           IP, TC, VSCTL, SH )
+from mininet.topo import LinearTopo
+from mininet.link import TCLink
+from mininet.net import Mininet
+from mininet.backend import FakeBackend
+from mininet.util import custom
+from mininet.log import setLogLevel
+
+
+class testPlanCompiler( unittest.TestCase ):
+    "Compile plans for small topologies"
+
+    def compile( self, **settings ):
+        "Compile a plan for a two-switch linear topology"
+        return PlanCompiler( LinearTopo( 2, 2 ), **settings ).compile()
+
+    def testSteps( self ):
+        "Namespaces, links, per-node batches and one OVS transaction"
+        plan = self.compile( autoSetMacs=True )
+        steps = plan.steps
+        self.assertEqual( steps[ 'netns' ].cmds[ 0 ], 'netns add h1s1' )
+        self.assertEqual( steps[ 'links' ].deps, [ 'netns', 'stale' ] )
+        self.assertEqual( steps[ 'ip:h1s1' ].netns, 'h1s1' )
+        self.assertTrue( 'addr add 10.0.0.1/8 dev h1s1-eth0' in
+                         steps[ 'ip:h1s1' ].cmds )
+        self.assertTrue( any( '00:00:00:00:00:01' in cmd
+                              for cmd in steps[ 'links' ].cmds ) )
+        self.assertEqual( steps[ 'switches' ].kind, VSCTL )
+        self.assertFalse( 'tc:h1s1' in steps )
+        self.assertEqual( len( plan.links ), 5 )
+
+    def testTCLink( self ):
+        "TCLink parameters become tc batches for both ends"
+        plan = self.compile( link=custom( TCLink, bw=10, delay='5ms' ) )
+        tc = plan.steps[ 'tc:h1s1' ]
+        self.assertEqual( ( tc.kind, tc.netns ), ( TC, 'h1s1' ) )
+        self.assertTrue( any( 'netem delay 5ms' in cmd for cmd in tc.cmds ) )
+        self.assertTrue( 'tc:root' in plan.steps )
+        self.assertEqual( plan.links[ 0 ][ 0 ], TCLink )
+
+    def testCache( self ):
+        "Plans are cached by topology fingerprint and settings"
+        tmp = tempfile.mkdtemp()
+        try:
+            compiler = PlanCompiler( LinearTopo( 2, 2 ), link=TCLink )
+            plan = compiler.compile( cacheDir=tmp )
+            self.assertEqual( os.listdir( tmp ), [ plan.key + '.plan' ] )
+            cached = compiler.compile( cacheDir=tmp )
+            self.assertEqual( cached.script(), plan.script() )
+            self.assertEqual( cached.links, plan.links )
+            other = PlanCompiler( LinearTopo( 2, 2 ) ).compile( cacheDir=tmp )
+            self.assertNotEqual( other.key, plan.key )
+        finally:
+            shutil.rmtree( tmp )
+
+
+class testPlanExecutor( unittest.TestCase ):
+    "Run shell steps in dependency order"
+
+    def testOrder( self ):
+        "Steps start once their dependencies are done"
+        tmp = tempfile.mkdtemp()
+        try:
+            log = os.path.join( tmp, 'log' )
+            plan = BuildPlan()
+            plan.add( 'a', SH, [ 'sleep .1; echo a >> %s' % log ] )
+            plan.add( 'b', SH, [ 'echo b >> %s' % log ] )
+            plan.add( 'c', SH, [ 'echo c >> %s' % log ], deps=[ 'a', 'b' ] )
+            plan.add( 'd', IP, [ 'bogus' ], deps=[ 'c' ] )
+            executor = PlanExecutor( plan, skip=[ 'd' ] )
+            self.assertTrue( executor.run() )
+            with open( log ) as f:
+                self.assertEqual( f.read().split(), [ 'b', 'a', 'c' ] )
+        finally:
+            shutil.rmtree( tmp )
+
+
+class testPlannedBuild( unittest.TestCase ):
+    "Build networks from plans with a fake backend"
+
+    def build( self, failing=() ):
+        "Build a planned network whose matching commands fail"
+        net = Mininet( LinearTopo( 2, 1 ), backend=FakeBackend, plan=True,
+                       build=False )
+        net.backend.failing = list( failing )
+        net.build()
+        return net
+
+    def testPlanned( self ):
+        "Links should come from the plan"
+        net = self.build()
+        self.assertEqual( len( net.plannedHosts ), 2 )
+        self.assertEqual( len( net.links ), 3 )
+        net.stop()
+
+    def testFailedStep( self ):
+        "A failed step should fall back to adding links one at a time"
+        net = self.build( failing=[ 'ip -n h1 ' ] )
+        self.assertEqual( net.plannedHosts, set() )
+        self.assertEqual( len( net.links ), 3 )
+        log = [ cmd for _node, cmd in net.backend.log ]
+        self.assertTrue( 'ip -n h1 link del dev h1-eth0' in log )
+        self.assertEqual( net.get( 'h1' ).IP(), '10.0.0.1' )
+        net.stop()
+
+    def testUnnamedNamespace( self ):
+        "Nodes without named namespaces can't use the plan"
+        net = self.build( failing=[ 'mkdir -p /var/run/netns' ] )
+        self.assertEqual( net.plannedHosts, set() )
+        self.assertEqual( len( net.links ), 3 )
+        net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test address pools (no root or network needed)."""
+
+import unittest
+
+from mininet.pool import IPPool, MACPool
+
+
+class testPools( unittest.TestCase ):
+    "Address pools should reuse released addresses and carve subnets"
+
+    def testIPPool( self ):
+        "Allocate, reserve, release and reuse"
+        pool = IPPool( '10.0.0.0/8' )
+        self.assertTrue( pool.reserve( '10.0.0.2/8' ) )
+        self.assertEqual( [ pool.allocate() for _ in range( 3 ) ],
+                          [ '10.0.0.1/8', '10.0.0.3/8', '10.0.0.4/8' ] )
+        self.assertTrue( pool.release( '10.0.0.3' ) )
+        self.assertFalse( pool.release( '10.0.0.3' ) )
+        self.assertEqual( pool.allocate(), '10.0.0.3/8' )
+        self.assertEqual( len( pool ), 4 )
+        small = IPPool( '192.168.0.0/30' )
+        small.allocate(), small.allocate()
+        self.assertRaises( Exception, small.allocate )
+
+    def testHostMAC( self ):
+        "MACs come from the host part only for addresses in the pool"
+        pool = IPPool( '192.168.0.0/16' )
+        self.assertEqual( pool.mac( '192.168.1.2/16' ), '00:00:00:00:01:02' )
+        self.assertEqual( pool.mac( '10.0.0.1/8' ), None )
+        self.assertEqual( pool.mac( '192.168.0.0' ), None )
+
+    def testSubnet( self ):
+        "Subnets are aligned blocks that keep the parent's prefix"
+        pool = IPPool( '10.0.0.0/8' )
+        pool.allocate()
+        pod = pool.subnet( 16 )
+        self.assertEqual( pod.allocate(), '10.1.0.1/8' )
+        self.assertEqual( pool.subnet( 24 ).allocate(), '10.0.1.1/8' )
+        self.assertTrue( pool.release( '10.1.0.1' ) )
+        self.assertEqual( len( pod ), 0 )
+        self.assertEqual( pool.allocate(), '10.0.0.2/8' )
+
+    def testMACPool( self ):
+        "Unicast, locally administered, unique"
+        pool = MACPool( prefix=0xffff )
+        macs = [ pool.allocate() for _ in range( 1000 ) ]
+        self.assertEqual( len( set( macs ) ), 1000 )
+        self.assertTrue( macs[ 0 ].startswith( 'fe:ff:' ) )
+        pool.release( macs[ 5 ] )
+        self.assertEqual( pool.allocate(), macs[ 5 ] )
+
+
+if __name__ == '__main__':
+    unittest.main()
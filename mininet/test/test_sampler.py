@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test the CPU and interface samplers (no root needed)."""
+
+import unittest
+
+from mininet.net import Mininet
+from mininet.backend import FakeBackend
+from mininet.topo import LinearTopo
+from mininet.node import CPULimitedHost
+from mininet.sampler import ( RingBuffer, CPUSampler, IntfSampler,
+                              parseNetDev )
+from mininet.util import numCores
+from mininet.log import setLogLevel
+
+
+class testSampler( unittest.TestCase ):
+    "Sample cgroup counters into a ring buffer"
+
+    def testRingBuffer( self ):
+        "Columns should be oldest first after wrapping"
+        ring = RingBuffer( 2, 3 )
+        for i in range( 5 ):
+            ring.append( [ i, i * 10 ] )
+        self.assertEqual( len( ring ), 3 )
+        self.assertEqual( ring.column( 0 ), [ 2, 3, 4 ] )
+        self.assertEqual( ring.column( 1 ), [ 20, 30, 40 ] )
+        self.assertEqual( ring.row( -1 ), [ 4, 40 ] )
+
+    def testSampler( self ):
+        "Utilization should follow cgroup usage counters"
+        net = Mininet( LinearTopo( 2, 1 ), backend=FakeBackend,
+                       host=CPULimitedHost )
+        files = net.backend.files
+        h1, h2 = net.get( 'h1', 'h2' )
+        sampler = CPUSampler( net.hosts, interval=.01, seconds=1 )
+        for tick in range( 4 ):
+            # h1 uses all cores for the interval, h2 nothing
+            usec = int( tick * .01 * numCores() * 1e6 )
+            files[ '/sys/fs/cgroup/h1/cpu.stat' ] = 'usage_usec %d\n' % usec
+            files[ '/sys/fs/cgroup/h2/cpu.stat' ] = 'usage_usec 0\n'
+            sampler.run( 0 )
+        sampler.stop()
+        self.assertEqual( len( sampler.utilization( h1 ) ), 3 )
+        self.assertEqual( sampler.utilization( h2 ), [ 0, 0, 0 ] )
+        stats = sampler.stats()
+        self.assertEqual( stats[ 'h2' ][ 'samples' ], 3 )
+        self.assertTrue( stats[ 'h1' ][ 'mean' ] > 0 )
+        net.stop()
+
+    def testIntfSampler( self ):
+        "Link series should follow interface and qdisc counters"
+        net = Mininet( LinearTopo( 2, 1 ), backend=FakeBackend )
+        files = net.backend.files
+        h1 = net.get( 'h1' )
+        link = net.linksBetween( h1, net.get( 's1' ) )[ 0 ]
+        sampler = IntfSampler( net.hosts + net.switches, interval=.01 )
+        header = 'Inter-|   Receive  |  Transmit\n face |bytes ...\n'
+        counters = '%s: 0 0 0 0 0 0 0 0 %d 0 0 %d 0 0 0 0\n'
+        for tick in range( 3 ):
+            # h1 sends 1000 bytes per tick, of which the switch drops 10
+            files[ '/proc/%d/net/dev' % h1.pid ] = header + counters % (
+                'h1-eth0', 1000 * tick, 0 )
+            files[ '/proc/net/dev' ] = header + ' s1-eth1: %d 0 0 %d' % (
+                990 * tick, 10 * tick ) + ' 0' * 12 + '\n'
+            sampler.run( 0 )
+        sampler.stop()
+        series = sampler.linkSeries( link )
+        self.assertEqual( series.keys(), [ 'h1-eth0->s1-eth1',
+                                           's1-eth1->h1-eth0' ] )
+        forward = series[ 'h1-eth0->s1-eth1' ]
+        self.assertEqual( forward[ 'drops' ], [ 10, 10 ] )
+        self.assertTrue( all( mbps > 0 for mbps in forward[ 'mbps' ] ) )
+        self.assertEqual( parseNetDev( files[ '/proc/net/dev' ] )[
+            's1-eth1' ], ( 1980, 0, 20, 0, 0, 0 ) )
+        net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""Package: mininet
+   Test topology construction (no root or network needed)."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mininet.topo import ( Topo, MultiGraph, CompactMultiGraph,
+                           SingleSwitchTopo, SingleSwitchReversedTopo,
+                           LinearTopo )
+from mininet.topolib import ( TreeTopo, FatTreeTopo, LeafSpineTopo,
+                              DragonflyTopo, JellyfishTopo, BCubeTopo )
+from mininet.calibrate import checkCapacity
+from mininet.log import setLogLevel
+
+
+class testCompactMultiGraph( unittest.TestCase ):
+    "Compare CompactMultiGraph topos with MultiGraph topos"
+
+    topos = [ ( SingleSwitchTopo, ( 3, ) ),
+              ( SingleSwitchReversedTopo, ( 3, ) ),
+              ( LinearTopo, ( 4, 2 ) ),
+              ( TreeTopo, ( 3, 2 ) ) ]
+
+    def pairs( self ):
+        "Yield ( MultiGraph topo, CompactMultiGraph topo ) pairs"
+        for cls, args in self.topos:
+            yield cls( *args ), cls( *args, graph=CompactMultiGraph )
+
+    def testLinks( self ):
+        "Nodes, links, link info and ports should match"
+        for topo, compact in self.pairs():
+            self.assertEqual( topo.nodes(), compact.nodes() )
+            self.assertEqual( topo.switches(), compact.switches() )
+            self.assertEqual(
+                sorted( topo.links( withKeys=True, withInfo=True ) ),
+                sorted( compact.links( withKeys=True, withInfo=True ) ) )
+            for src, dst in topo.links():
+                self.assertEqual( topo.port( src, dst ),
+                                  compact.port( src, dst ) )
+                self.assertEqual( topo.linkInfo( dst, src ),
+                                  compact.linkInfo( dst, src ) )
+
+    def testSetLinkInfo( self ):
+        "setlinkInfo() should replace link info"
+        for topo, compact in self.pairs():
+            src, dst = topo.links()[ 0 ]
+            for t in topo, compact:
+                info = dict( t.linkInfo( src, dst ), bw=10 )
+                t.setlinkInfo( src, dst, info )
+            self.assertEqual( topo.linkInfo( src, dst ),
+                              compact.linkInfo( src, dst ) )
+
+    def testParallelLinks( self ):
+        "Parallel links should get the same keys and ports"
+        results = []
+        for graph in MultiGraph, CompactMultiGraph:
+            topo = Topo( graph=graph )
+            s1, s2 = topo.addSwitch( 's1' ), topo.addSwitch( 's2' )
+            topo.addLink( s1, s2 )
+            topo.addLink( s2, s1, bw=1 )
+            topo.addLink( s1, s2, key=7 )
+            topo.addLink( s1, s2 )
+            results.append( ( sorted( topo.links( withKeys=True ) ),
+                              topo.port( s1, s2 ) ) )
+        self.assertEqual( results[ 0 ], results[ 1 ] )
+
+    def testReplaceKey( self ):
+        "Adding an edge with an existing key should replace that edge"
+        results = []
+        for graph in MultiGraph, CompactMultiGraph:
+            g = graph()
+            g.add_edge( 's1', 's2' )
+            g.add_edge( 's1', 's2', key=7, bw=1 )
+            g.add_edge( 's2', 's1', key=7, bw=2 )
+            g.add_edge( 's1', 's2', key=1, bw=3 )
+            results.append( sorted( ( key, attrs ) for key, attrs in
+                                    g[ 's1' ][ 's2' ].items() ) )
+        self.assertEqual( results[ 0 ], results[ 1 ] )
+        self.assertEqual( results[ 1 ], [ ( 1, { 'bw': 3 } ),
+                                          ( 7, { 'bw': 2 } ) ] )
+
+    def testSharedRecords( self ):
+        "Links with the same options should share one record"
+        topo = Topo( graph=CompactMultiGraph, lopts={ 'bw': 10 } )
+        s1 = topo.addSwitch( 's1' )
+        for i in range( 1, 101 ):
+            topo.addLink( topo.addHost( 'h%d' % i ), s1 )
+        topo.addLink( 'h1', 'h2', delay='1ms' )
+        self.assertEqual( len( topo.g.records ), 2 )
+        self.assertEqual( topo.linkInfo( 'h5', 's1' )[ 'bw' ], 10 )
+
+
+class testTopoIndexes( unittest.TestCase ):
+    "Cached node, link and port indexes should track changes"
+
+    def testInvalidation( self ):
+        "Adding nodes and links should update cached lists"
+        topo = LinearTopo( 10, 1 )
+        self.assertEqual( topo.hosts()[ :3 ], [ 'h1', 'h2', 'h3' ] )
+        self.assertEqual( topo.switches()[ -1 ], 's10' )
+        links = topo.links( sort=True )
+        self.assertEqual( links[ 0 ], ( 'h1', 's1' ) )
+        topo.addHost( 'h11' )
+        topo.addLink( 'h11', 's10' )
+        self.assertEqual( topo.hosts()[ -1 ], 'h11' )
+        self.assertEqual( len( topo.links( sort=True ) ), len( links ) + 1 )
+        self.assertEqual( topo.port( 'h11', 's10' ), ( 0, 3 ) )
+        self.assertEqual( topo.port( 's10', 'h11' ), ( 3, 0 ) )
+        self.assertEqual( topo.port( 'h1', 'h2' ), [] )
+
+    def testCopies( self ):
+        "Callers may modify returned lists"
+        topo = SingleSwitchTopo( 3 )
+        topo.hosts().remove( 'h1' )
+        topo.links( sort=True ).pop()
+        self.assertEqual( topo.hosts(), [ 'h1', 'h2', 'h3' ] )
+        self.assertEqual( len( topo.links( sort=True ) ), 3 )
+
+
+class testSaveLoad( unittest.TestCase ):
+    "Topo.save() and Topo.load() should round-trip"
+
+    def roundTrip( self, topo, path ):
+        "Save and load topo, and compare with the original"
+        topo.save( path )
+        loaded = Topo.load( path )
+        self.assertEqual( type( loaded.g ), type( topo.g ) )
+        self.assertEqual( loaded.nodes(), topo.nodes() )
+        self.assertEqual( loaded.hosts(), topo.hosts() )
+        for node in topo.nodes():
+            self.assertEqual( loaded.nodeInfo( node ), topo.nodeInfo( node ) )
+        self.assertEqual(
+            loaded.links( sort=True, withKeys=True, withInfo=True ),
+            topo.links( sort=True, withKeys=True, withInfo=True ) )
+        self.assertEqual( loaded.fingerprint(), topo.fingerprint() )
+        loaded.fingerprintCache = None
+        self.assertEqual( loaded.fingerprint(), topo.fingerprint() )
+
+    def testRoundTrip( self ):
+        "Binary and JSON files, both graph types, classes in options"
+        tmp = tempfile.mkdtemp()
+        try:
+            for graph in MultiGraph, CompactMultiGraph:
+                topo = TreeTopo( 2, 3, graph=graph )
+                topo.addHost( 'h10', cls=Topo, ip='10.1.0.1/8' )
+                topo.addLink( 'h10', 's1', bw=10, delay='1ms' )
+                topo.addLink( 'h10', 's1', key=5 )
+                for name in 'topo.bin', 'topo.json':
+                    self.roundTrip( topo, os.path.join( tmp, name ) )
+        finally:
+            shutil.rmtree( tmp )
+
+    def testFingerprint( self ):
+        "Fingerprints should change when the topology does"
+        topo = LinearTopo( 3, 1 )
+        fingerprint = topo.fingerprint()
+        self.assertEqual( LinearTopo( 3, 1 ).fingerprint(), fingerprint )
+        topo.addLink( 'h1', 's3' )
+        self.assertNotEqual( topo.fingerprint(), fingerprint )
+
+
+class testDiff( unittest.TestCase ):
+    "Topo.diff() should find added, removed and changed nodes and links"
+
+    def testDiff( self ):
+        "Links are matched by nodes and ports"
+        old, new = LinearTopo( 3, 1 ), LinearTopo( 3, 1 )
+        new.addHost( 'h4' )
+        new.addLink( 'h4', 's3' )
+        new.setlinkInfo( 'h1', 's1', dict( new.linkInfo( 'h1', 's1' ),
+                                           bw=10 ) )
+        new.setNodeInfo( 'h2', { 'cpu': .5 } )
+        diff = old.diff( new )
+        self.assertEqual( diff.delNodes, [ 'h2' ] )
+        self.assertEqual( diff.addNodes, [ 'h2', 'h4' ] )
+        self.assertEqual( [ ( l[ 'node1' ], l[ 'node2' ] )
+                            for l in diff.addLinks ],
+                          [ ( 'h2', 's2' ), ( 'h4', 's3' ) ] )
+        self.assertEqual( len( diff.delLinks ), 1 )
+        self.assertEqual( diff.changedLinks[ 0 ][ 1 ][ 'bw' ], 10 )
+        self.assertEqual( len( new.diff( new ) ), 0 )
+
+
+class testGenerators( unittest.TestCase ):
+    "Check sizes and switch degrees of generated topologies"
+
+    def check( self, topo, hosts, switches, links, degrees ):
+        "Check counts, switch degrees, and that there are no parallel links"
+        self.assertEqual( len( topo.hosts() ), hosts )
+        self.assertEqual( len( topo.switches() ), switches )
+        pairs = set( tuple( sorted( link ) ) for link in topo.links() )
+        self.assertEqual( len( pairs ), links )
+        degree = dict.fromkeys( topo.switches(), 0 )
+        for node1, node2 in topo.links():
+            for node in node1, node2:
+                if node in degree:
+                    degree[ node ] += 1
+        self.assertEqual( set( degree.values() ), set( degrees ) )
+
+    def testFatTree( self ):
+        "k-ary fat tree: every switch uses all k ports"
+        for graph in MultiGraph, CompactMultiGraph:
+            self.check( FatTreeTopo( 4, graph=graph ), 16, 20, 48, [ 4 ] )
+
+    def testLeafSpine( self ):
+        "Leaf-spine: leaves connect to every spine"
+        self.check( LeafSpineTopo( 4, 2, 3 ), 12, 6, 20, [ 4, 5 ] )
+
+    def testDragonfly( self ):
+        "Dragonfly: p hosts + ( a - 1 ) local + h global links per router"
+        self.check( DragonflyTopo( 4, 2, 2 ), 72, 36, 162, [ 7 ] )
+
+    def testJellyfish( self ):
+        "Jellyfish: random regular graph, repeatable with a seed"
+        topo = JellyfishTopo( 50, 4, 1, seed=1 )
+        self.check( topo, 50, 50, 150, [ 5 ] )
+        self.assertEqual( topo.links(),
+                          JellyfishTopo( 50, 4, 1, seed=1 ).links() )
+
+    def testBCube( self ):
+        "BCube: server switches have k + 2 links, others n"
+        self.check( BCubeTopo( 4, 1 ), 16, 24, 48, [ 3, 4 ] )
+
+
+class testCalibration( unittest.TestCase ):
+    "Check topologies against a machine profile"
+
+    profile = { 'machine': { 'hostname': 'test' },
+                'capacity': { 'bw': 1000, 'linkBw': 100, 'links': 16 } }
+
+    def check( self, n, bw=None ):
+        "Return warnings for a linear topo of n switches"
+        lopts = { 'bw': bw } if bw else {}
+        return checkCapacity( LinearTopo( n, 1, lopts=lopts ), self.profile )
+
+    def testCapacity( self ):
+        "Warn about aggregate bandwidth, link bandwidth and link count"
+        self.assertEqual( self.check( 4 ), [] )
+        self.assertEqual( self.check( 4, bw=100 ), [] )
+        self.assertEqual( len( self.check( 4, bw=1000 ) ), 2 )
+        self.assertEqual( len( self.check( 10, bw=10 ) ), 1 )
+
+
+if __name__ == '__main__':
+    setLogLevel( 'warning' )
+    unittest.main()
@@ -0,0 +1,183 @@
+"""
+Link-change timelines
+
+A Timeline applies a schedule of link changes (failures, recoveries,
+and bandwidth, delay and loss changes) to a running network:
+
+    timeline = Timeline( net )
+    timeline.add( 1.0, 's1', 's2', 'down' )
+    timeline.add( 3.0, 's1', 's2', 'up' )
+    timeline.add( 3.0, 'h1', 's1', 'bw', 5 )
+    timeline.run()
+
+or from a schedule file, with one event per line:
+
+    # time node1 node2 action [value]
+    1.0 s1 s2 down
+    3.0 h1 s1 delay 20ms
+
+    Timeline( net, 'schedule.txt' ).run()
+
+Actions are up, down, bw, delay, jitter, loss and max_queue_size (a
+value of 'none' removes a tc parameter). Changes apply to all links
+between the two nodes; tc parameters are changed in place (see
+Link.reshape()), so links need TCIntf interfaces.
+
+Events are applied a tick at a time: the events due within a tick are
+applied together, as a single ip -batch and tc -batch per namespace
+(see TCBatch), so the cost of a tick grows with the number of
+namespaces it touches rather than with the number of events. Times
+come from a monotonic clock, and the time at which each event was
+actually applied is recorded in Timeline.log.
+"""
+
+from operator import itemgetter
+
+from mininet.log import info, error, debug
+from mininet.link import TCBatch, TCIntf
+from mininet.util import monotonic, waitUntil, makeNumeric
+
+
+class Timeline( object ):
+    "Schedule of link changes for a network"
+
+    actions = ( 'up', 'down', 'bw', 'delay', 'jitter', 'loss',
+                'max_queue_size' )
+
+    def __init__( self, net, schedule=None, tick=.01 ):
+        """net: Mininet network
+           schedule: schedule file name or list of events
+                     ( time, node1, node2, action[, value ] )
+           tick: events due within tick seconds are applied together"""
+        self.net = net
+        self.tick = tick
+        self.events = []  # [ ( time, node1, node2, action, value ) ]
+        self.log = []  # [ ( time, applied, node1, node2, action, value ) ]
+        if isinstance( schedule, basestring ):
+            self.load( schedule )
+        elif schedule:
+            for event in schedule:
+                self.add( *event )
+
+    def add( self, time, node1, node2, action, value=None ):
+        """Schedule a link change
+           time: seconds from the start of run()
+           node1, node2: nodes (or names) at the ends of the link(s)
+           action: up, down or tc parameter to set
+           value: new value of tc parameter (None: remove)"""
+        if action not in self.actions:
+            raise Exception( 'Timeline: unknown action %s' % action )
+        self.check( node1, node2, action )
+        self.events.append( ( float( time ), str( node1 ), str( node2 ),
+                              action, value ) )
+
+    def check( self, node1, node2, action ):
+        """Raise an exception unless node1 and node2 are linked by links
+           that action applies to (tc parameters need TCIntf ends)"""
+        try:
+            links = self.net.linksBetween( str( node1 ), str( node2 ) )
+        except KeyError, e:
+            raise Exception( 'Timeline: unknown node %s' % e )
+        if not links:
+            raise Exception( 'Timeline: %s and %s not connected' %
+                             ( node1, node2 ) )
+        if action in ( 'up', 'down' ):
+            return
+        for link in links:
+            if not any( isinstance( intf, TCIntf )
+                        for intf in ( link.intf1, link.intf2 ) ):
+                raise Exception( 'Timeline: %s needs tc interfaces, which '
+                                 '%s does not have' % ( action, link ) )
+
+    def load( self, filename ):
+        "Add events from a schedule file"
+        with open( filename ) as f:
+            for num, line in enumerate( f, 1 ):
+                words = line.split( '#', 1 )[ 0 ].split()
+                if not words:
+                    continue
+                if len( words ) not in ( 4, 5 ):
+                    raise Exception( '%s:%d: expected time node1 node2 '
+                                     'action [value]' % ( filename, num ) )
+                if len( words ) == 5:
+                    value = words[ 4 ]
+                    words[ 4 ] = ( None if value.lower() == 'none'
+                                   else makeNumeric( value ) )
+                try:
+                    self.add( *words )
+                except Exception, e:
+                    raise Exception( '%s:%d: %s' % ( filename, num, e ) )
+
+    def save( self, filename ):
+        "Write the log: scheduled time, applied time and event per line"
+        with open( filename, 'w' ) as f:
+            for time, applied, node1, node2, action, value in self.log:
+                f.write( '%.6f %.6f %s %s %s%s\n' % (
+                    time, applied, node1, node2, action,
+                    '' if value is None and action in ( 'up', 'down' )
+                    else ' %s' % value ) )
+
+    def apply( self, events ):
+        """Apply events now, as one batch; an event that fails is
+           reported and skipped, and the others still apply
+           events: list of ( time, node1, node2, action, value )"""
+        with TCBatch() as batch:
+            for event in events:
+                try:
+                    self.applyEvent( batch, *event )
+                except Exception, e:
+                    error( '*** Timeline: %s failed: %s\n' % (
+                        ' '.join( str( field ) for field in event ), e ) )
+
+    def applyEvent( self, batch, _time, node1, node2, action, value ):
+        "Apply (or add to batch) one event"
+        links = self.net.linksBetween( node1, node2 )
+        if not links:
+            error( '*** Timeline: %s and %s not connected\n' %
+                   ( node1, node2 ) )
+        for link in links:
+            if action in ( 'up', 'down' ):
+                for intf in link.intf1, link.intf2:
+                    if getattr( intf.node, 'isRemote', False ):
+                        intf.ifconfig( action )
+                    else:
+                        batch.add( intf.node, ip=[
+                            'link set dev %s %s' % ( intf, action ) ] )
+            else:
+                link.reshape( **{ action: value } )
+
+    def run( self, start=None ):
+        """Apply all events at their scheduled times
+           start: monotonic() time of time 0 (default: now)
+           returns: log"""
+        events = sorted( self.events, key=itemgetter( 0 ) )
+        if start is None:
+            start = monotonic()
+        info( '*** Running timeline of %d events\n' % len( events ) )
+        i = ticks = 0
+        while i < len( events ):
+            waitUntil( start + events[ i ][ 0 ] )
+            due = monotonic() - start + self.tick
+            j = i + 1
+            while j < len( events ) and events[ j ][ 0 ] <= due:
+                j += 1
+            self.apply( events[ i:j ] )
+            applied = monotonic() - start
+            for event in events[ i:j ]:
+                debug( '%.6f %s\n' % ( applied, ' '.join(
+                    str( field ) for field in event ) ) )
+                self.log.append( ( event[ 0 ], applied ) + event[ 1: ] )
+            i, ticks = j, ticks + 1
+        mean, worst = self.lateness()
+        info( '*** Applied %d events in %d ticks; lateness mean %.1fms, '
+              'max %.1fms\n' % ( len( events ), ticks, mean * 1000,
+                                 worst * 1000 ) )
+        return self.log
+
+    def lateness( self ):
+        "Return mean and maximum of ( applied time - scheduled time )"
+        if not self.log:
+            return 0, 0
+        late = [ applied - time for time, applied in
+                 ( entry[ :2 ] for entry in self.log ) ]
+        return sum( late ) / len( late ), max( late )
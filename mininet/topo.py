@@ -11,7 +11,15 @@
 setup for testing, and can even be emulated with the Mininet package.
 """
 
-from mininet.util import irange, natural, naturalSeq
+from array import array
+from hashlib import sha1
+from itertools import izip
+import json
+import struct
+import sys
+import zlib
+
+from mininet.util import irange, natural
 
 class MultiGraph( object ):
     "Utility class to track nodes and edges - replaces networkx.MultiGraph"
@@ -50,6 +58,17 @@ def add_edge( self, src, dst, key=None, attr_dict=None, **attrs ):
         entry[ key ] = attr_dict
         return key
 
+    def add_link( self, node1, node2, port1, port2, key=None,
+                  attr_dict=None ):
+        """Add edge for a Topo link
+           node1, node2: nodes
+           port1, port2: port numbers
+           key: optional key
+           attr_dict: link options (copied, not modified)"""
+        attr_dict = dict( attr_dict ) if attr_dict else {}
+        attr_dict.update( node1=node1, node2=node2, port1=port1, port2=port2 )
+        return self.add_edge( node1, node2, key, attr_dict )
+
     def nodes( self, data=False):
         """Return list of graph nodes
            data: return list of ( node, attrs)"""
@@ -97,6 +116,422 @@ def convertTo( self, cls, data=False, keys=False ):
         return g
 
 
+class CompactMultiGraph( MultiGraph ):
+    """MultiGraph for very large topologies: node names are interned to
+       integer ids, edges are kept in parallel arrays (with a CSR-style
+       adjacency index built on demand), and edges with the same options
+       share one attribute record. The node1/node2/port1/port2 link
+       attributes are stored in the edge arrays rather than in records,
+       and edge attribute dicts are built when requested."""
+
+    AUTO = -1       # key array value for keys assigned by the graph
+    NOPORT = -1     # port array value for edges without port attributes
+
+    def __init__( self ):
+        self.node = {}
+        self.names = []         # node id -> node name
+        self.ids = {}           # node name -> node id
+        self.degrees = array( 'i' )
+        self.src, self.dst = array( 'i' ), array( 'i' )
+        self.port1, self.port2 = array( 'i' ), array( 'i' )
+        self.keys = array( 'i' )
+        self.rec = array( 'i' )
+        self.records = []       # record id -> ( attrs, withNodes )
+        self.recordIds = {}     # ( withNodes, sorted items ) -> record id
+        self.otherKeys = {}     # edge -> key that won't fit in self.keys
+        self.keyed = {}         # ( node id, node id, key ) -> edge
+        self.autoEdges = 0      # number of edges with graph-chosen keys
+        self.offsets = self.adj = self.rkeys = None
+        self.lastLink = ( None, None, None )  # opts, copy, record id
+
+    def nodeId( self, node ):
+        "Return id for node, adding it if necessary"
+        nid = self.ids.get( node )
+        if nid is None:
+            nid = self.ids[ node ] = len( self.names )
+            self.names.append( node )
+            self.degrees.append( 0 )
+            self.node.setdefault( node, {} )
+        return nid
+
+    def add_node( self, node, attr_dict=None, **attrs ):
+        """Add node to graph
+           attr_dict: attribute dict (optional)
+           attrs: more attributes (optional)
+           warning: updates attr_dict with attrs"""
+        attr_dict = {} if attr_dict is None else attr_dict
+        attr_dict.update( attrs )
+        self.nodeId( node )
+        self.node[ node ] = attr_dict
+
+    def record( self, attrs, withNodes ):
+        "Return id of shared attribute record for attrs"
+        try:
+            rkey = ( withNodes, tuple( sorted( attrs.iteritems() ) ) )
+            rid = self.recordIds.get( rkey )
+        except TypeError:
+            # Unhashable values: don't share
+            rkey, rid = None, None
+        if rid is None:
+            rid = len( self.records )
+            self.records.append( ( dict( attrs ), withNodes ) )
+            if rkey is not None:
+                self.recordIds[ rkey ] = rid
+        return rid
+
+    def split( self, src, dst, attr_dict ):
+        """Split attr_dict into port numbers and a record id
+           returns: port1, port2, record id"""
+        attrs = dict( attr_dict )
+        withNodes = ( attrs.get( 'node1', self ) == src and
+                      attrs.get( 'node2', self ) == dst )
+        if withNodes:
+            del attrs[ 'node1' ], attrs[ 'node2' ]
+        ports = []
+        for name in 'port1', 'port2':
+            port = attrs.get( name )
+            if type( port ) is int and port >= 0:
+                del attrs[ name ]
+                ports.append( port )
+            else:
+                ports.append( self.NOPORT )
+        return ports[ 0 ], ports[ 1 ], self.record( attrs, withNodes )
+
+    def append( self, src, dst, port1, port2, key, rid ):
+        "Append an edge to the edge arrays"
+        s, d = self.ids.get( src ), self.ids.get( dst )
+        if s is None:
+            s = self.nodeId( src )
+        if d is None:
+            d = self.nodeId( dst )
+        e = len( self.src )
+        self.src.append( s )
+        self.dst.append( d )
+        self.port1.append( port1 )
+        self.port2.append( port2 )
+        self.rec.append( rid )
+        if key is None:
+            self.keys.append( self.AUTO )
+            self.autoEdges += 1
+        elif type( key ) is int and key != self.AUTO and (
+                -2**31 <= key < 2**31 ):
+            self.keys.append( key )
+        else:
+            self.keys.append( self.AUTO )
+            self.otherKeys[ e ] = key
+        if key is not None:
+            self.keyed[ min( s, d ), max( s, d ), key ] = e
+        self.degrees[ s ] += 1
+        if d != s:
+            self.degrees[ d ] += 1
+        self.offsets = self.adj = self.rkeys = None
+        return e
+
+    def existing( self, src, dst, key ):
+        """Return edge between src and dst with key, or None
+           (as in MultiGraph, adding it again replaces it)"""
+        s, d = self.ids.get( src ), self.ids.get( dst )
+        if key is None or s is None or d is None:
+            return None
+        e = self.keyed.get( ( min( s, d ), max( s, d ), key ) )
+        if e is None and self.autoEdges and type( key ) is int:
+            # key may have been chosen by the graph
+            self.index()
+            for edge in self.adj[ self.offsets[ s ]:self.offsets[ s + 1 ] ]:
+                other = ( self.dst[ edge ] if self.src[ edge ] == s
+                          else self.src[ edge ] )
+                if ( other == d and self.keys[ edge ] == self.AUTO and
+                     edge not in self.otherKeys and
+                     self.rkeys[ edge ] == key ):
+                    return edge
+        return e
+
+    def replace( self, e, src, dst, port1, port2, rid ):
+        "Replace the ends and attributes of edge e (between the same nodes)"
+        self.src[ e ], self.dst[ e ] = self.ids[ src ], self.ids[ dst ]
+        self.port1[ e ], self.port2[ e ], self.rec[ e ] = port1, port2, rid
+
+    def add_edge( self, src, dst, key=None, attr_dict=None, **attrs ):
+        """Add edge to graph
+           key: optional key
+           attr_dict: optional attribute dict
+           attrs: more attributes
+           returns: edge key (None if assigned by the graph)"""
+        attr_dict = {} if attr_dict is None else attr_dict
+        attr_dict.update( attrs )
+        port1, port2, rid = self.split( src, dst, attr_dict )
+        e = self.existing( src, dst, key )
+        if e is None:
+            self.append( src, dst, port1, port2, key, rid )
+        else:
+            self.replace( e, src, dst, port1, port2, rid )
+        return key
+
+    def add_link( self, node1, node2, port1, port2, key=None,
+                  attr_dict=None ):
+        """Add edge for a Topo link
+           node1, node2: nodes
+           port1, port2: port numbers
+           key: optional key
+           attr_dict: link options (shared, not copied per link)"""
+        # Topos typically pass the same lopts dict for every link
+        opts, copy, rid = self.lastLink
+        if rid is None or attr_dict is not opts or attr_dict != copy:
+            rid = self.record( attr_dict or {}, True )
+            self.lastLink = ( attr_dict, dict( attr_dict or {} ), rid )
+        e = self.existing( node1, node2, key )
+        if e is None:
+            self.append( node1, node2, port1, port2, key, rid )
+        else:
+            self.replace( e, node1, node2, port1, port2, rid )
+        return key
+
+    def add_links( self, links, attr_dict=None ):
+        """Add many Topo links, numbering ports as Topo.addPort() does
+           (from each node's degree, starting at 1 for switches)
+           links: sequence of ( node1, node2 )
+           attr_dict: link options, shared by all links"""
+        rid = self.record( attr_dict or {}, True )
+        ids, degrees, node = self.ids, self.degrees, self.node
+        base = [ 1 if node[ name ].get( 'isSwitch' ) else 0
+                 for name in self.names ]
+        srcs, dsts, port1s, port2s = [], [], [], []
+        for node1, node2 in links:
+            s, d = ids[ node1 ], ids[ node2 ]
+            srcs.append( s )
+            dsts.append( d )
+            port1s.append( degrees[ s ] + base[ s ] )
+            port2s.append( degrees[ d ] + base[ d ] )
+            degrees[ s ] += 1
+            if d != s:
+                degrees[ d ] += 1
+        self.src.extend( srcs )
+        self.dst.extend( dsts )
+        self.port1.extend( port1s )
+        self.port2.extend( port2s )
+        self.keys.extend( array( 'i', [ self.AUTO ] ) * len( srcs ) )
+        self.rec.extend( array( 'i', [ rid ] ) * len( srcs ) )
+        self.autoEdges += len( srcs )
+        self.offsets = self.adj = self.rkeys = None
+
+    def degree( self, node ):
+        "Return number of edges incident to node"
+        nid = self.ids.get( node )
+        return 0 if nid is None else self.degrees[ nid ]
+
+    def index( self ):
+        """Build adjacency index: the edges of node id n are
+           adj[ offsets[ n ]:offsets[ n + 1 ] ], in the order they were
+           added. Also assign graph-chosen keys: as in MultiGraph, one
+           more than the largest integer key between the same nodes."""
+        if self.adj is not None:
+            return
+        offsets = array( 'i', [ 0 ] ) * ( len( self.names ) + 1 )
+        total = 0
+        for n, degree in enumerate( self.degrees ):
+            offsets[ n ] = total
+            total += degree
+        offsets[ -1 ] = total
+        fill = array( 'i', offsets )
+        adj = array( 'i', [ 0 ] ) * total
+        for e, ( s, d ) in enumerate( izip( self.src, self.dst ) ):
+            adj[ fill[ s ] ] = e
+            fill[ s ] += 1
+            if d != s:
+                adj[ fill[ d ] ] = e
+                fill[ d ] += 1
+        rkeys = array( 'i', self.keys )
+        src, dst, keys, AUTO = self.src, self.dst, self.keys, self.AUTO
+        for n in xrange( len( self.names ) ):
+            # Assign keys for each pair of nodes from its lower id
+            largest = {}
+            for e in adj[ offsets[ n ]:offsets[ n + 1 ] ]:
+                other = dst[ e ] if src[ e ] == n else src[ e ]
+                if other < n:
+                    continue
+                key = keys[ e ]
+                if key == AUTO:
+                    if e in self.otherKeys:
+                        continue
+                    key = rkeys[ e ] = largest.get( other, 0 ) + 1
+                largest[ other ] = max( key, largest.get( other, 0 ) )
+        self.offsets, self.adj, self.rkeys = offsets, adj, rkeys
+
+    def edgeKey( self, e ):
+        "Return key of edge e"
+        if e in self.otherKeys:
+            return self.otherKeys[ e ]
+        self.index()
+        return self.rkeys[ e ]
+
+    def edgeData( self, e ):
+        "Return a new attribute dict for edge e"
+        attrs, withNodes = self.records[ self.rec[ e ] ]
+        data = dict( attrs )
+        if withNodes:
+            data[ 'node1' ] = self.names[ self.src[ e ] ]
+            data[ 'node2' ] = self.names[ self.dst[ e ] ]
+        if self.port1[ e ] != self.NOPORT:
+            data[ 'port1' ] = self.port1[ e ]
+        if self.port2[ e ] != self.NOPORT:
+            data[ 'port2' ] = self.port2[ e ]
+        return data
+
+    def setEdgeData( self, e, attr_dict ):
+        "Replace the attributes of edge e"
+        src, dst = self.names[ self.src[ e ] ], self.names[ self.dst[ e ] ]
+        self.port1[ e ], self.port2[ e ], self.rec[ e ] = self.split(
+            src, dst, attr_dict )
+
+    def edges_iter( self, data=False, keys=False ):
+        "Iterator: return graph edges, in the order they were added"
+        names, otherKeys = self.names, self.otherKeys
+        if keys:
+            self.index()
+        for e, ( s, d ) in enumerate( izip( self.src, self.dst ) ):
+            edge = ( names[ s ], names[ d ] )
+            if keys:
+                edge += ( otherKeys[ e ] if e in otherKeys
+                          else self.rkeys[ e ], )
+            if data:
+                edge += ( self.edgeData( e ), )
+            yield edge
+
+    def __getitem__( self, node ):
+        """Return link dict for given src node:
+           { dst: { key: attrs } }; attrs may be replaced but not
+           modified in place"""
+        self.index()
+        n = self.ids[ node ]
+        neighbors = {}
+        for e in self.adj[ self.offsets[ n ]:self.offsets[ n + 1 ] ]:
+            other = self.dst[ e ] if self.src[ e ] == n else self.src[ e ]
+            neighbors.setdefault( self.names[ other ], [] ).append( e )
+        return dict( ( name, CompactEdges( self, node, name, edges ) )
+                     for name, edges in neighbors.iteritems() )
+
+
+class CompactEdges( object ):
+    "Dict-like view of the edges between two nodes of a CompactMultiGraph"
+
+    def __init__( self, graph, src, dst, edges ):
+        self.graph = graph
+        self.src, self.dst = src, dst
+        self.edges = edges
+
+    def find( self, key ):
+        "Return edge index for key"
+        for e in self.edges:
+            if self.graph.edgeKey( e ) == key:
+                return e
+        raise KeyError( key )
+
+    def keys( self ):
+        return [ self.graph.edgeKey( e ) for e in self.edges ]
+
+    def values( self ):
+        return [ self.graph.edgeData( e ) for e in self.edges ]
+
+    def items( self ):
+        return zip( self.keys(), self.values() )
+
+    def __iter__( self ):
+        return iter( self.keys() )
+
+    def __len__( self ):
+        return len( self.edges )
+
+    def __contains__( self, key ):
+        return key in self.keys()
+
+    def __getitem__( self, key ):
+        return self.graph.edgeData( self.find( key ) )
+
+    def get( self, key, default=None ):
+        return self[ key ] if key in self else default
+
+    def __setitem__( self, key, attrs ):
+        if key in self:
+            self.graph.setEdgeData( self.find( key ), attrs )
+        else:
+            self.graph.add_edge( self.src, self.dst, key, attrs )
+            self.edges.append( len( self.graph.src ) - 1 )
+
+
+# Topology files
+
+TOPO_MAGIC = 'MNTOPO\x01\n'   # binary topology file header
+TOPO_VERSION = 1
+
+def encodeValue( value ):
+    "JSON encoder hook: encode classes (e.g. cls=OVSSwitch) by name"
+    if isinstance( value, type ):
+        return { '__class__': '%s.%s' % ( value.__module__,
+                                          value.__name__ ) }
+    raise Exception( 'Cannot save option value %r (only classes, numbers, '
+                     'strings, lists and dicts are supported)' % ( value, ) )
+
+def decodeValue( value ):
+    "Undo encodeValue() and convert unicode strings to str"
+    if isinstance( value, unicode ):
+        return str( value )
+    if isinstance( value, list ):
+        return [ decodeValue( v ) for v in value ]
+    if isinstance( value, dict ):
+        if len( value ) == 1 and '__class__' in value:
+            module, name = str( value[ '__class__' ] ).rsplit( '.', 1 )
+            __import__( module )
+            return getattr( sys.modules[ module ], name )
+        return dict( ( str( k ), decodeValue( v ) )
+                     for k, v in value.iteritems() )
+    return value
+
+def dumpJSON( value, **kwargs ):
+    "Canonical JSON for value (sorted keys, classes by name)"
+    return json.dumps( value, sort_keys=True, default=encodeValue, **kwargs )
+
+def loadJSON( text ):
+    "Decode JSON written by dumpJSON()"
+    return decodeValue( json.loads( text ) )
+
+def encodeColumns( meta, names, arrays ):
+    """Encode topology columns as a string: length-prefixed meta JSON
+       and newline-separated names, then length-prefixed int arrays
+       (little-endian)"""
+    parts = []
+    for blob in dumpJSON( meta ), '\n'.join( names ):
+        parts += [ struct.pack( '<I', len( blob ) ), blob ]
+    for column in arrays:
+        if sys.byteorder == 'big':
+            column = array( 'i', column )
+            column.byteswap()
+        parts += [ struct.pack( '<I', len( column ) ), column.tostring() ]
+    return ''.join( parts )
+
+def decodeColumns( data ):
+    "Decode encodeColumns() output: returns meta, names, arrays"
+    offset = 0
+    blobs = []
+    for _ in range( 2 ):
+        size, = struct.unpack_from( '<I', data, offset )
+        offset += 4
+        blobs.append( data[ offset: offset + size ] )
+        offset += size
+    meta = loadJSON( blobs[ 0 ] )
+    names = blobs[ 1 ].split( '\n' ) if blobs[ 1 ] else []
+    arrays = []
+    while offset < len( data ):
+        count, = struct.unpack_from( '<I', data, offset )
+        offset += 4
+        column = array( 'i' )
+        column.fromstring( data[ offset: offset + count * column.itemsize ] )
+        offset += count * column.itemsize
+        if sys.byteorder == 'big':
+            column.byteswap()
+        arrays.append( column )
+    return meta, names, arrays
+
+
 class Topo( object ):
     "Data center network representation for structured multi-trees."
 
@@ -106,12 +541,23 @@ def __init__( self, *args, **params ):
            hinfo: default host options
            sopts: default switch options
            lopts: default link options
+           graph: graph class (default MultiGraph; CompactMultiGraph
+                  uses far less memory for very large topologies)
            calls build()"""
-        self.g = MultiGraph()
+        self.g = params.pop( 'graph', MultiGraph )()
         self.hopts = params.pop( 'hopts', {} )
         self.sopts = params.pop( 'sopts', {} )
         self.lopts = params.pop( 'lopts', {} )
         self.ports = {}  # ports[src][dst][sport] is port on dst that connects to src
+        if isinstance( self.g, CompactMultiGraph ):
+            # Port numbers are kept in the graph's edge arrays
+            self.ports = None
+        # Indexes, maintained as the topology changes
+        self.sortKeys = {}  # node name -> natural sort key
+        self.nodeLists = {}  # sort -> ( nodes, switches, hosts )
+        self.linkLists = {}  # ( sort, withKeys, withInfo ) -> links
+        self.portMap = None  # ( src, dst ) -> [ ( sport, dport ) ]
+        self.fingerprintCache = None  # as stored by save(), if unchanged
         self.build( *args, **params )
 
     def build( self, *args, **params ):
@@ -124,6 +570,8 @@ def addNode( self, name, **opts ):
            opts: node options
            returns: node name"""
         self.g.add_node( name, **opts )
+        self.nodeLists.clear()
+        self.fingerprintCache = None
         return name
 
     def addHost( self, name, **opts ):
@@ -154,17 +602,84 @@ def addLink( self, node1, node2, port1=None, port2=None,
         if not opts and self.lopts:
             opts = self.lopts
         port1, port2 = self.addPort( node1, node2, port1, port2 )
-        opts = dict( opts )
-        opts.update( node1=node1, node2=node2, port1=port1, port2=port2 )
-        self.g.add_edge(node1, node2, key, opts )
+        self.g.add_link( node1, node2, port1, port2, key, opts )
+        self.linkLists.clear()
+        self.fingerprintCache = None
+        if self.portMap is not None:
+            self._mapPorts( node1, node2, port1, port2 )
         return key
 
+    # Bulk versions of the above, for generated topologies
+
+    def addHosts( self, names, **opts ):
+        """Add many hosts at once.
+           names: host names
+           opts: host options, shared by all hosts
+           returns: list of host names"""
+        if not opts and self.hopts:
+            opts = self.hopts
+        names = list( names )
+        for name in names:
+            self.g.add_node( name, dict( opts ) )
+        self.nodeLists.clear()
+        self.fingerprintCache = None
+        return names
+
+    def addSwitches( self, names, **opts ):
+        """Add many switches at once.
+           names: switch names
+           opts: switch options, shared by all switches
+           returns: list of switch names"""
+        if not opts and self.sopts:
+            opts = self.sopts
+        names = list( names )
+        for name in names:
+            self.g.add_node( name, dict( opts, isSwitch=True ) )
+        self.nodeLists.clear()
+        self.fingerprintCache = None
+        return names
+
+    def addLinks( self, links, **opts ):
+        """Add many links at once; ports are numbered as by addLink().
+           links: sequence of ( node1, node2 ) pairs
+           opts: link options, shared by all links"""
+        if not opts and self.lopts:
+            opts = self.lopts
+        self.linkLists.clear()
+        self.fingerprintCache = None
+        self.portMap = None
+        if self.ports is None:
+            self.g.add_links( links, opts )
+            return
+        addPort, addLink = self.addPort, self.g.add_link
+        for node1, node2 in links:
+            port1, port2 = addPort( node1, node2 )
+            addLink( node1, node2, port1, port2, None, opts )
+
+    def sortKey( self, name ):
+        "Return (cached) natural sort key for node name"
+        key = self.sortKeys.get( name )
+        if key is None:
+            key = self.sortKeys[ name ] = natural( name )
+        return key
+
+    def nodeIndex( self, sort=True ):
+        """Return cached lists of nodes, switches and hosts
+           sort: sort lists alphabetically
+           returns: ( nodes, switches, hosts )"""
+        lists = self.nodeLists.get( sort )
+        if lists is None:
+            nodes = self.g.nodes()
+            if sort:
+                nodes.sort( key=self.sortKey )
+            switches = [ n for n in nodes if self.isSwitch( n ) ]
+            hosts = [ n for n in nodes if not self.isSwitch( n ) ]
+            lists = self.nodeLists[ sort ] = ( nodes, switches, hosts )
+        return lists
+
     def nodes( self, sort=True ):
         "Return nodes in graph"
-        if sort:
-            return self.sorted( self.g.nodes() )
-        else:
-            return self.g.nodes()
+        return list( self.nodeIndex( sort )[ 0 ] )
 
     def isSwitch( self, n ):
         "Returns true if node is a switch."
@@ -174,13 +689,13 @@ def switches( self, sort=True ):
         """Return switches.
            sort: sort switches alphabetically
            returns: dpids list of dpids"""
-        return [ n for n in self.nodes( sort ) if self.isSwitch( n ) ]
+        return list( self.nodeIndex( sort )[ 1 ] )
 
     def hosts( self, sort=True ):
         """Return hosts.
            sort: sort hosts alphabetically
            returns: list of hosts"""
-        return [ n for n in self.nodes( sort ) if not self.isSwitch( n ) ]
+        return list( self.nodeIndex( sort )[ 2 ] )
 
     def iterLinks( self, withKeys=False, withInfo=False ):
         """Return links (iterator)
@@ -206,12 +721,24 @@ def links( self, sort=False, withKeys=False, withInfo=False ):
            withKeys: return link keys
            withInfo: return link info
            returns: list of ( src, dst [,key, info ] )"""
-        links = list( self.iterLinks( withKeys, withInfo ) )
-        if not sorted:
-            return links
-        # Ignore info when sorting
-        tupleSize = 3 if withKeys else 2
-        return sorted( links, key=( lambda l: naturalSeq( l[ :tupleSize ] ) ) )
+        links = self.linkLists.get( ( sort, withKeys, withInfo ) )
+        if links is None:
+            links = list( self.iterLinks( withKeys, withInfo ) )
+            if sort:
+                # Ignore info when sorting
+                nodeKey = self.sortKey
+                if withKeys:
+                    def key( link ):
+                        "Sort by nodes, then by link key"
+                        return ( nodeKey( link[ 0 ] ), nodeKey( link[ 1 ] ),
+                                 natural( link[ 2 ] ) )
+                else:
+                    def key( link ):
+                        "Sort by nodes"
+                        return nodeKey( link[ 0 ] ), nodeKey( link[ 1 ] )
+                links.sort( key=key )
+            self.linkLists[ ( sort, withKeys, withInfo ) ] = links
+        return list( links )
 
     # This legacy port management mechanism is clunky and will probably
     # be removed at some point.
@@ -220,8 +747,17 @@ def addPort( self, src, dst, sport=None, dport=None ):
         """Generate port mapping for new edge.
             src: source switch name
             dst: destination switch name"""
-        # Initialize if necessary
         ports = self.ports
+        if ports is None:
+            # Compact graph: number new ports by node degree
+            if sport is None:
+                sport = self.g.degree( src ) + ( 1 if self.isSwitch( src )
+                                                 else 0 )
+            if dport is None:
+                dport = self.g.degree( dst ) + ( 1 if self.isSwitch( dst )
+                                                 else 0 )
+            return sport, dport
+        # Initialize if necessary
         ports.setdefault( src, {} )
         ports.setdefault( dst, {} )
         # New port: number of outlinks + base
@@ -244,11 +780,20 @@ def port( self, src, dst ):
                 sport = port on source switch leading to the destination switch
                 dport = port on destination switch leading to the source switch
             Note that you can also look up ports using linkInfo()"""
-        # A bit ugly and slow vs. single-link implementation ;-(
-        ports = [ ( sport, entry[ 1 ] )
-                  for sport, entry in self.ports[ src ].items()
-                  if entry[ 0 ] == dst ]
-        return ports if len( ports ) != 1 else ports[ 0 ]
+        if self.portMap is None:
+            self.portMap = {}
+            for node1, node2, info in self.iterLinks( withInfo=True ):
+                self._mapPorts( node1, node2, info[ 'port1' ],
+                                info[ 'port2' ] )
+        ports = self.portMap.get( ( src, dst ), [] )
+        return sorted( ports ) if len( ports ) != 1 else ports[ 0 ]
+
+    def _mapPorts( self, node1, node2, port1, port2 ):
+        "Helper function: add a link's ports to the port map"
+        self.portMap.setdefault( ( node1, node2 ), [] ).append(
+            ( port1, port2 ) )
+        self.portMap.setdefault( ( node2, node1 ), [] ).append(
+            ( port2, port1 ) )
 
     def _linkEntry( self, src, dst, key=None ):
         "Helper function: return link entry and key"
@@ -266,6 +811,9 @@ def setlinkInfo( self, src, dst, info, key=None ):
         "Set link metadata dict"
         entry, key = self._linkEntry( src, dst, key )
         entry[ key ] = info
+        self.linkLists.clear()
+        self.fingerprintCache = None
+        self.portMap = None
 
     def nodeInfo( self, name ):
         "Return metadata (dict) for node"
@@ -274,6 +822,8 @@ def nodeInfo( self, name ):
     def setNodeInfo( self, name, info ):
         "Set metadata (dict) for node"
         self.g.node[ name ] = info
+        self.nodeLists.clear()
+        self.fingerprintCache = None
 
     def convertTo( self, cls, data=True, keys=True ):
         """Convert to a new object of networkx.MultiGraph-like class cls
@@ -286,6 +836,232 @@ def sorted( items ):
         "Items sorted in natural (i.e. alphabetical) order"
         return sorted( items, key=natural )
 
+    # Saving and loading topologies
+
+    def columns( self ):
+        """Return the topology in columnar form: nodes and links in sorted
+           order, with node and link options interned as JSON records
+           returns: meta (dict), names (list), arrays (list of arrays)"""
+        names = self.nodes()
+        ids = dict( ( name, i ) for i, name in enumerate( names ) )
+        records, recordIds, seen = [], {}, {}
+
+        def intern( info ):
+            "Return record id for info"
+            try:
+                items = frozenset( info.iteritems() )
+                rid = seen.get( items )
+                if rid is not None:
+                    return rid
+            except TypeError:
+                # Unhashable values, e.g. lists
+                items = None
+            record = dumpJSON( info )
+            rid = recordIds.get( record )
+            if rid is None:
+                rid = recordIds[ record ] = len( records )
+                records.append( record )
+            if items is not None:
+                seen[ items ] = rid
+            return rid
+
+        nodeRec = array( 'i', [ intern( self.nodeInfo( name ) )
+                                for name in names ] )
+        src, dst, port1, port2, keys, linkRec = [
+            array( 'i' ) for _ in range( 6 ) ]
+        otherKeys = {}
+        for i, ( node1, node2, key, info ) in enumerate(
+                self.links( sort=True, withKeys=True, withInfo=True ) ):
+            info = dict( info )
+            for name in 'node1', 'node2':
+                info.pop( name, None )
+            src.append( ids[ node1 ] )
+            dst.append( ids[ node2 ] )
+            port1.append( info.pop( 'port1', -1 ) )
+            port2.append( info.pop( 'port2', -1 ) )
+            if type( key ) is int and 0 <= key < 2**31:
+                keys.append( key )
+            else:
+                keys.append( -1 )
+                otherKeys[ str( i ) ] = key
+            linkRec.append( intern( info ) )
+        meta = { 'version': TOPO_VERSION, 'graph': type( self.g ).__name__,
+                 'hopts': self.hopts, 'sopts': self.sopts,
+                 'lopts': self.lopts, 'records': records,
+                 'otherKeys': otherKeys }
+        return meta, names, [ nodeRec, src, dst, port1, port2, keys,
+                              linkRec ]
+
+    def fingerprint( self ):
+        """Return a hash of the topology (nodes, links and options),
+           e.g. for use as a cache key"""
+        if self.fingerprintCache is None:
+            meta, names, arrays = self.columns()
+            self.fingerprintCache = sha1(
+                encodeColumns( meta, names, arrays ) ).hexdigest()
+        return self.fingerprintCache
+
+    def save( self, path, binary=None ):
+        """Save topology to a file. Node info (including any placement
+           on servers) and link info are saved along with sorted node
+           order and port numbers, and a fingerprint of the topology.
+           path: file name
+           binary: use compact binary format? (default: unless path
+                   ends in .json)"""
+        if binary is None:
+            binary = not path.endswith( '.json' )
+        meta, names, arrays = self.columns()
+        body = encodeColumns( meta, names, arrays )
+        self.fingerprintCache = sha1( body ).hexdigest()
+        with open( path, 'wb' ) as f:
+            if binary:
+                f.write( TOPO_MAGIC )
+                f.write( struct.pack( '<I', len( self.fingerprintCache ) ) )
+                f.write( self.fingerprintCache )
+                f.write( zlib.compress( body ) )
+                return
+            nodeRec, src, dst, port1, port2, keys, linkRec = arrays
+            records = [ loadJSON( record ) for record in meta[ 'records' ] ]
+            links = []
+            for i in xrange( len( src ) ):
+                link = { 'node1': names[ src[ i ] ],
+                         'node2': names[ dst[ i ] ],
+                         'key': meta[ 'otherKeys' ].get( str( i ), keys[ i ] ),
+                         'info': records[ linkRec[ i ] ] }
+                if port1[ i ] >= 0:
+                    link[ 'port1' ] = port1[ i ]
+                if port2[ i ] >= 0:
+                    link[ 'port2' ] = port2[ i ]
+                links.append( link )
+            data = { 'version': TOPO_VERSION, 'graph': meta[ 'graph' ],
+                     'fingerprint': self.fingerprintCache,
+                     'hopts': self.hopts, 'sopts': self.sopts,
+                     'lopts': self.lopts,
+                     'nodes': [ { 'name': name,
+                                  'info': records[ nodeRec[ i ] ] }
+                                for i, name in enumerate( names ) ],
+                     'links': links }
+            f.write( dumpJSON( data, indent=1 ) + '\n' )
+
+    @staticmethod
+    def load( path, graph=None ):
+        """Load a topology saved by save()
+           path: file name
+           graph: graph class (default: as saved)
+           returns: Topo"""
+        with open( path, 'rb' ) as f:
+            data = f.read()
+        if data.startswith( TOPO_MAGIC ):
+            offset = len( TOPO_MAGIC )
+            size, = struct.unpack_from( '<I', data, offset )
+            offset += 4
+            fingerprint = data[ offset: offset + size ]
+            meta, names, arrays = decodeColumns(
+                zlib.decompress( data[ offset + size: ] ) )
+            nodeRec, src, dst, sports, dports, keys, linkRec = arrays
+            records = [ loadJSON( record ) for record in meta[ 'records' ] ]
+            nodes = [ ( name, records[ nodeRec[ i ] ] )
+                      for i, name in enumerate( names ) ]
+            otherKeys = meta[ 'otherKeys' ]
+            links = ( ( names[ src[ i ] ], names[ dst[ i ] ],
+                        sports[ i ] if sports[ i ] >= 0 else None,
+                        dports[ i ] if dports[ i ] >= 0 else None,
+                        otherKeys.get( str( i ), keys[ i ] ),
+                        records[ linkRec[ i ] ] )
+                      for i in xrange( len( src ) ) )
+        else:
+            meta = loadJSON( data )
+            fingerprint = meta[ 'fingerprint' ]
+            nodes = [ ( node[ 'name' ], node[ 'info' ] )
+                      for node in meta[ 'nodes' ] ]
+            links = ( ( link[ 'node1' ], link[ 'node2' ],
+                        link.get( 'port1' ), link.get( 'port2' ),
+                        link[ 'key' ], link[ 'info' ] )
+                      for link in meta[ 'links' ] )
+        if meta[ 'version' ] != TOPO_VERSION:
+            raise Exception( 'Topo.load: %s has unsupported version %s' %
+                             ( path, meta[ 'version' ] ) )
+        if graph is None:
+            graph = ( CompactMultiGraph
+                      if meta[ 'graph' ] == 'CompactMultiGraph'
+                      else MultiGraph )
+        topo = Topo( graph=graph, hopts=meta[ 'hopts' ],
+                     sopts=meta[ 'sopts' ], lopts=meta[ 'lopts' ] )
+        for name, info in nodes:
+            topo.g.add_node( name, dict( info ) )
+        for node1, node2, port1, port2, key, info in links:
+            port1, port2 = topo.addPort( node1, node2, port1, port2 )
+            topo.g.add_link( node1, node2, port1, port2, key, info )
+        # Nodes were saved in sorted order
+        names = [ name for name, _info in nodes ]
+        topo.nodeLists[ True ] = (
+            names, [ n for n in names if topo.isSwitch( n ) ],
+            [ n for n in names if not topo.isSwitch( n ) ] )
+        topo.fingerprintCache = fingerprint
+        return topo
+
+    def diff( self, other ):
+        """Compare with another topology
+           other: changed topology
+           returns: TopoDiff from self to other"""
+        return TopoDiff( self, other )
+
+
+def linkId( info ):
+    "Identify a link by its link info: ( node1, node2, port1, port2 )"
+    return info[ 'node1' ], info[ 'node2' ], info[ 'port1' ], info[ 'port2' ]
+
+
+class TopoDiff( object ):
+    """Differences between two topologies: nodes are given by name and
+       links by their link info, and links are identified by their
+       nodes and ports (see linkId()). A node whose info has changed is
+       both removed and added, as are its links."""
+
+    def __init__( self, old, new ):
+        """old: original topology
+           new: changed topology"""
+        oldNodes = set( old.nodes( sort=False ) )
+        newNodes = set( new.nodes( sort=False ) )
+        replaced = set( name for name in oldNodes & newNodes
+                        if old.nodeInfo( name ) != new.nodeInfo( name ) )
+        self.delNodes = old.sorted( ( oldNodes - newNodes ) | replaced )
+        self.addNodes = new.sorted( ( newNodes - oldNodes ) | replaced )
+        oldLinks = dict( ( linkId( info ), info ) for _src, _dst, info
+                         in old.links( withInfo=True ) )
+        newLinks = dict( ( linkId( info ), info ) for _src, _dst, info
+                         in new.links( withInfo=True ) )
+
+        def key( lid ):
+            "Sort link ids naturally by node names"
+            return natural( lid[ 0 ] ), natural( lid[ 1 ] ), lid[ 2: ]
+
+        self.delLinks, self.addLinks = [], []
+        self.changedLinks = []  # [ ( old info, new info ) ]
+        for lid in sorted( oldLinks, key=key ):
+            if ( lid not in newLinks or lid[ 0 ] in replaced or
+                 lid[ 1 ] in replaced ):
+                self.delLinks.append( oldLinks[ lid ] )
+        for lid in sorted( newLinks, key=key ):
+            info = oldLinks.get( lid )
+            if ( info is None or lid[ 0 ] in replaced or
+                 lid[ 1 ] in replaced ):
+                self.addLinks.append( newLinks[ lid ] )
+            elif info != newLinks[ lid ]:
+                self.changedLinks.append( ( info, newLinks[ lid ] ) )
+
+    def __len__( self ):
+        "Number of changes"
+        return ( len( self.delNodes ) + len( self.addNodes ) +
+                 len( self.delLinks ) + len( self.addLinks ) +
+                 len( self.changedLinks ) )
+
+    def __str__( self ):
+        return ( '-%d +%d nodes, -%d +%d ~%d links' % (
+                 len( self.delNodes ), len( self.addNodes ),
+                 len( self.delLinks ), len( self.addLinks ),
+                 len( self.changedLinks ) ) )
+
 
 class SingleSwitchTopo( Topo ):
     "Single switch connected to k hosts."
@@ -1,5 +1,7 @@
 "Library of potentially useful topologies for Mininet"
 
+from random import Random
+
 from mininet.topo import Topo
 from mininet.net import Mininet
 
@@ -65,5 +67,205 @@ def build( self, x, y ):
                 self.addLink( sw1, sw2 )
                 self.addLink( sw1, sw3 )
 
-    
 
+# Data center topologies
+#
+# These generators compute node indices arithmetically and add nodes
+# and links in bulk, so that very large instances (particularly with
+# graph=CompactMultiGraph) can be generated quickly. Switches are
+# numbered s1..sM and hosts h1..hN (so that default dpids and IP
+# addresses work), in the order given in each docstring.
+#
+# WARNING: like TorusTopo, these topologies have LOOPS and need STP
+# or a controller that can handle them.
+
+class FatTreeTopo( Topo ):
+    """k-ary fat tree: ( k / 2 )^2 core switches, then for each of k pods
+       k / 2 aggregation and k / 2 edge switches, with k / 2 hosts on
+       each edge switch ( k^3 / 4 hosts in all)."""
+
+    def build( self, k=4, **opts ):
+        "k: number of ports per switch (even)"
+        if k < 2 or k % 2:
+            raise Exception( 'FatTreeTopo: k must be even and >= 2' )
+        self.k = k
+        half = k // 2
+        cores = half * half
+
+        # Switch indices: core c, then aggregation and edge in each pod
+        def agg( pod, i ):
+            "Index of aggregation switch i of pod"
+            return cores + pod * k + i
+
+        def edge( pod, i ):
+            "Index of edge switch i of pod"
+            return cores + pod * k + half + i
+
+        switches = self.addSwitches(
+            's%d' % i for i in xrange( 1, cores + k * k + 1 ) )
+        hosts = self.addHosts( 'h%d' % i for i in xrange( 1, k * cores + 1 ) )
+        self.addLinks( [ ( hosts[ h ], switches[ edge( h // cores,
+                                                       h % cores // half ) ] )
+                         for h in xrange( len( hosts ) ) ], **opts )
+        self.addLinks( [ ( switches[ edge( pod, e ) ],
+                           switches[ agg( pod, a ) ] )
+                         for pod in xrange( k ) for e in xrange( half )
+                         for a in xrange( half ) ], **opts )
+        # Aggregation switch a in each pod connects to core switches
+        # a * k/2 .. ( a + 1 ) * k/2 - 1
+        self.addLinks( [ ( switches[ agg( pod, a ) ],
+                           switches[ a * half + c ] )
+                         for pod in xrange( k ) for a in xrange( half )
+                         for c in xrange( half ) ], **opts )
+
+
+class LeafSpineTopo( Topo ):
+    """Two-tier leaf-spine (folded Clos): spine switches, then leaf
+       switches, each connected to every spine, with hosts on each leaf."""
+
+    def build( self, leaves=4, spines=2, hosts=2, **opts ):
+        """leaves: number of leaf switches
+           spines: number of spine switches
+           hosts: hosts per leaf"""
+        self.leaves, self.spines = leaves, spines
+        switches = self.addSwitches(
+            's%d' % i for i in xrange( 1, spines + leaves + 1 ) )
+        spineSwitches, leafSwitches = switches[ :spines ], switches[ spines: ]
+        hostNames = self.addHosts(
+            'h%d' % i for i in xrange( 1, leaves * hosts + 1 ) )
+        self.addLinks( [ ( hostNames[ h ], leafSwitches[ h // hosts ] )
+                         for h in xrange( len( hostNames ) ) ], **opts )
+        self.addLinks( [ ( leaf, spine ) for leaf in leafSwitches
+                         for spine in spineSwitches ], **opts )
+
+
+class DragonflyTopo( Topo ):
+    """Dragonfly: groups of a fully connected routers, each router with
+       h global links and p hosts. Groups are connected in a balanced
+       pattern with ( at most ) one global link between each pair of
+       groups; the maximum number of groups is a * h + 1.
+       Switches are numbered by group, then router."""
+
+    def build( self, a=4, h=2, p=2, groups=None, **opts ):
+        """a: routers per group
+           h: global links per router
+           p: hosts per router
+           groups: number of groups (default a * h + 1)"""
+        g = a * h + 1 if groups is None else groups
+        if not 1 <= g <= a * h + 1:
+            raise Exception( 'DragonflyTopo: groups must be between 1 and '
+                             'a * h + 1' )
+        self.a, self.h, self.p, self.groups = a, h, p, g
+        switches = self.addSwitches(
+            's%d' % i for i in xrange( 1, g * a + 1 ) )
+        hosts = self.addHosts( 'h%d' % i for i in xrange( 1, g * a * p + 1 ) )
+        self.addLinks( [ ( hosts[ i ], switches[ i // p ] )
+                         for i in xrange( len( hosts ) ) ], **opts )
+        self.addLinks( [ ( switches[ grp * a + r1 ],
+                           switches[ grp * a + r2 ] )
+                         for grp in xrange( g ) for r1 in xrange( a )
+                         for r2 in xrange( r1 + 1, a ) ], **opts )
+
+        def router( grp, other ):
+            "Router of group grp with the global link to group other"
+            # Global port d = ( other - grp - 1 ) mod g belongs to router d / h
+            return ( other - grp - 1 ) % g // h
+
+        self.addLinks( [ ( switches[ g1 * a + router( g1, g2 ) ],
+                           switches[ g2 * a + router( g2, g1 ) ] )
+                         for g1 in xrange( g )
+                         for g2 in xrange( g1 + 1, g ) ], **opts )
+
+
+class JellyfishTopo( Topo ):
+    """Jellyfish: a random regular graph of switches, each with
+       degree links to other switches and some hosts."""
+
+    def build( self, switches=20, degree=4, hosts=1, seed=None, **opts ):
+        """switches: number of switches
+           degree: switch-to-switch links per switch
+           hosts: hosts per switch
+           seed: random seed (for repeatable topologies)"""
+        if degree >= switches:
+            raise Exception( 'JellyfishTopo: degree must be less than the '
+                             'number of switches' )
+        self.degree, self.seed = degree, seed
+        names = self.addSwitches(
+            's%d' % i for i in xrange( 1, switches + 1 ) )
+        hostNames = self.addHosts(
+            'h%d' % i for i in xrange( 1, switches * hosts + 1 ) )
+        self.addLinks( [ ( hostNames[ i ], names[ i // hosts ] )
+                         for i in xrange( len( hostNames ) ) ], **opts )
+        pairs = self.randomRegular( switches, degree, Random( seed ) )
+        self.addLinks( [ ( names[ u ], names[ v ] ) for u, v in pairs ],
+                       **opts )
+
+    @staticmethod
+    def randomRegular( n, d, random ):
+        """Random d-regular simple graph on n nodes: randomly pair
+           link endpoints, then repair self-loops and duplicate links
+           by swapping endpoints with randomly chosen good links.
+           (If n * d is odd, one port is left unused.)
+           returns: list of ( u, v ) pairs"""
+        stubs = [ u for u in xrange( n ) for _ in xrange( d ) ]
+        random.shuffle( stubs )
+        edges, bad, seen = [], [], set()
+        for i in xrange( 0, len( stubs ) - 1, 2 ):
+            u, v = stubs[ i ], stubs[ i + 1 ]
+            pair = ( min( u, v ), max( u, v ) )
+            if u == v or pair in seen:
+                bad.append( ( u, v ) )
+            else:
+                seen.add( pair )
+                edges.append( pair )
+        tries = 0
+        while bad and edges:
+            tries += 1
+            if tries > 100 * ( len( edges ) + 1 ):
+                raise Exception( 'JellyfishTopo: unable to build a '
+                                 'random regular graph' )
+            u, v = bad[ -1 ]
+            i = random.randrange( len( edges ) )
+            x, y = edges[ i ]
+            if random.random() < .5:
+                x, y = y, x
+            # Replace u-v and x-y with u-x and v-y
+            new1 = ( min( u, x ), max( u, x ) )
+            new2 = ( min( v, y ), max( v, y ) )
+            if ( u == x or v == y or new1 == new2 or
+                 new1 in seen or new2 in seen ):
+                continue
+            bad.pop()
+            seen.discard( edges[ i ] )
+            seen.add( new1 )
+            seen.add( new2 )
+            edges[ i ] = new1
+            edges.append( new2 )
+        return edges
+
+
+class BCubeTopo( Topo ):
+    """BCube(n, k): n^(k+1) servers, each with k + 1 ports, and k + 1
+       levels of n^k n-port switches. Since Mininet hosts don't forward,
+       each server is modeled as a switch with one host attached.
+       Server switches are numbered first, then level 0..k switches."""
+
+    def build( self, n=4, k=1, **opts ):
+        """n: ports per switch
+           k: highest level (k + 1 levels)"""
+        self.n, self.k = n, k
+        servers = n ** ( k + 1 )
+        perLevel = n ** k
+        count = servers + ( k + 1 ) * perLevel
+        switches = self.addSwitches(
+            's%d' % i for i in xrange( 1, count + 1 ) )
+        hosts = self.addHosts( 'h%d' % i for i in xrange( 1, servers + 1 ) )
+        self.addLinks( [ ( hosts[ s ], switches[ s ] )
+                         for s in xrange( servers ) ], **opts )
+        # The level l switch for server s is s with base-n digit l removed
+        self.addLinks( [ ( switches[ s ],
+                           switches[ servers + l * perLevel +
+                                     s // n ** ( l + 1 ) * n ** l +
+                                     s % n ** l ] )
+                         for l in xrange( k + 1 )
+                         for s in xrange( servers ) ], **opts )
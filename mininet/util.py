@@ -1,15 +1,19 @@
 "Utility functions for Mininet."
 
 from mininet.log import output, info, error, warn, debug
+from mininet.instrument import record, SPAWN, ROOT
+from mininet.backend import Backend
 
-from time import sleep
+from time import sleep, time
 from resource import getrlimit, setrlimit, RLIMIT_NPROC, RLIMIT_NOFILE
-from select import poll, POLLIN, POLLHUP
+from select import poll, POLLIN, POLLOUT, POLLHUP
 from subprocess import call, check_call, Popen, PIPE, STDOUT
 import re
-from fcntl import fcntl, F_GETFL, F_SETFL
+from fcntl import fcntl, F_GETFL, F_SETFL, F_GETFD, F_SETFD, FD_CLOEXEC
 from os import O_NONBLOCK
+from tempfile import mkstemp
 import os
+import ctypes
 from functools import partial
 
 # Command execution support
@@ -62,6 +66,8 @@ def errRun( *cmd, **kwargs ):
        stderr: STDOUT to merge stderr with stdout
        shell: run command using shell
        echo: monitor output to console"""
+    if Backend.active is not None:
+        return Backend.active.errRun( cmd[ 0 ] if len( cmd ) == 1 else cmd )
     # By default we separate stderr, don't run in a shell, and don't echo
     stderr = kwargs.get( 'stderr', PIPE )
     shell = kwargs.get( 'shell', False )
@@ -77,34 +83,34 @@ def errRun( *cmd, **kwargs ):
         cmd = [ str( arg ) for arg in cmd ]
     elif isinstance( cmd, list ) and shell:
         cmd = " ".join( arg for arg in cmd )
+    start = time()
     popen = Popen( cmd, stdout=PIPE, stderr=stderr, shell=shell )
     # We use poll() because select() doesn't work with large fd numbers,
     # and thus communicate() doesn't work either
-    out, err = '', ''
+    outfd = popen.stdout.fileno()
+    chunks = { outfd: [] }
     poller = poll()
-    poller.register( popen.stdout, POLLIN )
-    fdtofile = { popen.stdout.fileno(): popen.stdout }
-    outDone, errDone = False, True
+    poller.register( outfd, POLLIN )
     if popen.stderr:
-        fdtofile[ popen.stderr.fileno() ] = popen.stderr
+        chunks[ popen.stderr.fileno() ] = []
         poller.register( popen.stderr, POLLIN )
-        errDone = False
-    while not outDone or not errDone:
-        readable = poller.poll()
-        for fd, _event in readable:
-            f = fdtofile[ fd ]
-            data = f.read( 1024 )
+    open_ = len( chunks )
+    while open_:
+        for fd, _event in poller.poll():
+            # Read directly from the fd in large chunks; file.read()
+            # would block until it filled its buffer
+            data = os.read( fd, 65536 )
             if echo:
                 output( data )
-            if f == popen.stdout:
-                out += data
-                if data == '':
-                    outDone = True
-            elif f == popen.stderr:
-                err += data
-                if data == '':
-                    errDone = True
+            if data:
+                chunks[ fd ].append( data )
+            else:
+                poller.unregister( fd )
+                open_ -= 1
     returncode = popen.wait()
+    out = ''.join( chunks[ outfd ] )
+    err = ''.join( chunks[ popen.stderr.fileno() ] ) if popen.stderr else ''
+    record( SPAWN, cmd, start )
     return out, err, returncode
 
 def errFail( *cmd, **kwargs ):
@@ -120,12 +126,125 @@ def quietRun( cmd, **kwargs ):
     return errRun( cmd, stderr=STDOUT, **kwargs )[ 0 ]
 
 # pylint: enable-msg=E1103
+
+# Persistent root shell
+#
+# errRun() and quietRun() fork the (large) Python process for every
+# command. For the many small root namespace commands that we run
+# while building and tearing down a network (ip link, ovs-vsctl,
+# cgroup manipulation...) it is much cheaper to feed them to a
+# long-running bash process, which can also run a whole list of
+# commands in a single round trip. Each command runs in a subshell
+# with stdin from /dev/null and stderr merged into stdout, and is
+# followed by a marker line carrying its exit code.
+
+class RootShell( object ):
+    "A persistent shell for running commands in the root namespace"
+
+    marker = chr( 1 ) + 'rc='
+    markerRegex = re.compile( chr( 1 ) + r'rc=(\d+)\n' )
+
+    def __init__( self ):
+        self.popen = None
+
+    def start( self ):
+        "Start (or restart) our shell process"
+        self.popen = Popen( [ 'bash', '--norc', '--noprofile', '-s' ],
+                            stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+                            close_fds=True )
+        # Keep our pipes out of other children, and don't block
+        # writing commands while output is waiting to be read
+        for f in self.popen.stdin, self.popen.stdout:
+            fd = f.fileno()
+            fcntl( fd, F_SETFD, fcntl( fd, F_GETFD ) | FD_CLOEXEC )
+        infd = self.popen.stdin.fileno()
+        fcntl( infd, F_SETFL, fcntl( infd, F_GETFL ) | O_NONBLOCK )
+
+    def running( self ):
+        "Is our shell process running?"
+        return self.popen is not None and self.popen.poll() is None
+
+    def cmds( self, cmds ):
+        """Run a list of shell commands in a single round trip.
+           cmds: list of command strings
+           returns: list of ( output, exitcode ) in the same order"""
+        if not cmds:
+            return []
+        start = time()
+        if not self.running():
+            self.start()
+            record( SPAWN, 'bash', start )
+        script = ''.join( '( ' + cmd + '\n) </dev/null 2>&1; '
+                          'printf "\\001rc=%d\\n" $?\n'
+                          for cmd in cmds )
+        infd = self.popen.stdin.fileno()
+        outfd = self.popen.stdout.fileno()
+        poller = poll()
+        poller.register( infd, POLLOUT )
+        poller.register( outfd, POLLIN )
+        chunks, markers, sent = [], 0, 0
+        while True:
+            for fd, _event in poller.poll():
+                if fd == infd:
+                    sent += os.write( infd, script[ sent: sent + 65536 ] )
+                    if sent >= len( script ):
+                        poller.unregister( infd )
+                    continue
+                data = os.read( outfd, 65536 )
+                if not data:
+                    self.popen = None
+                    raise Exception( 'RootShell: shell exited while '
+                                     'running %s' % cmds )
+                chunks.append( data )
+                markers += data.count( chr( 1 ) )
+            if markers >= len( cmds ) and chunks[ -1 ].endswith( '\n' ):
+                out = ''.join( chunks )
+                if out.count( self.marker ) == len( cmds ):
+                    break
+        record( ROOT, cmds[ 0 ] if len( cmds ) == 1 else
+                '%s (+%d more)' % ( cmds[ 0 ], len( cmds ) - 1 ), start )
+        fields = self.markerRegex.split( out )
+        return [ ( fields[ i ], int( fields[ i + 1 ] ) )
+                 for i in range( 0, len( fields ) - 1, 2 ) ]
+
+    def stop( self ):
+        "Shut down our shell process"
+        if self.running():
+            self.popen.stdin.close()
+            self.popen.wait()
+        self.popen = None
+
+def rootShell():
+    "Return the shared RootShell"
+    if rootShell.shell is None:
+        rootShell.shell = RootShell()
+    return rootShell.shell
+
+
+rootShell.shell = None
+
+def rootCmds( cmds ):
+    """Run a list of shell commands in the root namespace
+       in a single round trip to the shared RootShell.
+       returns: list of ( output, exitcode )"""
+    if Backend.active is not None:
+        return Backend.active.rootCmds( cmds )
+    return rootShell().cmds( cmds )
+
+def rootCmd( cmd ):
+    """Run a shell command in the root namespace using the shared
+       RootShell, and return its merged stdout and stderr"""
+    return rootCmds( [ cmd ] )[ 0 ][ 0 ]
+
 # pylint: disable-msg=E1101
 
 def isShellBuiltin( cmd ):
     "Return True if cmd is a bash builtin."
     if isShellBuiltin.builtIns is None:
-        isShellBuiltin.builtIns = quietRun( 'bash -c enable' )
+        # 'enable' prints 'enable <builtin>' for each builtin
+        isShellBuiltin.builtIns = frozenset(
+            line.split()[ -1 ] for line in
+            rootCmd( 'enable' ).splitlines() if line.strip() )
     space = cmd.find( ' ' )
     if space > 0:
         cmd = cmd[ :space]
@@ -148,22 +267,25 @@ def isShellBuiltin( cmd ):
 # live in the root namespace and thus do not have to be
 # explicitly moved.
 
-def makeIntfPair( intf1, intf2, addr1=None, addr2=None, run=quietRun ):
+def makeIntfPair( intf1, intf2, addr1=None, addr2=None, run=None ):
     """Make a veth pair connecting intf1 and intf2.
        intf1: string, interface
        intf2: string, interface
-       node: node to run on or None (default)
+       run: function to run commands (default: use root shell)
        returns: ip link add result"""
+    # Create new pair (with kernel-chosen MACs for addresses of None)
+    cmd = ( 'ip link add name ' + intf1 +
+            ( ' address ' + addr1 if addr1 else '' ) +
+            ' type veth peer name ' + intf2 +
+            ( ' address ' + addr2 if addr2 else '' ) )
     # Delete any old interfaces with the same names
-    run( 'ip link del ' + intf1 )
-    run( 'ip link del ' + intf2 )
-    # Create new pair
-    if addr1 is None and addr2 is None:
-        cmd = 'ip link add name ' + intf1 + ' type veth peer name ' + intf2
+    dels = [ 'ip link del ' + intf1, 'ip link del ' + intf2 ]
+    if run is None:
+        cmdOutput = rootCmds( dels + [ cmd ] )[ -1 ][ 0 ]
     else:
-        cmd = ( 'ip link add name ' + intf1 + ' address ' + addr1 +
-                ' type veth peer name ' + intf2 + ' address ' + addr2 )
-    cmdOutput = run( cmd )
+        for delcmd in dels:
+            run( delcmd )
+        cmdOutput = run( cmd )
     if cmdOutput == '':
         return True
     else:
@@ -191,7 +313,7 @@ def moveIntfNoRetry( intf, dstNode, printError=False ):
         printError: if true, print error"""
     intf = str( intf )
     cmd = 'ip link set %s netns %s' % ( intf, dstNode.pid )
-    cmdOutput = quietRun( cmd )
+    cmdOutput = rootCmd( cmd )
     # If ip link set does not produce any output, then we can assume
     # that the link has been moved successfully.
     if cmdOutput:
@@ -211,6 +333,95 @@ def moveIntf( intf, dstNode, srcNode=None, printError=True,
     retry( retries, delaySecs, moveIntfNoRetry, intf, dstNode,
            printError=printError )
 
+
+# Named network namespace support
+#
+# Node namespaces are normally anonymous: they exist only as
+# /proc/<pid>/ns/net of the node's shell. iproute2 (ip -n, ip netns
+# exec) and netns-aware netlink code look for namespaces by name in
+# NETNS_DIR, so we can optionally bind-mount each node's namespace
+# there. We also drop a marker in NETNS_MARKERS so that cleanup can
+# tell our namespaces apart from anyone else's.
+NETNS_DIR = '/var/run/netns'
+NETNS_MARKERS = '/var/run/mininet/netns'
+
+def attachNetns( nodes ):
+    """Bind-mount the network namespaces of nodes under NETNS_DIR.
+       nodes: list of ( name, pid ) pairs
+       returns: { name: error output } of namespaces that failed"""
+    if not nodes:
+        return {}
+    cmds = [ 'mkdir -p %s %s' % ( NETNS_DIR, NETNS_MARKERS ) ]
+    for name, pid in nodes:
+        path = '%s/%s' % ( NETNS_DIR, name )
+        # Mark the namespace as ours only once it is mounted
+        cmds.append( 'touch %s && mount --bind /proc/%d/ns/net %s && '
+                     'touch %s/%s' % ( path, pid, path, NETNS_MARKERS, name ) )
+    results = rootCmds( cmds )
+    failed = {}
+    for ( name, _pid ), ( out, code ) in zip( nodes, results[ 1: ] ):
+        if code or results[ 0 ][ 1 ]:
+            failed[ name ] = results[ 0 ][ 0 ] + out
+    return failed
+
+def detachNetns( names ):
+    """Unmount and remove named network namespaces created by
+       attachNetns().
+       names: list of namespace (node) names"""
+    if not names:
+        return ''
+    cmds = [ 'umount %s/%s 2>/dev/null; rm -f %s/%s %s/%s' %
+             ( NETNS_DIR, name, NETNS_DIR, name, NETNS_MARKERS, name )
+             for name in names ]
+    return ''.join( out for out, _code in rootCmds( cmds ) )
+
+def namedNetns():
+    "Return names of namespaces created by attachNetns()"
+    try:
+        return sorted( os.listdir( NETNS_MARKERS ), key=natural )
+    except OSError:
+        return []
+
+def ipBatch( cmds, netns=None ):
+    """Run a list of ip commands with a single ip -batch invocation.
+       cmds: list of ip command strings, without the leading 'ip'
+       netns: named namespace to run in (None for root namespace)
+       returns: ip output (empty on success)"""
+    if not cmds:
+        return ''
+    fd, path = mkstemp( prefix='mn-ip-', suffix='.batch' )
+    try:
+        os.write( fd, '\n'.join( cmds ) + '\n' )
+        os.close( fd )
+        nsopt = '-n %s ' % netns if netns else ''
+        return rootCmd( 'ip %s-force -batch %s' % ( nsopt, path ) )
+    finally:
+        os.unlink( path )
+
+def rootIntfNames():
+    "Return the set of interface names in the root namespace"
+    names = set()
+    # Lines look like '12: s1-eth1@if11: <BROADCAST,MULTICAST,UP> ...'
+    for line in rootCmd( 'ip -o link show' ).splitlines():
+        fields = line.split( ': ', 2 )
+        if len( fields ) > 2:
+            names.add( fields[ 1 ].split( '@' )[ 0 ] )
+    return names
+
+def deleteRootIntfs( names ):
+    """Delete root namespace interfaces with a single ip batch,
+       skipping any that are already gone (e.g. veths destroyed
+       along with their peer's namespace).
+       names: interface names
+       returns: list of names that were deleted"""
+    if not names:
+        return []
+    present = rootIntfNames()
+    names = [ name for name in names if name in present ]
+    if names:
+        ipBatch( [ 'link del dev ' + name for name in names ] )
+    return names
+
 # Support for dumping network
 
 def dumpNodeConnections( nodes ):
@@ -464,6 +675,35 @@ def numCores():
         return 0
     return numCores.ncores
 
+class _Timespec( ctypes.Structure ):
+    "struct timespec, for clock_gettime()"
+    _fields_ = [ ( 'tv_sec', ctypes.c_long ), ( 'tv_nsec', ctypes.c_long ) ]
+
+
+CLOCK_MONOTONIC = 1
+
+def monotonic():
+    """Return seconds from a monotonic clock (which, unlike time(),
+       never jumps), falling back to time() if it is unavailable"""
+    if not hasattr( monotonic, 'clock' ):
+        try:
+            monotonic.clock = ctypes.CDLL( 'librt.so.1' ).clock_gettime
+        except ( OSError, AttributeError ):
+            monotonic.clock = None
+    if monotonic.clock is None:
+        return time()
+    ts = _Timespec()
+    monotonic.clock( CLOCK_MONOTONIC, ctypes.byref( ts ) )
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+def waitUntil( deadline ):
+    "Sleep until monotonic() reaches deadline, spinning at the end"
+    while True:
+        delay = deadline - monotonic()
+        if delay <= 0:
+            return
+        sleep( max( delay - .001, 0 ) )
+
 def irange(start, end):
     """Inclusive range from start to end (vs. Python insanity.)
        irange(1,5) -> 1, 2, 3, 4, 5"""
@@ -479,6 +719,8 @@ def customized( *args, **kwargs):
         kwargs.update( params )
         return cls( *args, **kwargs )
     customized.__name__ = 'custom(%s,%s)' % ( cls, params )
+    # Let callers (e.g. mininet.plan) see what we construct
+    customized.cls, customized.params = cls, params
     return customized
 
 def splitArgs( argstr ):
@@ -521,12 +763,18 @@ def customized( name, *args, **params ):
         return constructor( name, *newargs, **params )
 
     customized.__name__ = 'customConstructor(%s)' % argStr
+    if not newargs:
+        customized.cls, customized.params = constructor, kwargs
     return customized
 
 def buildTopo( topos, topoStr ):
     """Create topology from string with format (object, arg1, arg2,...).
     input topos is a dict of topo names to constructors, possibly w/args.
+    file:path loads a topology saved with Topo.save().
     """
+    if topoStr.startswith( 'file:' ):
+        from mininet.topo import Topo
+        return Topo.load( topoStr[ len( 'file:' ): ] )
     topo, args, kwargs = splitArgs( topoStr )
     if topo not in topos:
         raise Exception( 'Invalid topo name %s' % topo )
@@ -542,6 +790,28 @@ def ensureRoot():
         exit( 1 )
     return
 
+def listeningPorts( pid=None, proto='tcp' ):
+    """Return ports with a listening (TCP) or bound (UDP) socket in the
+       network namespace of pid (None: ours), from /proc/<pid>/net
+       proto: tcp or udp"""
+    ports = set()
+    for suffix in '', '6':
+        path = '/proc/%s/net/%s%s' % ( pid or 'self', proto, suffix )
+        if Backend.active is not None:
+            text = Backend.active.readFile( path )
+        else:
+            try:
+                with open( path ) as f:
+                    text = f.read()
+            except IOError:
+                continue
+        for line in text.split( '\n' )[ 1: ]:
+            fields = line.split()
+            # local_address is ADDR:PORT in hex; state 0A is TCP_LISTEN
+            if len( fields ) > 3 and ( proto == 'udp' or fields[ 3 ] == '0A' ):
+                ports.add( int( fields[ 1 ].split( ':' )[ 1 ], 16 ) )
+    return ports
+
 def waitListening( client=None, server='127.0.0.1', port=80, timeout=None ):
     """Wait until server is listening on port.
        returns True if server is listening"""
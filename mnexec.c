@@ -68,7 +68,7 @@ void cgroup(char *gname)
 {
     static char path[PATH_MAX];
     static char *groups[] = {
-        "cpu", "cpuacct", "cpuset", NULL
+        "cpu", "cpuacct", "cpuset", "memory", "pids", NULL
     };
     char **gptr;
     pid_t pid = getpid();
@@ -85,6 +85,17 @@ void cgroup(char *gname)
             fclose(f);
         }
     }
+    if (!count) {
+        /* cgroup v2: single unified hierarchy */
+        FILE *f;
+        snprintf(path, PATH_MAX, "/sys/fs/cgroup/%s/cgroup.procs", gname);
+        f = fopen(path, "w");
+        if (f) {
+            count++;
+            fprintf(f, "%d\n", pid);
+            fclose(f);
+        }
+    }
     if (!count) {
         fprintf(stderr, "cgroup: could not add to cgroup %s\n",
             gname);